@@ -0,0 +1,101 @@
+import os
+
+import boto3
+import pytest
+from botocore.awsrequest import AWSResponse
+
+from sns_extended_client import create_extended_sns_client
+
+KB = 1024
+MB = 1024 * KB
+DEFAULT_MAX_PAYLOAD_SIZE = 16 * MB
+TEST_BUCKET_NAME = "benchmark-bucket"
+TEST_TOPIC_ARN = "arn:aws:sns:us-east-1:123456789012:benchmark-topic"
+
+# Responses returned, without any network call, for the operations of the publish path
+_RESPONSES = {
+    "Publish": (
+        {},
+        b"<PublishResponse><PublishResult><MessageId>benchmark</MessageId>"
+        b"</PublishResult></PublishResponse>",
+    ),
+    "PublishBatch": (
+        {},
+        b"<PublishBatchResponse><PublishBatchResult><Successful/><Failed/>"
+        b"</PublishBatchResult></PublishBatchResponse>",
+    ),
+    "PutObject": ({"ETag": '"benchmark"'}, b""),
+    "HeadObject": ({"ETag": '"benchmark"', "Content-Length": "0"}, b""),
+    "CreateMultipartUpload": (
+        {},
+        b"<InitiateMultipartUploadResult><UploadId>benchmark</UploadId>"
+        b"</InitiateMultipartUploadResult>",
+    ),
+    "UploadPart": ({"ETag": '"benchmark"'}, b""),
+    "CompleteMultipartUpload": (
+        {},
+        b"<CompleteMultipartUploadResult><ETag>benchmark</ETag></CompleteMultipartUploadResult>",
+    ),
+}
+
+
+class _StubbedResponse:
+    def __init__(self, body):
+        self._body = body
+
+    def stream(self, **kwargs):
+        yield self._body
+
+
+def _send_stubbed_response(request, **kwargs):
+    """
+    Replaces the HTTP round trip of a request with a canned response, after draining its
+    body so that streamed payloads are read as they would be by the network layer.
+    """
+    body = request.body
+    if hasattr(body, "read"):
+        for _ in iter(lambda: body.read(MB), b""):
+            pass
+
+    # event names are before-send.<service>.<operation>
+    headers, content = _RESPONSES[kwargs["event_name"].rsplit(".", 1)[-1]]
+    return AWSResponse(request.url, 200, headers, _StubbedResponse(content))
+
+
+def stub_client(client):
+    """Registers the canned responses on a boto3 client, which then works offline"""
+    client.meta.events.register("before-send", _send_stubbed_response)
+    return client
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--max-payload-size",
+        type=int,
+        default=int(os.environ.get("BENCHMARK_MAX_PAYLOAD_SIZE", DEFAULT_MAX_PAYLOAD_SIZE)),
+        help="Largest payload size, in bytes, benchmarked by the publish benchmarks",
+    )
+
+
+@pytest.fixture()
+def max_payload_size(request):
+    return request.config.getoption("--max-payload-size")
+
+
+@pytest.fixture()
+def session():
+    return boto3.session.Session(
+        aws_access_key_id="benchmark",
+        aws_secret_access_key="benchmark",
+        region_name="us-east-1",
+    )
+
+
+@pytest.fixture()
+def sns_extended_client(session):
+    return create_extended_sns_client(
+        session,
+        sns_client=stub_client(session.client("sns")),
+        s3_client=stub_client(session.client("s3")),
+        large_payload_support=TEST_BUCKET_NAME,
+    )
@@ -0,0 +1,120 @@
+import tracemalloc
+
+import pytest
+from boto3.s3.transfer import TransferConfig
+
+from sns_extended_client.session import MAX_ALLOWED_ATTRIBUTES
+
+from .conftest import KB, MB, TEST_TOPIC_ARN
+
+PAYLOAD_SIZES = [
+    1 * KB,
+    64 * KB,
+    256 * KB + 1,
+    1 * MB,
+    16 * MB,
+    100 * MB,
+    500 * MB,
+]
+PUBLISH_MODES = ["default", "always_through_s3", "multipart"]
+MULTIPART_TRANSFER_CONFIG = TransferConfig(multipart_threshold=8 * MB, multipart_chunksize=8 * MB)
+MANY_MESSAGE_ATTRIBUTES = {
+    f"attribute-{i}": {"DataType": "String", "StringValue": "x" * 64}
+    for i in range(MAX_ALLOWED_ATTRIBUTES)
+}
+
+
+def _format_size(size):
+    return f"{size // MB}MB" if size >= MB else f"{size // KB}KB" if size >= KB else f"{size}B"
+
+
+def _configure(sns_extended_client, mode):
+    sns_extended_client.always_through_s3 = mode == "always_through_s3"
+    if mode == "multipart":
+        sns_extended_client.s3_transfer_config = MULTIPART_TRANSFER_CONFIG
+
+
+def _get_peak_memory(func, **kwargs):
+    """Returns the peak memory allocated by one call of func, in bytes"""
+    tracemalloc.start()
+    try:
+        func(**kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _run(benchmark, func, payload_size, **kwargs):
+    """
+    Benchmarks func and records the throughput and the peak memory of one call in the
+    extra info of the benchmark. Large payloads run a few rounds of a single call.
+    """
+    if payload_size >= 16 * MB:
+        benchmark.pedantic(func, kwargs=kwargs, rounds=3, iterations=1, warmup_rounds=0)
+    else:
+        benchmark(func, **kwargs)
+
+    if benchmark.disabled:
+        # --benchmark-disable runs func once as a smoke test, without statistics
+        return
+    benchmark.extra_info["payload_size"] = payload_size
+    benchmark.extra_info["throughput_bytes_per_second"] = payload_size / benchmark.stats["mean"]
+    benchmark.extra_info["peak_memory_bytes"] = _get_peak_memory(func, **kwargs)
+
+
+@pytest.mark.parametrize("mode", PUBLISH_MODES)
+@pytest.mark.parametrize("payload_size", PAYLOAD_SIZES, ids=_format_size)
+def test_publish(benchmark, sns_extended_client, max_payload_size, payload_size, mode):
+    if payload_size > max_payload_size:
+        pytest.skip(f"payload larger than --max-payload-size={max_payload_size}")
+    _configure(sns_extended_client, mode)
+
+    benchmark.group = f"publish-{_format_size(payload_size)}"
+    _run(
+        benchmark,
+        sns_extended_client.publish,
+        payload_size,
+        TopicArn=TEST_TOPIC_ARN,
+        Message="x" * payload_size,
+    )
+
+
+@pytest.mark.parametrize("payload_size", [1 * KB, 256 * KB + 1], ids=_format_size)
+def test_publish_many_attributes(benchmark, sns_extended_client, payload_size):
+    benchmark.group = "publish-many-attributes"
+    _run(
+        benchmark,
+        sns_extended_client.publish,
+        payload_size,
+        TopicArn=TEST_TOPIC_ARN,
+        Message="x" * payload_size,
+        MessageAttributes=MANY_MESSAGE_ATTRIBUTES,
+    )
+
+
+@pytest.mark.parametrize("payload_size", [1 * KB, 256 * KB + 1], ids=_format_size)
+def test_publish_batch(benchmark, sns_extended_client, payload_size):
+    benchmark.group = "publish-batch"
+    entries = [{"Id": str(i), "Message": "x" * payload_size} for i in range(10)]
+    _run(
+        benchmark,
+        sns_extended_client.publish_batch,
+        payload_size * len(entries),
+        TopicArn=TEST_TOPIC_ARN,
+        PublishBatchRequestEntries=entries,
+    )
+
+
+@pytest.mark.parametrize("payload_size", [1 * KB, 256 * KB + 1, 1 * MB], ids=_format_size)
+def test_is_large_message(benchmark, sns_extended_client, payload_size):
+    benchmark.group = "is-large-message"
+    message_body = "x" * payload_size
+    benchmark(sns_extended_client._is_large_message, MANY_MESSAGE_ATTRIBUTES, message_body)
+
+
+@pytest.mark.parametrize("payload_size", [1 * KB, 256 * KB + 1, 1 * MB], ids=_format_size)
+def test_prepare_payload(benchmark, sns_extended_client, payload_size):
+    """_make_payload without the S3 upload"""
+    benchmark.group = "prepare-payload"
+    message_body = "x" * payload_size
+    benchmark(sns_extended_client._prepare_payload, MANY_MESSAGE_ATTRIBUTES, message_body, None)
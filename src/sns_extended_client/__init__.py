@@ -1,12 +1,26 @@
-import boto3
+def patch_boto3():
+    """
+    Makes SNSExtendedClientSession the boto3 session class, so that every SNS client and
+    resource created through boto3, including the ones of the default session, is extended.
+    """
+    import boto3
 
-from .session import SNSExtendedClientSession
+    from .session import SNSExtendedClientSession
 
-setattr(boto3.session, "Session", SNSExtendedClientSession)
+    setattr(boto3.session, "Session", SNSExtendedClientSession)
 
-# Now take care of the reference in the boto3.__init__ module
-setattr(boto3, "Session", SNSExtendedClientSession)
+    # Now take care of the reference in the boto3.__init__ module
+    setattr(boto3, "Session", SNSExtendedClientSession)
 
-# Now ensure that even the default session is our SNSExtendedClientSession
-if boto3.DEFAULT_SESSION:
-    boto3.setup_default_session()
\ No newline at end of file
+    # Now ensure that even the default session is our SNSExtendedClientSession
+    if boto3.DEFAULT_SESSION:
+        boto3.setup_default_session()
+
+
+def __getattr__(name):
+    # the session module, and boto3 with it, is only imported when used
+    if name in ("SNSExtendedClientSession", "create_extended_sns_client"):
+        from . import session
+
+        return getattr(session, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
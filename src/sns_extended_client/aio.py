@@ -0,0 +1,242 @@
+import asyncio
+from contextvars import copy_context
+from functools import partial
+
+from botocore.exceptions import ClientError
+
+from .exceptions import MissingPayloadOffloadingResource, SNSExtendedClientException
+from .metrics import S3_UPLOAD_STAGE, SNS_PUBLISH_STAGE, measure_stage
+from .session import (
+    _EXTENDED_CLIENT_PROPERTIES,
+    _PAYLOAD_PREPARATION_METHODS,
+    DEFAULT_WARM_UP_CONNECTIONS,
+    _BufferReader,
+    _is_access_denied,
+    _is_file_like,
+    _publishing_to,
+    _remember_uploaded_payload,
+)
+
+
+class AsyncSNSExtendedClient:
+    """
+    An asyncio counterpart of the SNS client created by SNSExtendedClientSession.
+
+    AsyncSNSExtendedClient wraps asynchronous SNS and S3 clients, such as the ones
+    created by aiobotocore, whose operations are coroutines. ``publish`` and
+    ``publish_batch`` offload large payloads to S3 and publish the resulting message
+    without blocking the event loop. Every other operation is delegated to the
+    wrapped SNS client.
+
+    :type sns_client: object
+    :param sns_client: Asynchronous SNS client used to publish messages
+    :type s3_client: object
+    :param s3_client: Asynchronous S3 client used to store large payloads
+
+    """
+
+    def __init__(self, sns_client, s3_client):
+        self.sns_client = sns_client
+        self.s3_client = s3_client
+
+    def __getattr__(self, name):
+        # only invoked for attributes missing on the wrapper itself, private attributes
+        # (including the unset property values) are never looked up on the SNS client
+        if name.startswith("_") or name == "sns_client":
+            raise AttributeError(name)
+        return getattr(self.sns_client, name)
+
+    async def _payload_exists(self, s3_key: str, s3_bucket_name: str = None):
+        try:
+            await self.s3_client.head_object(
+                Bucket=s3_bucket_name or self.large_payload_support, Key=s3_key
+            )
+        except ClientError as error:
+            if error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    async def _store_payload(
+        self,
+        s3_key: str,
+        encoded_body,
+        content_addressed: bool = False,
+        s3_bucket_name: str = None,
+    ):
+        s3_bucket_name = s3_bucket_name or self.large_payload_support
+        if not (
+            content_addressed
+            and self.check_existing_payload
+            and await self._payload_exists(s3_key, s3_bucket_name)
+        ):
+            if isinstance(encoded_body, memoryview):
+                encoded_body = _BufferReader(encoded_body)
+            metrics_hook = self.metrics_hook
+            if metrics_hook is None:
+                await self.s3_client.put_object(
+                    Bucket=s3_bucket_name, Key=s3_key, Body=encoded_body
+                )
+            else:
+                with measure_stage(metrics_hook, S3_UPLOAD_STAGE):
+                    await self.s3_client.put_object(
+                        Bucket=s3_bucket_name, Key=s3_key, Body=encoded_body
+                    )
+
+        if content_addressed:
+            _remember_uploaded_payload(self, s3_bucket_name, s3_key)
+
+    async def _head_bucket(self, bucket_name: str):
+        try:
+            await self.s3_client.head_bucket(Bucket=bucket_name)
+        except ClientError as error:
+            # the connection is open all the same without the s3:ListBucket permission
+            if not _is_access_denied(error):
+                raise
+
+    async def warm_up(self, connections: int = DEFAULT_WARM_UP_CONNECTIONS):
+        """
+        Opens up to connections connections to each payload bucket ahead of time. Access
+        denied errors, raised without the s3:ListBucket permission, are ignored.
+        """
+        if not self.large_payload_support:
+            raise MissingPayloadOffloadingResource()
+        if not isinstance(connections, int) or connections <= 0:
+            raise ValueError(f"connections must be a positive int: {connections}")
+
+        bucket_names = list(self.payload_buckets or [self.large_payload_support]) * connections
+        await asyncio.gather(*(self._head_bucket(bucket_name) for bucket_name in bucket_names))
+
+    async def _prepare_payload_async(
+        self, message_attributes: dict, message_body, message_structure: str
+    ):
+        if not (
+            self.payload_process_pool is not None
+            or self.payload_compression is not None
+            or self.inline_compression is not None
+            or self.content_addressed_keys
+            or _is_file_like(message_body)
+        ):
+            return self._prepare_payload(message_attributes, message_body, message_structure)
+
+        # compressing or hashing a payload, reading a file body and waiting for the
+        # payload_process_pool are done on a thread of the default executor rather than on
+        # the event loop, in a copy of the current context holding the target ARN
+        return await asyncio.get_running_loop().run_in_executor(
+            None,
+            partial(
+                copy_context().run,
+                self._prepare_payload,
+                message_attributes,
+                message_body,
+                message_structure,
+            ),
+        )
+
+    async def _make_payload(self, message_attributes: dict, message_body, message_structure: str):
+        message_attributes, message_body, offloaded_payload = await self._prepare_payload_async(
+            message_attributes, message_body, message_structure
+        )
+        if offloaded_payload is not None:
+            await self._store_payload(*offloaded_payload)
+
+        return message_attributes, message_body
+
+    async def _make_batch_payloads(self, entries: list):
+        prepared_entries = []
+        offloaded_payloads = []
+        for entry in entries:
+            prepared_entry = dict(entry)
+            (
+                prepared_entry["MessageAttributes"],
+                prepared_entry["Message"],
+                offloaded_payload,
+            ) = await self._prepare_payload_async(
+                entry.get("MessageAttributes", {}),
+                entry["Message"],
+                entry.get("MessageStructure", None),
+            )
+            prepared_entries.append(prepared_entry)
+            if offloaded_payload is not None:
+                offloaded_payloads.append(offloaded_payload)
+
+        results = await asyncio.gather(
+            *(self._store_payload(*payload) for payload in offloaded_payloads),
+            return_exceptions=True,
+        )
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            # the messages of the payloads stored by the other uploads are not published
+            self._delete_stored_payloads(
+                [
+                    payload
+                    for payload, result in zip(offloaded_payloads, results)
+                    if not isinstance(result, BaseException)
+                ]
+            )
+            raise errors[0]
+
+        return prepared_entries
+
+    async def _call_sns(self, operation, **kwargs):
+        metrics_hook = self.metrics_hook
+        if metrics_hook is None:
+            return await operation(**kwargs)
+
+        with measure_stage(metrics_hook, SNS_PUBLISH_STAGE):
+            return await operation(**kwargs)
+
+    async def publish(self, **kwargs):
+        if "TopicArn" not in kwargs and "TargetArn" not in kwargs:
+            raise SNSExtendedClientException("Missing TopicArn: TopicArn is a required feild.")
+
+        with _publishing_to(kwargs.get("TopicArn") or kwargs.get("TargetArn")):
+            kwargs["MessageAttributes"], kwargs["Message"] = await self._make_payload(
+                kwargs.get("MessageAttributes", {}),
+                kwargs["Message"],
+                kwargs.get("MessageStructure", None),
+            )
+        try:
+            return await self._call_sns(self.sns_client.publish, **kwargs)
+        except Exception:
+            self._delete_unpublished_payloads([(kwargs["MessageAttributes"], kwargs["Message"])])
+            raise
+
+    async def publish_batch(self, **kwargs):
+        if "TopicArn" not in kwargs:
+            raise SNSExtendedClientException("Missing TopicArn: TopicArn is a required feild.")
+
+        with _publishing_to(kwargs["TopicArn"]):
+            kwargs["PublishBatchRequestEntries"] = await self._make_batch_payloads(
+                kwargs.get("PublishBatchRequestEntries", [])
+            )
+        try:
+            response = await self._call_sns(self.sns_client.publish_batch, **kwargs)
+        except Exception:
+            self._delete_unpublished_batch_payloads(kwargs["PublishBatchRequestEntries"])
+            raise
+
+        failed_ids = {failure["Id"] for failure in response.get("Failed", [])}
+        if failed_ids:
+            self._delete_unpublished_batch_payloads(
+                kwargs["PublishBatchRequestEntries"], failed_ids
+            )
+        return response
+
+
+def _unsupported_property(name: str):
+    """Returns a property which is always None and cannot be set to another value"""
+
+    def _set(self, value):
+        if value is not None:
+            raise SNSExtendedClientException(f"{name} is not supported by AsyncSNSExtendedClient.")
+
+    return property(lambda self: None, _set, lambda self: None)
+
+
+for _name, _attribute in {**_EXTENDED_CLIENT_PROPERTIES, **_PAYLOAD_PREPARATION_METHODS}.items():
+    setattr(AsyncSNSExtendedClient, _name, _attribute)
+
+# multipart and hedged uploads are implemented with the threads of the synchronous client
+for _name in ("s3_transfer_config", "hedged_upload_percentile"):
+    setattr(AsyncSNSExtendedClient, _name, _unsupported_property(_name))
@@ -0,0 +1,109 @@
+import functools
+from json import dumps
+
+from .exceptions import SNSExtendedClientException
+from .resolver import (
+    PayloadResolver,
+    _set_envelope_message,
+    get_message_attribute_value,
+    parse_message_pointer,
+    parse_sns_envelope,
+)
+from .session import LEGACY_RESERVED_ATTRIBUTE_NAME, RESERVED_ATTRIBUTE_NAME
+
+SNS_EVENT_SOURCE = "aws:sns"
+SQS_EVENT_SOURCE = "aws:sqs"
+
+_default_resolver = None
+
+
+def _get_default_resolver():
+    # created on first use and kept for the lifetime of the Lambda execution environment
+    global _default_resolver
+    if _default_resolver is None:
+        _default_resolver = PayloadResolver()
+    return _default_resolver
+
+
+def _get_record_message(record: dict):
+    """
+    Returns a (container, field, message_attributes) tuple for the message of an SNS or
+    SQS event record, where container[field] holds the message body, or None for records
+    of other event sources. SQS records without raw message delivery return their SNS
+    envelope as the container.
+    """
+    if record.get("EventSource") == SNS_EVENT_SOURCE:
+        return record["Sns"], "Message", record["Sns"].get("MessageAttributes")
+    if record.get("eventSource") == SQS_EVENT_SOURCE:
+        envelope = parse_sns_envelope(record.get("body"))
+        if envelope is None:
+            return record, "body", record.get("messageAttributes")
+        return envelope, "Message", envelope.get("MessageAttributes")
+    return None
+
+
+def _get_message_pointer(message_body, message_attributes):
+    pointer = parse_message_pointer(message_body)
+    has_reserved_attribute = any(
+        get_message_attribute_value(message_attributes, name) is not None
+        for name in (RESERVED_ATTRIBUTE_NAME, LEGACY_RESERVED_ATTRIBUTE_NAME)
+    )
+    if pointer is None and has_reserved_attribute:
+        raise SNSExtendedClientException(
+            f"Message carrying a reserved attribute has no valid payload pointer: {message_body}"
+        )
+    return pointer
+
+
+def resolve_event_payloads(event: dict, resolver: PayloadResolver = None) -> dict:
+    """
+    Replaces, in place, the offloaded and inline compressed messages of the SNS and SQS
+    records of a Lambda event with their original payload. The payloads of all the
+    records are fetched concurrently. Returns the event.
+    """
+    resolver = resolver if resolver is not None else _get_default_resolver()
+
+    messages = []
+    pointers = []
+    for record in event.get("Records", []):
+        record_message = _get_record_message(record)
+        if record_message is None:
+            continue
+        container, field, message_attributes = record_message
+        messages.append((record, container, field, message_attributes))
+        pointer = _get_message_pointer(container[field], message_attributes)
+        if pointer is not None:
+            pointers.append(pointer)
+
+    payloads = resolver.get_payloads(pointers)
+
+    for record, container, field, message_attributes in messages:
+        payload = resolver.resolve_body(container[field], message_attributes, payloads)
+        if container is not record and record.get("eventSource") == SQS_EVENT_SOURCE:
+            _set_envelope_message(container, payload)
+            record["body"] = dumps(container)
+        else:
+            container[field] = payload
+
+    return event
+
+
+def resolve_offloaded_payloads(handler=None, resolver: PayloadResolver = None):
+    """
+    Decorates a Lambda handler so that the offloaded messages of its SNS and SQS event
+    records are resolved, concurrently, before the handler is called.
+
+    Can be used as ``@resolve_offloaded_payloads`` or
+    ``@resolve_offloaded_payloads(resolver=PayloadResolver(s3_client))``.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(event, context):
+            return func(resolve_event_payloads(event, resolver), context)
+
+        return wrapper
+
+    if handler is not None:
+        return decorator(handler)
+    return decorator
@@ -0,0 +1,64 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe least recently used cache bounded by item count, total bytes or both.
+
+    When max_bytes is given, the size of an item is the len() of its value and items
+    larger than max_bytes are never cached.
+
+    :type max_entries: int
+    :param max_entries: Number of items kept before the least recently used are evicted
+    :type max_bytes: int
+    :param max_bytes: Total size of the values kept before the least recently used are evicted
+    """
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None):
+        if max_entries is None and max_bytes is None:
+            raise ValueError("At least one of max_entries and max_bytes must be given.")
+        for name, limit in (("max_entries", max_entries), ("max_bytes", max_bytes)):
+            if limit is not None and (not isinstance(limit, int) or limit <= 0):
+                raise ValueError(f"{name} must be a positive int: {limit}")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def _get_size(self, value):
+        return len(value) if self.max_bytes is not None else 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        size = self._get_size(value)
+        with self._lock:
+            if key in self._items:
+                self.current_bytes -= self._get_size(self._items.pop(key))
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._items[key] = value
+            self.current_bytes += size
+            while (self.max_entries is not None and len(self._items) > self.max_entries) or (
+                self.max_bytes is not None and self.current_bytes > self.max_bytes
+            ):
+                _, evicted = self._items.popitem(last=False)
+                self.current_bytes -= self._get_size(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
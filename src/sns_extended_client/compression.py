@@ -0,0 +1,122 @@
+import gzip
+import os
+import zlib
+from base64 import b64decode
+
+from .exceptions import SNSExtendedClientException
+
+GZIP_COMPRESSION = "gzip"
+ZSTD_COMPRESSION = "zstd"
+COMPRESSION_CODECS = (GZIP_COMPRESSION, ZSTD_COMPRESSION)
+GZIP_COMPRESSION_LEVEL = 6
+GZIP_WBITS = 16 + zlib.MAX_WBITS  # gzip header and trailer around the deflate stream
+COMPRESSION_CHUNK_SIZE = 1024 * 1024  # bytes compressed at a time by compress_payload_up_to
+
+
+def _get_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise SNSExtendedClientException(
+            "zstd payload compression requires the zstandard package, installed by the zstd "
+            "extra: pip install amazon-sns-extended-client[zstd]"
+        )
+    return zstandard
+
+
+def _read_payload(payload):
+    # file objects are read from their current position
+    return payload.read() if hasattr(payload, "read") else payload
+
+
+def check_compression_codec(codec: str):
+    if codec not in COMPRESSION_CODECS:
+        raise ValueError(
+            f"Unsupported payload compression {codec}, use one of {COMPRESSION_CODECS}"
+        )
+    if codec == ZSTD_COMPRESSION:
+        _get_zstandard()
+
+
+def compress_payload(codec: str, payload) -> bytes:
+    """
+    Compresses a bytes-like or file payload with the given codec.
+
+    gzip output carries no timestamp, so equal payloads always compress to equal bytes.
+    """
+    check_compression_codec(codec)
+    payload = _read_payload(payload)
+    if codec == GZIP_COMPRESSION:
+        compressor = zlib.compressobj(GZIP_COMPRESSION_LEVEL, zlib.DEFLATED, GZIP_WBITS)
+        return compressor.compress(payload) + compressor.flush()
+    return _get_zstandard().ZstdCompressor().compress(payload)
+
+
+def _iter_payload_chunks(payload):
+    if hasattr(payload, "read"):
+        while True:
+            chunk = payload.read(COMPRESSION_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+    payload = memoryview(payload).cast("B")
+    for start in range(0, len(payload), COMPRESSION_CHUNK_SIZE):
+        yield payload[start : start + COMPRESSION_CHUNK_SIZE]
+
+
+def _get_remaining_size(payload) -> int:
+    if not hasattr(payload, "read"):
+        return memoryview(payload).nbytes
+    position = payload.tell()
+    end = payload.seek(0, os.SEEK_END)
+    payload.seek(position)
+    return end - position
+
+
+def compress_payload_up_to(codec: str, payload, max_size: int):
+    """
+    Compresses a bytes-like or file payload like compress_payload, one chunk at a time,
+    and gives up as soon as the output exceeds max_size bytes.
+
+    Returns the compressed payload, or None when it is larger than max_size.
+    """
+    check_compression_codec(codec)
+    if codec == GZIP_COMPRESSION:
+        compressor = zlib.compressobj(GZIP_COMPRESSION_LEVEL, zlib.DEFLATED, GZIP_WBITS)
+    else:
+        # the frame records the payload size, as with ZstdCompressor().compress
+        compressor = _get_zstandard().ZstdCompressor()
+        compressor = compressor.compressobj(size=_get_remaining_size(payload))
+
+    output = []
+    size = 0
+    for chunk in _iter_payload_chunks(payload):
+        output.append(compressor.compress(chunk))
+        size += len(output[-1])
+        if size > max_size:
+            return None
+    output.append(compressor.flush())
+    size += len(output[-1])
+    return b"".join(output) if size <= max_size else None
+
+
+def decompress_payload(codec: str, payload) -> bytes:
+    """Decompresses a payload produced by compress_payload with the given codec"""
+    check_compression_codec(codec)
+    payload = _read_payload(payload)
+    if codec == GZIP_COMPRESSION:
+        return gzip.decompress(payload)
+    return _get_zstandard().ZstdDecompressor().decompress(payload)
+
+
+def open_decompressed_stream(codec: str, fileobj):
+    """Wraps a binary file object so that reading it yields the decompressed payload"""
+    check_compression_codec(codec)
+    if codec == GZIP_COMPRESSION:
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    return _get_zstandard().ZstdDecompressor().stream_reader(fileobj)
+
+
+def decode_inline_payload(codec: str, message_body: str) -> bytes:
+    """Decodes a message body published inline by the inline_compression mode"""
+    return decompress_payload(codec, b64decode(message_body))
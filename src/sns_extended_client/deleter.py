@@ -0,0 +1,153 @@
+import logging
+import threading
+
+import boto3
+
+from .resolver import _get_sqs_message_pointer, parse_message_pointer
+
+logger = logging.getLogger("sns_extended_client.deleter")
+
+MAX_DELETE_OBJECTS = 1000  # maximum number of keys in a single delete_objects request
+
+
+class PayloadDeleter:
+    """
+    Deletes offloaded payloads from S3 in batches.
+
+    Keys are collected per bucket and removed with delete_objects, up to max_batch_size
+    keys per request. A bucket is flushed as soon as it collects max_batch_size keys and,
+    when flush_interval is given, all the buckets are flushed by a background thread every
+    flush_interval seconds. Call close() to flush the remaining keys and stop the thread.
+
+    When a delete_objects request fails, its keys, and the keys of its bucket not sent yet,
+    are scheduled again and retried by the next flush, while the other buckets are still
+    flushed. The error is raised once they are. Keys which S3 reports as not deleted are
+    listed in failed_keys.
+
+    :type s3_client: boto3 S3 client
+    :param s3_client: S3 client used to delete payloads. Defaults to ``boto3.client("s3")``
+    :type max_batch_size: int
+    :param max_batch_size: Number of keys of a bucket which triggers a flush, at most 1000
+    :type flush_interval: float
+    :param flush_interval: Seconds between two background flushes, None disables them
+
+    """
+
+    def __init__(
+        self,
+        s3_client=None,
+        max_batch_size: int = MAX_DELETE_OBJECTS,
+        flush_interval: float = None,
+    ):
+        if not isinstance(max_batch_size, int) or not 0 < max_batch_size <= MAX_DELETE_OBJECTS:
+            raise ValueError(
+                f"max_batch_size must be an int between 1 and {MAX_DELETE_OBJECTS}: {max_batch_size}"
+            )
+        if flush_interval is not None and flush_interval <= 0:
+            raise ValueError(f"flush_interval must be positive: {flush_interval}")
+
+        self.s3_client = s3_client if s3_client is not None else boto3.client("s3")
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.deleted_count = 0
+        self.failed_keys = []
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._flush_thread = None
+        if flush_interval is not None:
+            self._flush_thread = threading.Thread(
+                target=self._flush_periodically, name="PayloadDeleter", daemon=True
+            )
+            self._flush_thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, s3_bucket_name: str, s3_key: str):
+        """Schedules the deletion of one payload"""
+        with self._lock:
+            keys = self._pending.setdefault(s3_bucket_name, [])
+            keys.append(s3_key)
+            if len(keys) < self.max_batch_size:
+                return
+            del self._pending[s3_bucket_name]
+        self._delete_keys(s3_bucket_name, keys)
+
+    def add_pointer(self, pointer: dict):
+        """Schedules the deletion of the payload of a {"s3BucketName", "s3Key"} pointer"""
+        self.add(pointer["s3BucketName"], pointer["s3Key"])
+
+    def add_message(self, message):
+        """
+        Schedules the deletion of the payload of a processed message, given as an SQS
+        message dict or as a message body. Messages which are not offloaded are ignored.
+        """
+        if isinstance(message, dict):
+            pointer, _ = _get_sqs_message_pointer(message)
+        else:
+            pointer = parse_message_pointer(message)
+        if pointer is not None:
+            self.add_pointer(pointer)
+
+    def flush(self):
+        """Deletes all the payloads scheduled so far"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        first_error = None
+        for s3_bucket_name, keys in pending.items():
+            try:
+                self._delete_keys(s3_bucket_name, keys)
+            except Exception as error:
+                first_error = first_error or error
+        if first_error is not None:
+            raise first_error
+
+    def close(self):
+        """Stops the background flushes and deletes the remaining payloads"""
+        self._closed.set()
+        if self._flush_thread is not None:
+            self._flush_thread.join()
+        self.flush()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to delete offloaded payloads")
+
+    def _delete_keys(self, s3_bucket_name: str, keys: list):
+        """
+        Deletes the keys of a bucket in batches of max_batch_size. When a batch fails, the
+        keys not deleted yet are scheduled again and the error is raised.
+        """
+        for start in range(0, len(keys), self.max_batch_size):
+            try:
+                self._delete_objects(s3_bucket_name, keys[start : start + self.max_batch_size])
+            except Exception:
+                with self._lock:
+                    self._pending[s3_bucket_name] = keys[start:] + self._pending.get(
+                        s3_bucket_name, []
+                    )
+                raise
+
+    def _delete_objects(self, s3_bucket_name: str, keys: list):
+        response = self.s3_client.delete_objects(
+            Bucket=s3_bucket_name,
+            Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+        )
+        errors = response.get("Errors", [])
+        with self._lock:
+            self.deleted_count += len(keys) - len(errors)
+            self.failed_keys.extend((s3_bucket_name, error["Key"]) for error in errors)
+        for error in errors:
+            logger.warning(
+                "Failed to delete payload %s from bucket %s: %s",
+                error.get("Key"),
+                s3_bucket_name,
+                error.get("Message"),
+            )
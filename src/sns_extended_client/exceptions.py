@@ -9,3 +9,9 @@ class MissingPayloadOffloadingResource(SNSExtendedClientException):
     def __init__(self, *args, **kwargs):
         error_msg = "Undeclared/Missing S3 bucket name for payload offloading!"
         super().__init__(error_msg, *args, **kwargs)
+
+
+class SpoolFull(SNSExtendedClientException):
+    def __init__(self, *args, **kwargs):
+        error_msg = "Local payload spool is full!"
+        super().__init__(error_msg, *args, **kwargs)
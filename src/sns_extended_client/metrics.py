@@ -0,0 +1,185 @@
+import math
+import threading
+from collections import deque
+from time import perf_counter
+
+# Stages of the publish pipeline reported to MetricsHook.record_stage
+SIZE_CHECK_STAGE = "size_check"  # measuring the message attributes and body
+PREPARE_STAGE = "prepare"  # checking and copying attributes, sizing, encoding, compressing
+S3_UPLOAD_STAGE = "s3_upload"  # storing one offloaded payload
+SNS_PUBLISH_STAGE = "sns_publish"  # the SNS publish or publish_batch request
+SPOOL_WRITE_STAGE = "spool_write"  # writing a message to a local spool
+SPOOL_DRAIN_STAGE = "spool_drain"  # one attempt at uploading and publishing a spooled message
+
+DEFAULT_HISTOGRAM_SAMPLES = 1024
+
+
+class MetricsHook:
+    """
+    Receives measurements of the publish pipeline of an extended client.
+
+    Set an instance as the metrics_hook of a client and override the methods of interest,
+    which do nothing by default. Hooks are called synchronously on the publishing thread,
+    possibly from several threads at once, so they must be fast and thread-safe. When no
+    hook is set, nothing is measured.
+    """
+
+    def record_stage(self, stage: str, duration: float, error: Exception = None):
+        """
+        Called once a stage of a publish is over, with its duration in seconds and the
+        exception it raised, if any.
+        """
+
+    def record_message(self, payload_size: int, offloaded: bool, s3_key: str = None):
+        """
+        Called once the payload of a message is prepared, with the size in bytes of its
+        original body, whether it is offloaded to S3 and, if so, its S3 key.
+        """
+
+    def record_hedged_upload(self, s3_key: str):
+        """Called when a second upload of a slow payload upload is started"""
+
+    def record_spool_dead_letter(self, spool_id: str, error: Exception):
+        """
+        Called when a spooled message is given up on and moved to the dead-letter
+        directory of its spool, with the exception of its last attempt.
+        """
+
+
+class measure_stage:
+    """Context manager reporting the duration of a stage, and its error if any, to a hook"""
+
+    def __init__(self, metrics_hook: MetricsHook, stage: str):
+        self.metrics_hook = metrics_hook
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics_hook.record_stage(self.stage, perf_counter() - self.start, exc_value)
+
+
+class Histogram:
+    """
+    Thread-safe distribution of observed values.
+
+    count, total, min and max cover every observed value, while percentiles are computed
+    over the max_samples most recent ones.
+
+    :type max_samples: int
+    :param max_samples: Number of recent values kept to compute percentiles
+    """
+
+    def __init__(self, max_samples: int = DEFAULT_HISTOGRAM_SAMPLES):
+        if not isinstance(max_samples, int) or max_samples <= 0:
+            raise ValueError(f"max_samples must be a positive int: {max_samples}")
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def observe(self, value):
+        with self._lock:
+            self.count += 1
+            self.total += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+            self._samples.append(value)
+
+    def percentile(self, percent: float):
+        """Returns the nearest-rank percentile of the recent values, or None without values"""
+        if not 0 <= percent <= 100:
+            raise ValueError(f"percent must be between 0 and 100: {percent}")
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[max(math.ceil(percent / 100 * len(samples)) - 1, 0)]
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+        }
+
+
+class InMemoryMetrics(MetricsHook):
+    """
+    MetricsHook aggregating the measurements in memory.
+
+    Counters: ``messages``, ``offloaded_messages``, ``payload_bytes``,
+    ``offloaded_payload_bytes``, ``hedged_uploads``, ``spool_dead_letters`` and
+    ``<stage>.errors``.
+    Histograms: ``<stage>.duration`` in seconds and ``payload_size`` in bytes.
+    """
+
+    def __init__(self, max_samples: int = DEFAULT_HISTOGRAM_SAMPLES):
+        self.max_samples = max_samples
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram(self.max_samples))
+        histogram.observe(value)
+
+    def counter(self, name: str) -> int:
+        return self._counters.get(name, 0)
+
+    def histogram(self, name: str):
+        """Returns the Histogram of a name, or None when nothing was observed under it"""
+        return self._histograms.get(name)
+
+    def record_stage(self, stage: str, duration: float, error: Exception = None):
+        self.observe(f"{stage}.duration", duration)
+        if error is not None:
+            self.increment(f"{stage}.errors")
+
+    def record_message(self, payload_size: int, offloaded: bool, s3_key: str = None):
+        self.increment("messages")
+        self.increment("payload_bytes", payload_size)
+        self.observe("payload_size", payload_size)
+        if offloaded:
+            self.increment("offloaded_messages")
+            self.increment("offloaded_payload_bytes", payload_size)
+
+    def record_hedged_upload(self, s3_key: str):
+        self.increment("hedged_uploads")
+
+    def record_spool_dead_letter(self, spool_id: str, error: Exception):
+        self.increment("spool_dead_letters")
+
+    def snapshot(self) -> dict:
+        """Returns the current counters and histogram summaries as plain dicts"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = dict(self._histograms)
+        return {
+            "counters": counters,
+            "histograms": {name: histogram.snapshot() for name, histogram in histograms.items()},
+        }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
@@ -0,0 +1,75 @@
+from hashlib import sha256
+
+from .compression import compress_payload
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python 3.7
+    shared_memory = None
+
+# bytes-like payloads from which compression and digests run in the payload_process_pool,
+# smaller ones are cheaper to prepare in place than to hand over to another process
+PROCESS_POOL_MIN_PAYLOAD_SIZE = 1024 * 1024
+
+
+def _prepare_shared_body(name: str, size: int, codec: str, compute_digest: bool):
+    """
+    Runs in a payload_process_pool worker: compresses the payload held by the shared
+    memory block name with codec, if any, and computes the hex SHA-256 digest of the
+    result when compute_digest is set.
+
+    Returns (output name, output size, digest) where output name is the shared memory
+    block holding the compressed payload, to be unlinked by the caller, or None when the
+    payload is not compressed.
+    """
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        payload = block.buf[:size]
+        try:
+            if codec is None:
+                return None, size, sha256(payload).hexdigest() if compute_digest else None
+
+            compressed = compress_payload(codec, payload)
+        finally:
+            payload.release()
+    finally:
+        block.close()
+
+    digest = sha256(compressed).hexdigest() if compute_digest else None
+    output = shared_memory.SharedMemory(create=True, size=max(len(compressed), 1))
+    try:
+        output.buf[: len(compressed)] = compressed
+    finally:
+        output.close()
+    return output.name, len(compressed), digest
+
+
+def prepare_body_in_process(process_pool, encoded_body, codec: str, compute_digest: bool):
+    """
+    Compresses a bytes-like payload with codec, if any, and computes the digest of the
+    result when compute_digest is set, in a worker of process_pool. The payload is handed
+    over through shared memory rather than pickled.
+
+    Returns (encoded_body, digest), digest being None unless compute_digest is set.
+    """
+    encoded_body = memoryview(encoded_body).cast("B")
+    size = encoded_body.nbytes
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        block.buf[:size] = encoded_body
+        output_name, output_size, digest = process_pool.submit(
+            _prepare_shared_body, block.name, size, codec, compute_digest
+        ).result()
+    finally:
+        block.close()
+        block.unlink()
+
+    if output_name is None:
+        return encoded_body, digest
+
+    output = shared_memory.SharedMemory(name=output_name)
+    try:
+        return bytes(output.buf[:output_size]), digest
+    finally:
+        output.close()
+        output.unlink()
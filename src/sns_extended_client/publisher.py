@@ -0,0 +1,337 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .exceptions import SNSExtendedClientException
+from .session import MAX_BATCH_ENTRIES, _publishing_to
+
+logger = logging.getLogger("sns_extended_client.publisher")
+
+DEFAULT_MAX_QUEUE_SIZE = 1000
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_LINGER = 0.01
+DEFAULT_MAX_BATCH_BYTES = 262144  # maximum size of all the entries of a publish_batch request
+FIFO_TOPIC_SUFFIX = ".fifo"
+
+# publish arguments which can be given per publish_batch entry
+BATCH_ENTRY_FIELDS = (
+    "Message",
+    "Subject",
+    "MessageStructure",
+    "MessageAttributes",
+    "MessageDeduplicationId",
+    "MessageGroupId",
+)
+
+_STOP = object()  # queued once per worker by close()
+
+
+class BackgroundPublisher:
+    """
+    Publishes messages through an SNS client from a pool of worker threads.
+
+    ``publish`` queues a message and returns at once with a ``concurrent.futures.Future``
+    resolving to its MessageId, while the workers call the client's ``publish``, offloading
+    large payloads to S3 as usual. The queue holds at most max_queue_size messages:
+    ``publish`` blocks while it is full. Call ``close()``, or use the publisher as a context
+    manager, to publish the queued messages and stop the workers.
+
+    :type sns_client: boto3 SNS client
+    :param sns_client: Extended SNS client, Topic or PlatformEndpoint used to publish
+    :type max_queue_size: int
+    :param max_queue_size: Number of messages waiting to be published before publish blocks
+    :type max_workers: int
+    :param max_workers: Number of worker threads publishing messages concurrently
+
+    """
+
+    def __init__(
+        self,
+        sns_client,
+        max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ):
+        for name, value in (("max_queue_size", max_queue_size), ("max_workers", max_workers)):
+            if not isinstance(value, int) or value <= 0:
+                raise ValueError(f"{name} must be a positive int: {value}")
+
+        self.sns_client = sns_client
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"BackgroundPublisher-{index}", daemon=True)
+            for index in range(max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def pending(self) -> int:
+        """Number of queued messages not picked up by a worker yet"""
+        return self._queue.qsize()
+
+    def publish(self, timeout: float = None, **kwargs) -> Future:
+        """
+        Queues a message, given with the keyword arguments of the client's publish, and
+        returns a Future resolving to its MessageId. Blocks while the queue is full, for at
+        most timeout seconds when given, after which queue.Full is raised.
+        """
+        future = Future()
+        # queued under the lock so that no message is queued behind the stop markers
+        with self._close_lock:
+            if self._closed:
+                raise SNSExtendedClientException("Cannot publish through a closed publisher.")
+            self._queue.put((kwargs, future), timeout=timeout)
+        return future
+
+    def flush(self):
+        """Waits until every message queued so far is published or has failed"""
+        self._queue.join()
+
+    def close(self):
+        """Publishes the queued messages, then stops the workers. Further publish calls fail."""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                kwargs, future = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    response = self.sns_client.publish(**kwargs)
+                except Exception as error:
+                    logger.debug("Failed to publish a message in the background", exc_info=True)
+                    future.set_exception(error)
+                else:
+                    future.set_result(response["MessageId"])
+            finally:
+                self._queue.task_done()
+
+
+class _Batch:
+    def __init__(self, topic_arn: str, deadline: float):
+        self.topic_arn = topic_arn
+        self.deadline = deadline
+        self.size = 0
+        # (entry, offloaded_payload, future) tuples
+        self.entries = []
+
+
+class BatchingPublisher:
+    """
+    Coalesces single publish calls to a topic into publish_batch requests.
+
+    ``publish`` prepares the message payload on the calling thread, as the extended
+    client's publish would, and adds the message to the pending batch of its topic. A
+    batch is sent, from a pool of max_workers threads, once it holds 10 entries, once its
+    entries reach max_batch_bytes, or linger seconds after its first message. Offloaded
+    payloads of a batch are stored concurrently right before it is sent. Batches of a FIFO
+    topic are sent one at a time, in order, so that the order of its message groups is kept.
+    Each call returns a ``concurrent.futures.Future`` resolving to the MessageId of its
+    message, or failing with the error of its entry.
+
+    :type sns_client: boto3 SNS client
+    :param sns_client: Extended SNS client used to publish, which supports publish_batch
+    :type linger: float
+    :param linger: Seconds a message waits for other messages to the same topic
+    :type max_batch_bytes: int
+    :param max_batch_bytes: Maximum size of the message attributes and bodies of a batch
+    :type max_workers: int
+    :param max_workers: Number of batches sent concurrently
+
+    """
+
+    def __init__(
+        self,
+        sns_client,
+        linger: float = DEFAULT_LINGER,
+        max_batch_bytes: int = DEFAULT_MAX_BATCH_BYTES,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ):
+        if not hasattr(sns_client, "_publish_prepared_batch"):
+            raise TypeError("BatchingPublisher requires an extended SNS client.")
+        if linger < 0:
+            raise ValueError(f"linger must not be negative: {linger}")
+        for name, value in (("max_batch_bytes", max_batch_bytes), ("max_workers", max_workers)):
+            if not isinstance(value, int) or value <= 0:
+                raise ValueError(f"{name} must be a positive int: {value}")
+
+        self.sns_client = sns_client
+        self.linger = linger
+        self.max_batch_bytes = max_batch_bytes
+        self._batches = {}
+        self._in_flight = set()
+        # batches waiting for the batch in flight of their FIFO topic, by topic
+        self._fifo_batches = {}
+        self._closed = False
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="BatchingPublisher"
+        )
+        self._linger_thread = threading.Thread(
+            target=self._send_expired_batches, name="BatchingPublisher-linger", daemon=True
+        )
+        self._linger_thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def publish(self, **kwargs) -> Future:
+        """
+        Adds a message, given with the keyword arguments of the client's publish, to the
+        pending batch of its TopicArn and returns a Future resolving to its MessageId.
+        Payload preparation errors, such as invalid message attributes, are raised here.
+        """
+        if "TopicArn" not in kwargs:
+            raise SNSExtendedClientException("Missing TopicArn: TopicArn is a required feild.")
+        unsupported = set(kwargs) - set(BATCH_ENTRY_FIELDS) - {"TopicArn"}
+        if unsupported:
+            raise SNSExtendedClientException(
+                f"Arguments not supported by publish_batch: {sorted(unsupported)}"
+            )
+
+        topic_arn = kwargs.pop("TopicArn")
+        entry = dict(kwargs)
+        with _publishing_to(topic_arn):
+            (
+                entry["MessageAttributes"],
+                entry["Message"],
+                offloaded_payload,
+            ) = self.sns_client._prepare_payload(
+                kwargs.get("MessageAttributes", {}),
+                kwargs["Message"],
+                kwargs.get("MessageStructure", None),
+            )
+        entry_size = sum(
+            self.sns_client._get_message_size(entry["MessageAttributes"], entry["Message"])
+        )
+
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise SNSExtendedClientException("Cannot publish through a closed publisher.")
+            batch = self._batches.get(topic_arn)
+            if batch is not None and batch.size + entry_size > self.max_batch_bytes:
+                self._send(self._batches.pop(topic_arn))
+                batch = None
+            if batch is None:
+                batch = self._batches[topic_arn] = _Batch(topic_arn, time.monotonic() + self.linger)
+                self._condition.notify()
+            entry["Id"] = str(len(batch.entries))
+            batch.entries.append((entry, offloaded_payload, future))
+            batch.size += entry_size
+            if len(batch.entries) == MAX_BATCH_ENTRIES or batch.size >= self.max_batch_bytes:
+                self._send(self._batches.pop(topic_arn))
+        return future
+
+    def flush(self):
+        """Sends every pending batch and waits until all the published messages are done"""
+        with self._condition:
+            for topic_arn in list(self._batches):
+                self._send(self._batches.pop(topic_arn))
+            self._condition.wait_for(lambda: not self._in_flight)
+
+    def close(self):
+        """Sends the pending batches, then stops the publisher. Further publish calls fail."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        self.flush()
+        self._linger_thread.join()
+        self._executor.shutdown()
+
+    def _send(self, batch: _Batch):
+        # called with the condition held
+        self._in_flight.add(batch)
+        if batch.topic_arn.endswith(FIFO_TOPIC_SUFFIX):
+            waiting = self._fifo_batches.get(batch.topic_arn)
+            if waiting is not None:
+                waiting.append(batch)
+                return
+            self._fifo_batches[batch.topic_arn] = deque()
+        self._executor.submit(self._publish_batch, batch)
+
+    def _send_expired_batches(self):
+        with self._condition:
+            while not self._closed:
+                now = time.monotonic()
+                for topic_arn, batch in list(self._batches.items()):
+                    if batch.deadline <= now:
+                        self._send(self._batches.pop(topic_arn))
+                deadlines = [batch.deadline for batch in self._batches.values()]
+                self._condition.wait(min(deadlines) - now if deadlines else None)
+
+    def _publish_batch(self, batch: _Batch):
+        try:
+            self._publish_entries(batch)
+        finally:
+            with self._condition:
+                self._in_flight.discard(batch)
+                waiting = self._fifo_batches.get(batch.topic_arn)
+                if waiting:
+                    self._executor.submit(self._publish_batch, waiting.popleft())
+                elif waiting is not None:
+                    del self._fifo_batches[batch.topic_arn]
+                self._condition.notify_all()
+
+    def _publish_entries(self, batch: _Batch):
+        # messages whose future was cancelled are dropped
+        entries = [
+            (entry, payload, future)
+            for entry, payload, future in batch.entries
+            if future.set_running_or_notify_cancel()
+        ]
+        if not entries:
+            return
+
+        futures = {entry["Id"]: future for entry, _, future in entries}
+        try:
+            self.sns_client._store_payloads(
+                [payload for _, payload, _ in entries if payload is not None]
+            )
+            response = self.sns_client._publish_prepared_batch(
+                TopicArn=batch.topic_arn,
+                PublishBatchRequestEntries=[entry for entry, _, _ in entries],
+            )
+        except Exception as error:
+            logger.debug("Failed to publish a batch of %d messages", len(futures), exc_info=True)
+            for future in futures.values():
+                future.set_exception(error)
+            return
+
+        for success in response.get("Successful", []):
+            futures.pop(success["Id"]).set_result(success["MessageId"])
+        for failure in response.get("Failed", []):
+            futures.pop(failure["Id"]).set_exception(
+                SNSExtendedClientException(
+                    f"Failed to publish message: {failure.get('Code')} {failure.get('Message')}"
+                )
+            )
+        for future in futures.values():
+            future.set_exception(SNSExtendedClientException("Message missing from the response."))
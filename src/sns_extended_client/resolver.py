@@ -0,0 +1,361 @@
+import mmap
+import shutil
+import tempfile
+from base64 import b64encode
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from json import JSONDecodeError, dumps, loads
+
+import boto3
+
+from .cache import LRUCache
+from .compression import (
+    decode_inline_payload,
+    decompress_payload,
+    open_decompressed_stream,
+)
+from .session import (
+    INLINE_COMPRESSION_ATTRIBUTE_NAME,
+    LEGACY_MESSAGE_POINTER_CLASS,
+    LEGACY_RESERVED_ATTRIBUTE_NAME,
+    MESSAGE_POINTER_CLASS,
+    POINTER_COMPRESSION_KEY,
+    RESERVED_ATTRIBUTE_NAME,
+)
+
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_WORKERS = 10  # receive_message returns at most 10 messages
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_PREFETCH_DEPTH = 4
+MESSAGE_POINTER_CLASSES = (MESSAGE_POINTER_CLASS, LEGACY_MESSAGE_POINTER_CLASS)
+SNS_NOTIFICATION_TYPE = "Notification"
+# field added to the SNS envelopes whose Message is set to a binary payload, base64 encoded
+MESSAGE_ENCODING_KEY = "MessageEncoding"
+BASE64_MESSAGE_ENCODING = "base64"
+
+
+def _decode_payload(payload: bytes):
+    """Returns a payload as str when it is UTF-8 text, as bytes otherwise"""
+    try:
+        return payload.decode("utf-8")
+    except UnicodeDecodeError:
+        return payload
+
+
+def _set_envelope_message(envelope: dict, payload):
+    """
+    Sets a resolved payload as the Message of an SNS envelope serialized back to JSON:
+    binary payloads are base64 encoded and flagged by the MessageEncoding field.
+    """
+    if isinstance(payload, bytes):
+        envelope["Message"] = b64encode(payload).decode("ascii")
+        envelope[MESSAGE_ENCODING_KEY] = BASE64_MESSAGE_ENCODING
+    else:
+        envelope["Message"] = payload
+
+
+def parse_message_pointer(message_body):
+    """
+    Returns the {"s3BucketName", "s3Key"} pointer of a message body written by the SNS
+    extended client, using either pointer class, or None for any other message body.
+    """
+    if not isinstance(message_body, str) or not message_body.startswith('["'):
+        return None
+    try:
+        pointer = loads(message_body)
+    except JSONDecodeError:
+        return None
+    if (
+        len(pointer) == 2
+        and pointer[0] in MESSAGE_POINTER_CLASSES
+        and isinstance(pointer[1], dict)
+        and "s3BucketName" in pointer[1]
+        and "s3Key" in pointer[1]
+    ):
+        return pointer[1]
+    return None
+
+
+def get_message_attribute_value(message_attributes, name: str):
+    """
+    Returns the string value of a message attribute in any of the shapes delivered by SNS
+    and SQS: SQS messages ("StringValue"), SNS envelopes ("Value") and Lambda SQS event
+    records ("stringValue").
+    """
+    value = (message_attributes or {}).get(name)
+    if not value:
+        return None
+    for field in ("StringValue", "Value", "stringValue"):
+        if field in value:
+            return value[field]
+    return None
+
+
+def parse_sns_envelope(message_body):
+    """Returns the SNS notification wrapping an SQS message body, or None for raw deliveries"""
+    if not isinstance(message_body, str) or not message_body.startswith("{"):
+        return None
+    try:
+        envelope = loads(message_body)
+    except JSONDecodeError:
+        return None
+    if isinstance(envelope, dict) and envelope.get("Type") == SNS_NOTIFICATION_TYPE:
+        return envelope
+    return None
+
+
+def _get_sqs_message_pointer(message: dict):
+    """
+    Returns the (pointer, message_attributes) of an SQS message, looking into its SNS
+    envelope when there is one. pointer is None for messages which are not offloaded.
+    """
+    envelope = parse_sns_envelope(message.get("Body"))
+    if envelope is None:
+        return parse_message_pointer(message.get("Body")), message.get("MessageAttributes")
+    return parse_message_pointer(envelope.get("Message")), envelope.get("MessageAttributes")
+
+
+def _get_payload_size(message_attributes):
+    """Returns the payload size announced by the reserved attribute of a message, or 0"""
+    for name in (RESERVED_ATTRIBUTE_NAME, LEGACY_RESERVED_ATTRIBUTE_NAME):
+        value = get_message_attribute_value(message_attributes, name)
+        if value is not None:
+            try:
+                return int(value)
+            except ValueError:
+                return 0
+    return 0
+
+
+class PayloadResolver:
+    """
+    Resolves the original payload of messages published through the SNS extended client.
+
+    Message bodies holding a pointer of either pointer class are replaced by the S3
+    object they point to, inline compressed bodies are decompressed and any other body is
+    returned unchanged. Downloaded payloads are kept in an in-memory cache bounded by
+    bytes, so a payload fanned out to several queues is fetched only once per process.
+
+    :type s3_client: boto3 S3 client
+    :param s3_client: S3 client used to fetch payloads. Defaults to ``boto3.client("s3")``
+    :type cache_max_bytes: int
+    :param cache_max_bytes: Total size of the cached payloads, ``0`` disables the cache
+    :type max_workers: int
+    :param max_workers: Number of payloads fetched concurrently when resolving a batch
+
+    """
+
+    def __init__(
+        self,
+        s3_client=None,
+        cache_max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ):
+        self.s3_client = s3_client if s3_client is not None else boto3.client("s3")
+        self.max_workers = max_workers
+        self._cache = LRUCache(max_bytes=cache_max_bytes) if cache_max_bytes else None
+
+    def get_payload(self, pointer: dict) -> bytes:
+        """Returns the payload bytes stored in S3 for a pointer from parse_message_pointer"""
+        cache_key = (pointer["s3BucketName"], pointer["s3Key"])
+        if self._cache is not None:
+            payload = self._cache.get(cache_key)
+            if payload is not None:
+                return payload
+
+        response = self.s3_client.get_object(Bucket=pointer["s3BucketName"], Key=pointer["s3Key"])
+        payload = response["Body"].read()
+        if POINTER_COMPRESSION_KEY in pointer:
+            payload = decompress_payload(pointer[POINTER_COMPRESSION_KEY], payload)
+
+        if self._cache is not None:
+            self._cache.put(cache_key, payload)
+        return payload
+
+    def get_payloads(self, pointers) -> dict:
+        """
+        Fetches the payloads of several pointers concurrently through a thread pool of at
+        most max_workers threads. Returns a dict of payload bytes keyed by the
+        (s3BucketName, s3Key) of every distinct pointer.
+        """
+        unique_pointers = {}
+        for pointer in pointers:
+            unique_pointers.setdefault((pointer["s3BucketName"], pointer["s3Key"]), pointer)
+
+        if len(unique_pointers) <= 1:
+            return {key: self.get_payload(pointer) for key, pointer in unique_pointers.items()}
+
+        with ThreadPoolExecutor(
+            max_workers=min(len(unique_pointers), self.max_workers)
+        ) as executor:
+            return dict(
+                zip(unique_pointers, executor.map(self.get_payload, unique_pointers.values()))
+            )
+
+    def resolve_body(
+        self, message_body: str, message_attributes: dict = None, payloads: dict = None
+    ):
+        """
+        Returns the original payload of a message body published by the extended client.
+        Payloads already fetched by get_payloads can be passed as payloads.
+
+        Payloads are returned as str when they are UTF-8 text, and as bytes otherwise, such
+        as binary payloads published as bytes or files.
+        """
+        pointer = parse_message_pointer(message_body)
+        if pointer is not None:
+            payload = (payloads or {}).get((pointer["s3BucketName"], pointer["s3Key"]))
+            if payload is None:
+                payload = self.get_payload(pointer)
+            return _decode_payload(payload)
+
+        codec = get_message_attribute_value(message_attributes, INLINE_COMPRESSION_ATTRIBUTE_NAME)
+        if codec is not None:
+            return _decode_payload(decode_inline_payload(codec, message_body))
+
+        return message_body
+
+    def open_payload(self, message_body: str, message_attributes: dict = None, spool=False):
+        """
+        Returns a binary file object reading the original payload of a message body.
+
+        Offloaded payloads are streamed from the S3 object, decompressing them on the fly,
+        so they are never held in memory as a whole and never cached. With spool set, the
+        payload is first written to a temporary file which is returned memory-mapped, for
+        random access and slicing.
+        """
+        pointer = parse_message_pointer(message_body)
+        if pointer is not None:
+            response = self.s3_client.get_object(
+                Bucket=pointer["s3BucketName"], Key=pointer["s3Key"]
+            )
+            stream = response["Body"]
+            if POINTER_COMPRESSION_KEY in pointer:
+                stream = open_decompressed_stream(pointer[POINTER_COMPRESSION_KEY], stream)
+        else:
+            payload = self.resolve_body(message_body, message_attributes)
+            stream = BytesIO(payload if isinstance(payload, bytes) else payload.encode("utf-8"))
+
+        if not spool:
+            return stream
+
+        with tempfile.TemporaryFile() as spool_file:
+            shutil.copyfileobj(stream, spool_file, DEFAULT_CHUNK_SIZE)
+            stream.close()
+            if spool_file.tell() == 0:
+                # empty files cannot be memory-mapped
+                return BytesIO()
+            spool_file.flush()
+            # the mapping stays valid once the temporary file is closed and removed
+            return mmap.mmap(spool_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def iter_payload(
+        self,
+        message_body: str,
+        message_attributes: dict = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ):
+        """Yields the original payload of a message body in chunks of at most chunk_size bytes"""
+        stream = self.open_payload(message_body, message_attributes)
+        try:
+            for chunk in iter(lambda: stream.read(chunk_size), b""):
+                yield chunk
+        finally:
+            stream.close()
+
+    def resolve_message(self, message: dict, payloads: dict = None) -> dict:
+        """
+        Returns a copy of an SQS message, as returned by receive_message, with its payload
+        resolved. Raw deliveries get their Body replaced, SNS envelopes keep their envelope
+        and get its Message replaced, base64 encoded with a ``"MessageEncoding": "base64"``
+        field when the payload is binary.
+        """
+        message = dict(message)
+        envelope = parse_sns_envelope(message.get("Body"))
+        if envelope is None:
+            message["Body"] = self.resolve_body(
+                message["Body"], message.get("MessageAttributes"), payloads
+            )
+            return message
+
+        _set_envelope_message(
+            envelope,
+            self.resolve_body(envelope["Message"], envelope.get("MessageAttributes"), payloads),
+        )
+        message["Body"] = dumps(envelope)
+        return message
+
+    def resolve_messages(self, messages: list) -> list:
+        """
+        Resolves a batch of SQS messages, as returned by receive_message. The payloads of
+        all the pointer messages are fetched concurrently and the resolved messages are
+        returned in their original order.
+        """
+        pointers = []
+        for message in messages:
+            pointer, _ = _get_sqs_message_pointer(message)
+            if pointer is not None:
+                pointers.append(pointer)
+
+        payloads = self.get_payloads(pointers)
+        return [self.resolve_message(message, payloads) for message in messages]
+
+    def prefetch_messages(
+        self,
+        messages,
+        depth: int = DEFAULT_PREFETCH_DEPTH,
+        max_prefetch_bytes: int = None,
+    ):
+        """
+        Yields the SQS messages of an iterable, resolved and in order, while the payloads of
+        the next depth messages are downloaded in the background.
+
+        Prefetched payloads which are not consumed yet are limited to max_prefetch_bytes,
+        based on the size announced by their reserved attribute. A payload larger than the
+        budget is still fetched when nothing else is prefetched. Up to depth messages are
+        read ahead from messages.
+        """
+        if not isinstance(depth, int) or depth <= 0:
+            raise ValueError(f"depth must be a positive int: {depth}")
+
+        messages = iter(messages)
+        # entries are [message, pointer, payload_size, future] lists, in message order
+        window = deque()
+        prefetched_bytes = 0
+        executor = ThreadPoolExecutor(max_workers=depth)
+        try:
+            while True:
+                while len(window) <= depth:
+                    message = next(messages, None)
+                    if message is None:
+                        break
+                    pointer, message_attributes = _get_sqs_message_pointer(message)
+                    window.append([message, pointer, _get_payload_size(message_attributes), None])
+
+                if not window:
+                    return
+
+                for entry in window:
+                    if entry[1] is None or entry[3] is not None:
+                        continue
+                    if (
+                        max_prefetch_bytes is not None
+                        and prefetched_bytes
+                        and prefetched_bytes + entry[2] > max_prefetch_bytes
+                    ):
+                        break
+                    entry[3] = executor.submit(self.get_payload, entry[1])
+                    prefetched_bytes += entry[2]
+
+                message, pointer, payload_size, future = window.popleft()
+                payloads = {}
+                if future is not None:
+                    payloads[(pointer["s3BucketName"], pointer["s3Key"])] = future.result()
+                    prefetched_bytes -= payload_size
+                yield self.resolve_message(message, payloads)
+        finally:
+            for entry in window:
+                if entry[3] is not None:
+                    entry[3].cancel()
+            executor.shutdown(wait=False)
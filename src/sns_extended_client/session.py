@@ -1,7 +1,19 @@
+import io
+import os
+import threading
+from base64 import b64encode
+from bisect import bisect_right
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from hashlib import sha256
 from json import dumps, loads
+from time import monotonic, perf_counter
 from uuid import uuid4
 
 import boto3
+from botocore.exceptions import ClientError
 
 import botocore.session
 
@@ -9,16 +21,373 @@ import logging
 logger = logging.getLogger("sns_extended_client.client")
 logger.setLevel(logging.WARNING)
 
+from .cache import LRUCache
+from .compression import (
+    check_compression_codec,
+    compress_payload,
+    compress_payload_up_to,
+)
 from .exceptions import MissingPayloadOffloadingResource, SNSExtendedClientException
+from .metrics import (
+    PREPARE_STAGE,
+    S3_UPLOAD_STAGE,
+    SIZE_CHECK_STAGE,
+    SNS_PUBLISH_STAGE,
+    Histogram,
+    MetricsHook,
+    measure_stage,
+)
 
 DEFAULT_MESSAGE_SIZE_THRESHOLD = 262144
 MESSAGE_POINTER_CLASS = "software.amazon.payloadoffloading.PayloadS3Pointer"
 LEGACY_MESSAGE_POINTER_CLASS = "com.amazon.sqs.javamessaging.MessageS3Pointer"
 LEGACY_RESERVED_ATTRIBUTE_NAME = "SQSLargePayloadSize"
 RESERVED_ATTRIBUTE_NAME = "ExtendedPayloadSize"
+INLINE_COMPRESSION_ATTRIBUTE_NAME = "ExtendedPayloadCompression"
 S3_KEY_ATTRIBUTE_NAME = "S3Key"
+POINTER_COMPRESSION_KEY = "compression"  # codec of a compressed payload, absent otherwise
 MULTIPLE_PROTOCOL_MESSAGE_STRUCTURE = "json"
 MAX_ALLOWED_ATTRIBUTES = 10 - 1  # 10 for SQS and 1 reserved attribute
+DEFAULT_WARM_UP_CONNECTIONS = 1
+MAX_BATCH_ENTRIES = 10  # maximum number of entries in a single publish_batch request
+UPLOADED_PAYLOADS_CACHE_SIZE = 1024  # content addressed keys remembered as already uploaded
+# seconds a content addressed key is remembered as uploaded, well under the lifetime of a
+# payload expired by an S3 lifecycle rule, which is at least a day
+UPLOADED_PAYLOADS_TTL = 60 * 60
+DIGEST_CHUNK_SIZE = 1024 * 1024
+HASHED_KEY_PREFIX_LENGTH = 4  # hex characters of the key digest prefixed by the hashed layout
+UUID_KEY_LAYOUT = "uuid"  # bare keys
+HASHED_KEY_LAYOUT = "hashed"  # <4 hex characters of the key digest>/<key>
+DATE_KEY_LAYOUT = "date"  # <UTC year>/<month>/<day>/<key>
+TOPIC_KEY_LAYOUT = "topic"  # <topic name>/<key>
+S3_KEY_LAYOUTS = (UUID_KEY_LAYOUT, HASHED_KEY_LAYOUT, DATE_KEY_LAYOUT, TOPIC_KEY_LAYOUT)
+HEDGING_LATENCY_SAMPLES = 256  # recent upload latencies of a size class the delay is computed from
+HEDGING_MIN_SAMPLES = 20  # uploads of a size class observed before any of them is hedged
+HEDGING_MAX_WORKERS = 64  # threads of a client shared by its concurrent hedged uploads
+
+# ARN of the topic or target of the publish call in progress, used by the topic key layout
+_publish_target_arn = ContextVar("sns_extended_client_publish_target_arn", default=None)
+
+
+class _BufferReader(io.RawIOBase):
+    """Seekable, read-only file object over a bytes-like payload which streams it without copying"""
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._buffer = memoryview(buffer).cast("B")
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        chunk = self._buffer[self._position : self._position + len(b)]
+        size = len(chunk)
+        b[:size] = chunk
+        self._position += size
+        return size
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._buffer)
+        self._position = max(offset, 0)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+
+def _is_file_like(message_body):
+    return hasattr(message_body, "read") and hasattr(message_body, "seek")
+
+
+def _get_encoded_body(message_body):
+    """
+    Returns the payload to measure and upload for a Message.
+
+    str bodies are UTF-8 encoded, bytes-like bodies and seekable file objects are
+    returned as they are so that large payloads are never copied in memory.
+    """
+    if isinstance(message_body, str):
+        return message_body.encode()
+    if isinstance(message_body, (bytes, bytearray)) or _is_file_like(message_body):
+        return message_body
+    if isinstance(message_body, memoryview):
+        return message_body.cast("B")
+    raise TypeError(f"Message of type {type(message_body).__name__} is not supported")
+
+
+def _delete_payload_compression(self):
+    setattr(self, "__payload_compression", None)
+
+
+def _get_payload_compression(self):
+    return getattr(self, "__payload_compression", None)
+
+
+def _set_payload_compression(self, payload_compression: str):
+    if payload_compression is not None:
+        check_compression_codec(payload_compression)
+
+    setattr(self, "__payload_compression", payload_compression)
+
+
+def _delete_inline_compression(self):
+    setattr(self, "__inline_compression", None)
+
+
+def _get_inline_compression(self):
+    return getattr(self, "__inline_compression", None)
+
+
+def _set_inline_compression(self, inline_compression: str):
+    if inline_compression is not None:
+        check_compression_codec(inline_compression)
+
+    setattr(self, "__inline_compression", inline_compression)
+
+
+def _delete_content_addressed_keys(self):
+    setattr(self, "__content_addressed_keys", False)
+
+
+def _get_content_addressed_keys(self):
+    return getattr(self, "__content_addressed_keys", False)
+
+
+def _set_content_addressed_keys(self, content_addressed_keys: bool):
+    if not isinstance(content_addressed_keys, bool):
+        raise TypeError(f"Not a Valid boolean value: {content_addressed_keys}")
+    if content_addressed_keys and getattr(self, "__uploaded_payloads", None) is None:
+        setattr(self, "__uploaded_payloads", LRUCache(UPLOADED_PAYLOADS_CACHE_SIZE))
+
+    setattr(self, "__content_addressed_keys", content_addressed_keys)
+
+
+def _delete_check_existing_payload(self):
+    setattr(self, "__check_existing_payload", False)
+
+
+def _get_check_existing_payload(self):
+    return getattr(self, "__check_existing_payload", False)
+
+
+def _set_check_existing_payload(self, check_existing_payload: bool):
+    if not isinstance(check_existing_payload, bool):
+        raise TypeError(f"Not a Valid boolean value: {check_existing_payload}")
+
+    setattr(self, "__check_existing_payload", check_existing_payload)
+
+
+def _delete_hedged_upload_percentile(self):
+    setattr(self, "__hedged_upload_percentile", None)
+
+
+def _get_hedged_upload_percentile(self):
+    return getattr(self, "__hedged_upload_percentile", None)
+
+
+def _set_hedged_upload_percentile(self, hedged_upload_percentile: float):
+    if hedged_upload_percentile is not None:
+        if isinstance(hedged_upload_percentile, bool) or not isinstance(
+            hedged_upload_percentile, (int, float)
+        ):
+            raise TypeError(f"Not a valid percentile: {hedged_upload_percentile}")
+        if not 0 < hedged_upload_percentile < 100:
+            raise ValueError(
+                f"hedged_upload_percentile must be between 0 and 100: {hedged_upload_percentile}"
+            )
+        if getattr(self, "__upload_latencies", None) is None:
+            # latency histograms by size class, see _get_upload_latencies
+            setattr(self, "__upload_latencies", {})
+        if getattr(self, "__abandoned_uploads", None) is None:
+            # running puts of hedged uploads which lost, by (bucket, key)
+            setattr(self, "__abandoned_uploads", {})
+        if getattr(self, "__hedging_executor", None) is None:
+            setattr(
+                self,
+                "__hedging_executor",
+                ThreadPoolExecutor(
+                    max_workers=HEDGING_MAX_WORKERS, thread_name_prefix="SNSExtendedClientHedging"
+                ),
+            )
+
+    setattr(self, "__hedged_upload_percentile", hedged_upload_percentile)
+
+
+def _delete_s3_key_layout(self):
+    setattr(self, "__s3_key_layout", UUID_KEY_LAYOUT)
+
+
+def _get_s3_key_layout(self):
+    return getattr(self, "__s3_key_layout", UUID_KEY_LAYOUT)
+
+
+def _set_s3_key_layout(self, s3_key_layout):
+    if s3_key_layout not in S3_KEY_LAYOUTS and not callable(s3_key_layout):
+        raise ValueError(f"Unsupported S3 key layout {s3_key_layout}, use one of {S3_KEY_LAYOUTS}")
+
+    setattr(self, "__s3_key_layout", s3_key_layout)
+
+
+def _delete_payload_buckets(self):
+    setattr(self, "__payload_buckets", None)
+    setattr(self, "__payload_bucket_routes", None)
+
+
+def _get_payload_buckets(self):
+    return getattr(self, "__payload_buckets", None)
+
+
+def _set_payload_buckets(self, payload_buckets):
+    if payload_buckets is None:
+        _delete_payload_buckets(self)
+        return
+
+    weights = (
+        dict(payload_buckets)
+        if isinstance(payload_buckets, dict)
+        else {bucket_name: 1 for bucket_name in payload_buckets}
+    )
+    if not weights:
+        raise ValueError("payload_buckets must name at least one bucket.")
+    for bucket_name, weight in weights.items():
+        if not isinstance(bucket_name, str) or not bucket_name:
+            raise TypeError(f"Not a valid bucket name: {bucket_name}")
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)) or weight <= 0:
+            raise ValueError(f"Bucket weights must be positive numbers: {weight}")
+
+    # cumulative weights, in bucket order, to pick a bucket from a point of [0, total)
+    cumulative_weights = []
+    total = 0
+    for weight in weights.values():
+        total += weight
+        cumulative_weights.append(total)
+
+    setattr(self, "__payload_buckets", weights)
+    setattr(self, "__payload_bucket_routes", (list(weights), cumulative_weights))
+
+
+def _get_payload_digest(encoded_body):
+    """Returns the hex SHA-256 digest of a payload returned by _get_encoded_body"""
+    digest = sha256()
+    if _is_file_like(encoded_body):
+        position = encoded_body.tell()
+        for chunk in iter(lambda: encoded_body.read(DIGEST_CHUNK_SIZE), b""):
+            digest.update(chunk)
+        encoded_body.seek(position)
+    else:
+        digest.update(encoded_body)
+    return digest.hexdigest()
+
+
+def _delete_payload_deleter(self):
+    setattr(self, "__payload_deleter", None)
+
+
+def _get_payload_deleter(self):
+    return getattr(self, "__payload_deleter", None)
+
+
+def _set_payload_deleter(self, payload_deleter):
+    from .deleter import PayloadDeleter
+
+    if payload_deleter is not None and not isinstance(payload_deleter, PayloadDeleter):
+        raise TypeError(f"Not a valid PayloadDeleter: {payload_deleter}")
+
+    setattr(self, "__payload_deleter", payload_deleter)
+
+
+def _delete_payload_process_pool(self):
+    setattr(self, "__payload_process_pool", None)
+
+
+def _get_payload_process_pool(self):
+    return getattr(self, "__payload_process_pool", None)
+
+
+def _set_payload_process_pool(self, payload_process_pool):
+    from concurrent.futures import ProcessPoolExecutor
+
+    from .processing import shared_memory
+
+    if payload_process_pool is not None:
+        if not isinstance(payload_process_pool, ProcessPoolExecutor):
+            raise TypeError(f"Not a valid ProcessPoolExecutor: {payload_process_pool}")
+        if shared_memory is None:
+            raise SNSExtendedClientException(
+                "payload_process_pool requires multiprocessing.shared_memory (Python 3.8+)."
+            )
+
+    setattr(self, "__payload_process_pool", payload_process_pool)
+
+
+def _delete_metrics_hook(self):
+    setattr(self, "__metrics_hook", None)
+
+
+def _get_metrics_hook(self):
+    return getattr(self, "__metrics_hook", None)
+
+
+def _set_metrics_hook(self, metrics_hook):
+    if metrics_hook is not None and not isinstance(metrics_hook, MetricsHook):
+        raise TypeError(f"Not a valid MetricsHook: {metrics_hook}")
+
+    setattr(self, "__metrics_hook", metrics_hook)
+
+
+def _delete_s3_client(self):
+    setattr(self, "__s3_client", None)
+
+
+def _get_s3_client(self):
+    s3_client = getattr(self, "__s3_client", None)
+    if s3_client is None:
+        # created on first use and shared by every SNS client and resource of the session
+        s3_client = self._lazy_s3_client.get()
+    return s3_client
+
+
+def _set_s3_client(self, s3_client):
+    setattr(self, "__s3_client", s3_client)
+
+
+def _get_string_size(value: str):
+    # ASCII strings are encoded with one byte per character, so they need no encoding
+    return len(value) if value.isascii() else len(value.encode())
+
+
+def _get_payload_size(encoded_body):
+    """Returns the size in bytes of a Message or of a payload returned by _get_encoded_body"""
+    if isinstance(encoded_body, str):
+        return _get_string_size(encoded_body)
+    if isinstance(encoded_body, memoryview):
+        return encoded_body.nbytes
+    if not _is_file_like(encoded_body):
+        return len(encoded_body)
+
+    position = encoded_body.tell()
+    try:
+        return os.fstat(encoded_body.fileno()).st_size - position
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        size = encoded_body.seek(0, io.SEEK_END) - position
+        encoded_body.seek(position)
+        return size
+
+
+def _decode_message_body(message_body):
+    """Returns the str form of a Message which is published inline"""
+    if isinstance(message_body, str):
+        return message_body
+    if _is_file_like(message_body):
+        message_body = message_body.read()
+    return str(message_body, "utf-8")
 
 
 def _delete_large_payload_support(self):
@@ -89,32 +458,57 @@ def _set_use_legacy_attribute(self, use_legacy_attribute: bool):
     setattr(self, "__use_legacy_attribute", use_legacy_attribute)
 
 
-def _is_large_message(self, attributes: dict, encoded_body: bytes):
-    total = 0
-    for key, value in attributes.items():
-        total = total + len(key.encode())
-        if "DataType" in value:
-            total = total + len(value["DataType"].encode())
-        if "StringValue" in value:
-            total = total + len(value["StringValue"].encode())
-        if "BinaryValue" in value:
-            total = total + len(value["BinaryValue"])
-    total = total + len(encoded_body)
-    return self.message_size_threshold < total
-
-
-def _check_size_of_message_attributes(self, message_attributes: dict):
-    total = 0
-    for key, value in message_attributes.items():
-        total = total + len(key.encode())
-        if "DataType" in value:
-            total = total + len(value["DataType"].encode())
-        if "StringValue" in value:
-            total = total + len(value["StringValue"].encode())
-        if "BinaryValue" in value:
-            total = total + len(value["BinaryValue"])
-
-    if total > self.message_size_threshold:
+def _delete_s3_transfer_config(self):
+    setattr(self, "__s3_transfer_config", None)
+
+
+def _get_s3_transfer_config(self):
+    return getattr(self, "__s3_transfer_config", None)
+
+
+def _set_s3_transfer_config(self, s3_transfer_config):
+    # s3transfer is only imported by the clients which configure multipart uploads
+    from boto3.s3.transfer import TransferConfig
+
+    if s3_transfer_config is not None and not isinstance(s3_transfer_config, TransferConfig):
+        raise TypeError(f"Not a valid TransferConfig: {s3_transfer_config}")
+
+    setattr(self, "__s3_transfer_config", s3_transfer_config)
+
+
+def _get_message_attribute_size(name: str, value: dict):
+    size = _get_string_size(name)
+    if "DataType" in value:
+        size = size + _get_string_size(value["DataType"])
+    if "StringValue" in value:
+        size = size + _get_string_size(value["StringValue"])
+    if "BinaryValue" in value:
+        size = size + len(value["BinaryValue"])
+    return size
+
+
+def _get_message_size(self, message_attributes: dict, message_body):
+    """
+    Measures a message in a single pass.
+
+    Returns a tuple of (attributes_size, body_size) in bytes, which is shared by the
+    offloading decision and the message attributes size check.
+    """
+    attributes_size = 0
+    for name, value in message_attributes.items():
+        attributes_size = attributes_size + _get_message_attribute_size(name, value)
+    return attributes_size, _get_payload_size(message_body)
+
+
+def _is_large_message(self, attributes: dict, encoded_body):
+    return self.message_size_threshold < sum(self._get_message_size(attributes, encoded_body))
+
+
+def _check_size_of_message_attributes(self, message_attributes: dict, attributes_size=None):
+    if attributes_size is None:
+        attributes_size, _ = self._get_message_size(message_attributes, b"")
+
+    if attributes_size > self.message_size_threshold:
         raise SNSExtendedClientException(
             f"Message attributes size is greater than the message size threshold: {self.message_size_threshold} consider including payload in the message body"
         )
@@ -128,37 +522,184 @@ def _check_message_attributes(self, message_attributes: dict):
         raise SNSExtendedClientException(error_message)
 
 
-def _get_s3_key(self, message_attributes: dict):
+def _check_reserved_message_attributes(self, message_attributes: dict):
+    for attribute in (
+        RESERVED_ATTRIBUTE_NAME,
+        LEGACY_RESERVED_ATTRIBUTE_NAME,
+        INLINE_COMPRESSION_ATTRIBUTE_NAME,
+    ):
+        if attribute in message_attributes:
+            raise SNSExtendedClientException(
+                f"Message attribute name {attribute} is reserved for use by SNS extended client."
+            )
+
+
+def _make_inline_compressed_payload(
+    self, message_attributes: dict, message_body, attributes_size: int
+):
+    """
+    Compresses and base64 encodes a large message body so that it can be published inline.
+
+    Returns the (message_attributes, message_body) to publish, or None when the message
+    cannot be published inline and must go through S3 instead.
+    """
+    if len(message_attributes) > MAX_ALLOWED_ATTRIBUTES:
+        return None
+
+    self._check_reserved_message_attributes(message_attributes)
+
+    compression_attribute_value = {"DataType": "String", "StringValue": self.inline_compression}
+    attributes_size = attributes_size + _get_message_attribute_size(
+        INLINE_COMPRESSION_ATTRIBUTE_NAME, compression_attribute_value
+    )
+    # base64 encodes every 3 bytes as 4 characters, so the compressed body must fit in 3/4
+    # of the room left by the attributes: the compression gives up once it outgrows that,
+    # rather than compressing a large payload in full to find out it does not fit
+    max_compressed_size = (self.message_size_threshold - attributes_size) // 4 * 3
+    if max_compressed_size <= 0:
+        return None
+
+    encoded_body = _get_encoded_body(message_body)
+    # a file body is read by the compression, and must still be readable from its
+    # original position when it goes through S3 after all
+    position = encoded_body.tell() if _is_file_like(encoded_body) else None
+    try:
+        compressed_body = compress_payload_up_to(
+            self.inline_compression, encoded_body, max_compressed_size
+        )
+    finally:
+        if position is not None:
+            encoded_body.seek(position)
+    if compressed_body is None:
+        return None
+    compressed_body = b64encode(compressed_body).decode("ascii")
+
+    message_attributes = dict(message_attributes)
+    message_attributes[INLINE_COMPRESSION_ATTRIBUTE_NAME] = compression_attribute_value
+    return message_attributes, compressed_body
+
+
+def _get_s3_key(self, message_attributes: dict, encoded_body=None, payload_digest: str = None):
     if S3_KEY_ATTRIBUTE_NAME in message_attributes:
         return message_attributes[S3_KEY_ATTRIBUTE_NAME]["StringValue"]
-    return str(uuid4())
+    if self.content_addressed_keys and payload_digest is not None:
+        s3_key = payload_digest
+    elif self.content_addressed_keys and encoded_body is not None:
+        s3_key = _get_payload_digest(encoded_body)
+    else:
+        s3_key = str(uuid4())
+
+    s3_key_layout = self.s3_key_layout
+    if s3_key_layout == UUID_KEY_LAYOUT:
+        return s3_key
+    if s3_key_layout == HASHED_KEY_LAYOUT:
+        return f"{sha256(s3_key.encode()).hexdigest()[:HASHED_KEY_PREFIX_LENGTH]}/{s3_key}"
+    if s3_key_layout == DATE_KEY_LAYOUT:
+        return f"{datetime.now(timezone.utc):%Y/%m/%d}/{s3_key}"
+
+    target_arn = _publish_target_arn.get()
+    if s3_key_layout == TOPIC_KEY_LAYOUT:
+        return f"{target_arn.rsplit(':', 1)[-1]}/{s3_key}" if target_arn else s3_key
+    return s3_key_layout(s3_key, target_arn)
+
+
+def _get_s3_bucket_name(self, s3_key: str):
+    """
+    Returns the bucket storing the payload of an S3 key: large_payload_support, or a
+    bucket of payload_buckets picked by weight from the digest of the key, so that a key
+    is always routed to the same bucket.
+    """
+    payload_bucket_routes = getattr(self, "__payload_bucket_routes", None)
+    if payload_bucket_routes is None:
+        return self.large_payload_support
+
+    bucket_names, cumulative_weights = payload_bucket_routes
+    point = int(sha256(s3_key.encode()).hexdigest()[:16], 16) / 2**64 * cumulative_weights[-1]
+    return bucket_names[min(bisect_right(cumulative_weights, point), len(bucket_names) - 1)]
+
+
+@contextmanager
+def _publishing_to(target_arn: str):
+    """Makes target_arn the publish target seen by the topic key layout"""
+    token = _publish_target_arn.set(target_arn)
+    try:
+        yield
+    finally:
+        _publish_target_arn.reset(token)
 
 
 def _create_reserved_message_attribute_value(self, encoded_body_size_string):
     return {"DataType": "Number", "StringValue": encoded_body_size_string}
 
 
-def _make_payload(self, message_attributes: dict, message_body, message_structure: str):
-    message_attributes = loads(dumps(message_attributes))
-    encoded_body = message_body.encode()
-    if self.large_payload_support and (
-        self.always_through_s3 or self._is_large_message(message_attributes, encoded_body)
+def _prepare_payload(self, message_attributes: dict, message_body, message_structure: str):
+    """
+    Builds the message attributes and body to publish without touching S3.
+
+    Returns a tuple of (message_attributes, message_body, offloaded_payload) where
+    offloaded_payload is None for messages published inline or whose payload is already
+    stored, or a (s3_key, encoded_body, content_addressed, s3_bucket_name) tuple describing
+    the object that must be stored before the message is published.
+    """
+    # non-ASCII str bodies are encoded once, here, rather than once to be measured and
+    # again to be stored; small ones are decoded back when published inline
+    if isinstance(message_body, str) and not message_body.isascii():
+        message_body = message_body.encode()
+
+    metrics_hook = self.metrics_hook
+    if metrics_hook is None:
+        return self._build_payload(message_attributes, message_body, message_structure)
+
+    payload_size = _get_payload_size(
+        message_body if isinstance(message_body, str) else _get_encoded_body(message_body)
+    )
+    with measure_stage(metrics_hook, PREPARE_STAGE):
+        prepared_payload = self._build_payload(
+            message_attributes, message_body, message_structure, metrics_hook
+        )
+
+    message_attributes, message_body, offloaded_payload = prepared_payload
+    offloaded = any(
+        name in message_attributes
+        for name in (RESERVED_ATTRIBUTE_NAME, LEGACY_RESERVED_ATTRIBUTE_NAME)
+    )
+    s3_key = None
+    if offloaded:
+        s3_key = offloaded_payload[0] if offloaded_payload else loads(message_body)[1]["s3Key"]
+    metrics_hook.record_message(payload_size, offloaded, s3_key)
+    return prepared_payload
+
+
+def _build_payload(
+    self, message_attributes: dict, message_body, message_structure: str, metrics_hook=None
+):
+    if metrics_hook is None:
+        attributes_size, body_size = self._get_message_size(message_attributes, message_body)
+    else:
+        with measure_stage(metrics_hook, SIZE_CHECK_STAGE):
+            attributes_size, body_size = self._get_message_size(message_attributes, message_body)
+    is_large_message = self.message_size_threshold < attributes_size + body_size
+
+    if (
+        is_large_message
+        and self.inline_compression is not None
+        and not self.always_through_s3
+        and message_structure != "json"
     ):
+        inline_payload = self._make_inline_compressed_payload(
+            message_attributes, message_body, attributes_size
+        )
+        if inline_payload is not None:
+            return inline_payload + (None,)
+
+    if self.large_payload_support and (self.always_through_s3 or is_large_message):
         if message_structure == "json":
             raise SNSExtendedClientException(
                 "SNS extended client does not support sending JSON messages."
             )
 
         self._check_message_attributes(message_attributes)
-
-        for attribute in (
-            RESERVED_ATTRIBUTE_NAME,
-            LEGACY_RESERVED_ATTRIBUTE_NAME,
-        ):
-            if attribute in message_attributes:
-                raise SNSExtendedClientException(
-                    f"Message attribute name {attribute} is reserved for use by SNS extended client."
-                )
+        self._check_reserved_message_attributes(message_attributes)
 
         message_pointer_used = (
             LEGACY_MESSAGE_POINTER_CLASS if self.use_legacy_attribute else MESSAGE_POINTER_CLASS
@@ -168,26 +709,408 @@ def _make_payload(self, message_attributes: dict, message_body, message_structur
             LEGACY_RESERVED_ATTRIBUTE_NAME if self.use_legacy_attribute else RESERVED_ATTRIBUTE_NAME
         )
 
-        message_attributes[attribute_name_used] = self._create_reserved_message_attribute_value(
-            str(len(encoded_body))
+        reserved_attribute_value = self._create_reserved_message_attribute_value(str(body_size))
+        # copy the caller's attributes only when the reserved attribute is added to them
+        message_attributes = dict(message_attributes)
+        message_attributes[attribute_name_used] = reserved_attribute_value
+        attributes_size = attributes_size + _get_message_attribute_size(
+            attribute_name_used, reserved_attribute_value
         )
 
-        self._check_size_of_message_attributes(message_attributes)
+        self._check_size_of_message_attributes(message_attributes, attributes_size)
 
-        s3_key = self._get_s3_key(message_attributes)
+        content_addressed = (
+            self.content_addressed_keys and S3_KEY_ATTRIBUTE_NAME not in message_attributes
+        )
+        # the reserved attribute keeps reporting the size of the uncompressed payload
+        encoded_body, payload_digest = self._prepare_encoded_body(
+            _get_encoded_body(message_body), content_addressed
+        )
 
-        self.s3_client.put_object(Bucket=self.large_payload_support, Key=s3_key, Body=encoded_body)
+        s3_key = self._get_s3_key(message_attributes, encoded_body, payload_digest)
+        s3_bucket_name = self._get_s3_bucket_name(s3_key)
 
-        message_body = dumps(
-            [
-                message_pointer_used,
-                {"s3BucketName": self.large_payload_support, "s3Key": s3_key},
-            ]
+        message_pointer = {"s3BucketName": s3_bucket_name, "s3Key": s3_key}
+        if self.payload_compression is not None:
+            message_pointer[POINTER_COMPRESSION_KEY] = self.payload_compression
+        message_body = dumps([message_pointer_used, message_pointer])
+
+        if content_addressed and _is_uploaded_payload(self, s3_bucket_name, s3_key):
+            return message_attributes, message_body, None
+
+        return (
+            message_attributes,
+            message_body,
+            (s3_key, encoded_body, content_addressed, s3_bucket_name),
+        )
+
+    return message_attributes, _decode_message_body(message_body), None
+
+
+def _prepare_encoded_body(self, encoded_body, compute_digest: bool):
+    """
+    Returns (encoded_body, payload_digest) for a payload returned by _get_encoded_body:
+    the payload compressed with payload_compression, if any, and, when compute_digest is
+    set and payload_process_pool is used, its digest (None otherwise, left to _get_s3_key).
+
+    Bytes-like payloads of at least PROCESS_POOL_MIN_PAYLOAD_SIZE bytes are compressed and
+    hashed in payload_process_pool, when set, so that this CPU work runs outside of the GIL
+    of the publishing process.
+    """
+    from .processing import PROCESS_POOL_MIN_PAYLOAD_SIZE, prepare_body_in_process
+
+    process_pool = self.payload_process_pool
+    if (
+        process_pool is not None
+        and (self.payload_compression is not None or compute_digest)
+        and not _is_file_like(encoded_body)
+        and _get_payload_size(encoded_body) >= PROCESS_POOL_MIN_PAYLOAD_SIZE
+    ):
+        return prepare_body_in_process(
+            process_pool, encoded_body, self.payload_compression, compute_digest
+        )
+
+    if self.payload_compression is not None:
+        encoded_body = compress_payload(self.payload_compression, encoded_body)
+    return encoded_body, None
+
+
+def _payload_exists(self, s3_key: str, s3_bucket_name: str = None):
+    try:
+        self.s3_client.head_object(Bucket=s3_bucket_name or self.large_payload_support, Key=s3_key)
+    except ClientError as error:
+        if error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+    return True
+
+
+def _store_payload(
+    self,
+    s3_key: str,
+    encoded_body,
+    content_addressed: bool = False,
+    s3_bucket_name: str = None,
+):
+    s3_bucket_name = s3_bucket_name or self.large_payload_support
+    if not (
+        content_addressed
+        and self.check_existing_payload
+        and self._payload_exists(s3_key, s3_bucket_name)
+    ):
+        metrics_hook = self.metrics_hook
+        if metrics_hook is None:
+            self._upload_payload(s3_key, encoded_body, s3_bucket_name)
+        else:
+            with measure_stage(metrics_hook, S3_UPLOAD_STAGE):
+                self._upload_payload(s3_key, encoded_body, s3_bucket_name)
+
+    if content_addressed:
+        _remember_uploaded_payload(self, s3_bucket_name, s3_key)
+
+
+def _is_uploaded_payload(self, s3_bucket_name: str, s3_key: str) -> bool:
+    """
+    Returns whether a content addressed payload was stored by the client less than
+    UPLOADED_PAYLOADS_TTL seconds ago, in which case its upload is skipped. The payload is
+    assumed to still be in S3: payloads deleted sooner, by consumers or short lifecycle
+    rules, are not noticed.
+    """
+    expiry = getattr(self, "__uploaded_payloads").get((s3_bucket_name, s3_key))
+    return expiry is not None and monotonic() < expiry
+
+
+def _remember_uploaded_payload(self, s3_bucket_name: str, s3_key: str):
+    getattr(self, "__uploaded_payloads").put(
+        (s3_bucket_name, s3_key), monotonic() + UPLOADED_PAYLOADS_TTL
+    )
+
+
+def _upload_payload(self, s3_key: str, encoded_body, s3_bucket_name: str = None):
+    s3_bucket_name = s3_bucket_name or self.large_payload_support
+    transfer_config = self.s3_transfer_config
+    if (
+        transfer_config is not None
+        and _get_payload_size(encoded_body) >= transfer_config.multipart_threshold
+    ):
+        # large bodies are split into parts which are uploaded concurrently
+        self.s3_client.upload_fileobj(
+            encoded_body if _is_file_like(encoded_body) else _BufferReader(encoded_body),
+            s3_bucket_name,
+            s3_key,
+            Config=transfer_config,
         )
+        return
+
+    if self.hedged_upload_percentile is not None and not _is_file_like(encoded_body):
+        self._put_payload_hedged(s3_key, encoded_body, s3_bucket_name)
+        return
+
+    self._put_payload(s3_key, encoded_body, s3_bucket_name)
+
+
+def _put_payload(self, s3_key: str, encoded_body, s3_bucket_name: str = None):
+    if isinstance(encoded_body, memoryview):
+        encoded_body = _BufferReader(encoded_body)
+    self.s3_client.put_object(
+        Bucket=s3_bucket_name or self.large_payload_support, Key=s3_key, Body=encoded_body
+    )
+
+
+def _timed_put_payload(self, s3_key: str, encoded_body, s3_bucket_name: str = None):
+    start = perf_counter()
+    self._put_payload(s3_key, encoded_body, s3_bucket_name)
+    return perf_counter() - start
+
+
+def _get_upload_latencies(self, payload_size: int) -> Histogram:
+    """
+    Returns the Histogram of the recent latencies of the uploads of about payload_size
+    bytes: payloads are grouped by the bit length of their size, within a factor of 2
+    """
+    upload_latencies = getattr(self, "__upload_latencies")
+    size_class = payload_size.bit_length()
+    histogram = upload_latencies.get(size_class)
+    if histogram is None:
+        histogram = upload_latencies.setdefault(size_class, Histogram(HEDGING_LATENCY_SAMPLES))
+    return histogram
+
+
+def _put_payload_hedged(self, s3_key: str, encoded_body, s3_bucket_name: str = None):
+    """
+    Stores a bytes-like payload with put_object, starting a second identical put_object
+    when the first one has not completed within the hedged_upload_percentile of the recent
+    latencies of uploads of similar size. The first put to succeed wins and the other one
+    is abandoned: it keeps running until it completes, and the deletion of the payload is
+    deferred until then, see _schedule_payload_deletion.
+    """
+    upload_latencies = self._get_upload_latencies(_get_payload_size(encoded_body))
+    if upload_latencies.count < HEDGING_MIN_SAMPLES:
+        # the upload cannot be hedged yet, and runs on the calling thread
+        upload_latencies.observe(self._timed_put_payload(s3_key, encoded_body, s3_bucket_name))
+        return
+
+    if isinstance(encoded_body, (bytearray, memoryview)):
+        # an abandoned put may outlive the call, and must not read a buffer of the caller
+        encoded_body = bytes(encoded_body)
+    hedging_delay = upload_latencies.percentile(self.hedged_upload_percentile)
+    executor = getattr(self, "__hedging_executor")
+    pending = {executor.submit(self._timed_put_payload, s3_key, encoded_body, s3_bucket_name)}
+    done, pending = wait(pending, timeout=hedging_delay)
+    if not done:
+        metrics_hook = self.metrics_hook
+        if metrics_hook is not None:
+            metrics_hook.record_hedged_upload(s3_key)
+        pending.add(executor.submit(self._timed_put_payload, s3_key, encoded_body, s3_bucket_name))
+    else:
+        pending = done
+
+    while True:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                upload_latencies.observe(future.result())
+                for loser in pending:
+                    self._abandon_upload(
+                        s3_bucket_name or self.large_payload_support, s3_key, loser
+                    )
+                return
+        if not pending:
+            # both puts failed, the error of the last one is raised
+            raise future.exception()
+
+
+def _abandon_upload(self, s3_bucket_name: str, s3_key: str, upload: Future):
+    """Tracks the put of a payload which lost a hedged upload until it completes"""
+    abandoned_uploads = getattr(self, "__abandoned_uploads")
+    abandoned_uploads[(s3_bucket_name, s3_key)] = upload
+    upload.add_done_callback(lambda _: abandoned_uploads.pop((s3_bucket_name, s3_key), None))
+
+
+def _is_access_denied(error: ClientError) -> bool:
+    status_code = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    code = error.response.get("Error", {}).get("Code")
+    return status_code == 403 or code in ("403", "AccessDenied", "Forbidden")
+
+
+def _head_bucket(s3_client, bucket_name: str):
+    try:
+        s3_client.head_bucket(Bucket=bucket_name)
+    except ClientError as error:
+        # head_bucket requires s3:ListBucket, which publishers only storing payloads may
+        # lack: the connection is open all the same
+        if not _is_access_denied(error):
+            raise
+
+
+def warm_up(self, connections: int = DEFAULT_WARM_UP_CONNECTIONS):
+    """
+    Opens up to connections connections to each payload bucket ahead of the first
+    offloaded message, with concurrent head_bucket calls, so that publishing it does not
+    pay for the S3 client creation, credential resolution and TLS handshakes. Access
+    denied errors, raised without the s3:ListBucket permission, are ignored.
+    """
+    if not self.large_payload_support:
+        raise MissingPayloadOffloadingResource()
+    if not isinstance(connections, int) or connections <= 0:
+        raise ValueError(f"connections must be a positive int: {connections}")
+
+    s3_client = self.s3_client
+    bucket_names = list(self.payload_buckets or [self.large_payload_support]) * connections
+    if len(bucket_names) == 1:
+        _head_bucket(s3_client, bucket_names[0])
+        return
+
+    with ThreadPoolExecutor(max_workers=len(bucket_names)) as executor:
+        for _ in executor.map(
+            lambda bucket_name: _head_bucket(s3_client, bucket_name), bucket_names
+        ):
+            pass
+
+
+def _make_payload(self, message_attributes: dict, message_body, message_structure: str):
+    message_attributes, message_body, offloaded_payload = self._prepare_payload(
+        message_attributes, message_body, message_structure
+    )
+    if offloaded_payload is not None:
+        self._store_payload(*offloaded_payload)
 
     return message_attributes, message_body
 
 
+def _make_batch_payloads(self, entries: list):
+    """
+    Runs the payload offloading for every entry of a publish_batch request.
+
+    Entries are prepared one after another, while the S3 uploads of the oversized
+    entries are issued concurrently so that a batch waits for its slowest upload only.
+    """
+    prepared_entries = []
+    offloaded_payloads = []
+    for entry in entries:
+        prepared_entry = dict(entry)
+        (
+            prepared_entry["MessageAttributes"],
+            prepared_entry["Message"],
+            offloaded_payload,
+        ) = self._prepare_payload(
+            entry.get("MessageAttributes", {}),
+            entry["Message"],
+            entry.get("MessageStructure", None),
+        )
+        prepared_entries.append(prepared_entry)
+        if offloaded_payload is not None:
+            offloaded_payloads.append(offloaded_payload)
+
+    self._store_payloads(offloaded_payloads)
+    return prepared_entries
+
+
+def _store_payloads(self, offloaded_payloads: list):
+    """
+    Stores the offloaded payloads returned by _prepare_payload, concurrently. When any
+    upload fails, the payloads stored by the other ones are deleted, as their messages are
+    not published, and the error of the first failed upload is raised.
+    """
+    if len(offloaded_payloads) == 1:
+        self._store_payload(*offloaded_payloads[0])
+    elif offloaded_payloads:
+        with ThreadPoolExecutor(
+            max_workers=min(len(offloaded_payloads), MAX_BATCH_ENTRIES)
+        ) as executor:
+            futures = [
+                executor.submit(self._store_payload, *payload) for payload in offloaded_payloads
+            ]
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            self._delete_stored_payloads(
+                [
+                    payload
+                    for payload, future in zip(offloaded_payloads, futures)
+                    if future.exception() is None
+                ]
+            )
+            raise errors[0]
+
+
+def _schedule_payload_deletion(self, payload_deleter, s3_bucket_name: str, s3_key: str):
+    abandoned_upload = getattr(self, "__abandoned_uploads", {}).get((s3_bucket_name, s3_key))
+    if abandoned_upload is not None:
+        # an abandoned put would store the payload again after its deletion, which is
+        # scheduled once the put completes
+        abandoned_upload.add_done_callback(
+            lambda _: _schedule_payload_deletion(self, payload_deleter, s3_bucket_name, s3_key)
+        )
+        return
+
+    # the deletion is best effort, and must not hide the error of the failed publish
+    try:
+        payload_deleter.add(s3_bucket_name, s3_key)
+    except Exception:
+        logger.warning(
+            "Failed to delete payload %s from bucket %s", s3_key, s3_bucket_name, exc_info=True
+        )
+
+
+def _delete_stored_payloads(self, offloaded_payloads: list):
+    """
+    Schedules, on the payload_deleter, the deletion of offloaded payloads returned by
+    _prepare_payload which were stored for messages which are not published. Payloads
+    stored under a content addressed key may be shared with other messages and are kept.
+    """
+    payload_deleter = self.payload_deleter
+    if payload_deleter is None:
+        return
+
+    for s3_key, _, content_addressed, s3_bucket_name in offloaded_payloads:
+        if not content_addressed:
+            _schedule_payload_deletion(
+                self, payload_deleter, s3_bucket_name or self.large_payload_support, s3_key
+            )
+
+
+def _delete_unpublished_payloads(self, messages: list):
+    """
+    Schedules, on the payload_deleter, the deletion of the payloads stored for messages
+    given as (message_attributes, message_body) which could not be published. Payloads
+    stored under a content addressed key may be shared with other messages and are kept.
+    """
+    payload_deleter = self.payload_deleter
+    if payload_deleter is None:
+        return
+
+    for message_attributes, message_body in messages:
+        if not any(
+            name in message_attributes
+            for name in (RESERVED_ATTRIBUTE_NAME, LEGACY_RESERVED_ATTRIBUTE_NAME)
+        ):
+            continue
+        if self.content_addressed_keys and S3_KEY_ATTRIBUTE_NAME not in message_attributes:
+            continue
+        pointer = loads(message_body)[1]
+        _schedule_payload_deletion(self, payload_deleter, pointer["s3BucketName"], pointer["s3Key"])
+
+
+def _delete_unpublished_batch_payloads(self, entries: list, failed_ids: set = None):
+    """Same as _delete_unpublished_payloads for publish_batch entries, restricted to failed_ids"""
+    self._delete_unpublished_payloads(
+        [
+            (entry["MessageAttributes"], entry["Message"])
+            for entry in entries
+            if failed_ids is None or entry["Id"] in failed_ids
+        ]
+    )
+
+
+def _call_sns(self, func, **kwargs):
+    metrics_hook = self.metrics_hook
+    if metrics_hook is None:
+        return func(self, **kwargs)
+
+    with measure_stage(metrics_hook, SNS_PUBLISH_STAGE):
+        return func(self, **kwargs)
+
+
 def _publish_decorator(func):
     def _publish(self, **kwargs):
         if (
@@ -197,16 +1120,218 @@ def _publish_decorator(func):
         ):
             raise SNSExtendedClientException("Missing TopicArn: TopicArn is a required feild.")
 
-        kwargs["MessageAttributes"], kwargs["Message"] = self._make_payload(
-            kwargs.get("MessageAttributes", {}),
-            kwargs["Message"],
-            kwargs.get("MessageStructure",None),
-        )
-        return func(self, **kwargs)
+        target_arn = kwargs.get("TopicArn") or kwargs.get("TargetArn") or getattr(self, "arn", None)
+        with _publishing_to(target_arn):
+            kwargs["MessageAttributes"], kwargs["Message"] = self._make_payload(
+                kwargs.get("MessageAttributes", {}),
+                kwargs["Message"],
+                kwargs.get("MessageStructure", None),
+            )
+        try:
+            return self._publish_prepared(**kwargs)
+        except Exception:
+            self._delete_unpublished_payloads([(kwargs["MessageAttributes"], kwargs["Message"])])
+            raise
 
     return _publish
 
 
+def _publish_prepared_decorator(func):
+    def _publish_prepared(self, **kwargs):
+        """Sends a publish request whose message already went through the payload offloading"""
+        return _call_sns(self, func, **kwargs)
+
+    return _publish_prepared
+
+
+def _publish_batch_decorator(func):
+    def _publish_batch(self, **kwargs):
+        if "TopicArn" not in kwargs and not getattr(self, "arn", False):
+            raise SNSExtendedClientException("Missing TopicArn: TopicArn is a required feild.")
+
+        with _publishing_to(kwargs.get("TopicArn") or getattr(self, "arn", None)):
+            kwargs["PublishBatchRequestEntries"] = self._make_batch_payloads(
+                kwargs.get("PublishBatchRequestEntries", [])
+            )
+        return self._publish_prepared_batch(**kwargs)
+
+    return _publish_batch
+
+
+def _publish_prepared_batch_decorator(func):
+    def _publish_prepared_batch(self, **kwargs):
+        """
+        Sends a publish_batch request whose entries already went through the payload
+        offloading, deleting the payloads of the entries which were not published.
+        """
+        try:
+            response = _call_sns(self, func, **kwargs)
+        except Exception:
+            self._delete_unpublished_batch_payloads(kwargs["PublishBatchRequestEntries"])
+            raise
+
+        failed_ids = {failure["Id"] for failure in response.get("Failed", [])}
+        if failed_ids:
+            self._delete_unpublished_batch_payloads(
+                kwargs["PublishBatchRequestEntries"], failed_ids
+            )
+        return response
+
+    return _publish_prepared_batch
+
+
+# Properties available on every extended SNS client, Topic and PlatformEndpoint object
+_EXTENDED_CLIENT_PROPERTIES = {
+    "large_payload_support": property(
+        _get_large_payload_support,
+        _set_large_payload_support,
+        _delete_large_payload_support,
+    ),
+    "message_size_threshold": property(
+        _get_message_size_threshold,
+        _set_message_size_threshold,
+        _delete_messsage_size_threshold,
+    ),
+    "always_through_s3": property(
+        _get_always_through_s3,
+        _set_always_through_s3,
+        _delete_always_through_s3,
+    ),
+    "use_legacy_attribute": property(
+        _get_use_legacy_attribute,
+        _set_use_legacy_attribute,
+        _delete_use_legacy_attribute,
+    ),
+    "payload_compression": property(
+        _get_payload_compression,
+        _set_payload_compression,
+        _delete_payload_compression,
+    ),
+    "inline_compression": property(
+        _get_inline_compression,
+        _set_inline_compression,
+        _delete_inline_compression,
+    ),
+    "content_addressed_keys": property(
+        _get_content_addressed_keys,
+        _set_content_addressed_keys,
+        _delete_content_addressed_keys,
+    ),
+    "check_existing_payload": property(
+        _get_check_existing_payload,
+        _set_check_existing_payload,
+        _delete_check_existing_payload,
+    ),
+    "s3_transfer_config": property(
+        _get_s3_transfer_config,
+        _set_s3_transfer_config,
+        _delete_s3_transfer_config,
+    ),
+    "payload_deleter": property(
+        _get_payload_deleter,
+        _set_payload_deleter,
+        _delete_payload_deleter,
+    ),
+    "payload_process_pool": property(
+        _get_payload_process_pool,
+        _set_payload_process_pool,
+        _delete_payload_process_pool,
+    ),
+    "hedged_upload_percentile": property(
+        _get_hedged_upload_percentile,
+        _set_hedged_upload_percentile,
+        _delete_hedged_upload_percentile,
+    ),
+    "s3_key_layout": property(
+        _get_s3_key_layout,
+        _set_s3_key_layout,
+        _delete_s3_key_layout,
+    ),
+    "payload_buckets": property(
+        _get_payload_buckets,
+        _set_payload_buckets,
+        _delete_payload_buckets,
+    ),
+    "metrics_hook": property(
+        _get_metrics_hook,
+        _set_metrics_hook,
+        _delete_metrics_hook,
+    ),
+}
+
+# Methods preparing the payload of a message without any I/O, shared by the synchronous
+# and asynchronous extended clients
+_PAYLOAD_PREPARATION_METHODS = {
+    "_create_reserved_message_attribute_value": _create_reserved_message_attribute_value,
+    "_get_message_size": _get_message_size,
+    "_is_large_message": _is_large_message,
+    "_prepare_payload": _prepare_payload,
+    "_build_payload": _build_payload,
+    "_get_s3_key": _get_s3_key,
+    "_prepare_encoded_body": _prepare_encoded_body,
+    "_get_s3_bucket_name": _get_s3_bucket_name,
+    "_check_size_of_message_attributes": _check_size_of_message_attributes,
+    "_check_message_attributes": _check_message_attributes,
+    "_check_reserved_message_attributes": _check_reserved_message_attributes,
+    "_make_inline_compressed_payload": _make_inline_compressed_payload,
+    "_delete_stored_payloads": _delete_stored_payloads,
+    "_delete_unpublished_payloads": _delete_unpublished_payloads,
+    "_delete_unpublished_batch_payloads": _delete_unpublished_batch_payloads,
+}
+
+
+class _LazyS3Client:
+    """Creates the S3 client of a boto3 session on first use, once"""
+
+    def __init__(self, session):
+        self._session = session
+        self._s3_client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        # creating the S3 client loads its service model and resolves credentials, which
+        # is only worth it once a payload is offloaded
+        if self._s3_client is None:
+            with self._lock:
+                if self._s3_client is None:
+                    if self._session is None:
+                        raise SNSExtendedClientException(
+                            "No session to create the S3 client with: set s3_client."
+                        )
+                    self._s3_client = self._session.client("s3")
+        return self._s3_client
+
+
+def _add_extended_client_attributes(class_attributes: dict, lazy_s3_client: _LazyS3Client):
+    class_attributes.update(_EXTENDED_CLIENT_PROPERTIES)
+    class_attributes.update(_PAYLOAD_PREPARATION_METHODS)
+
+    # Adding the S3 client to the object, created lazily
+    class_attributes["_lazy_s3_client"] = lazy_s3_client
+    class_attributes["s3_client"] = property(_get_s3_client, _set_s3_client, _delete_s3_client)
+    class_attributes["warm_up"] = warm_up
+
+    class_attributes["_payload_exists"] = _payload_exists
+    class_attributes["_store_payload"] = _store_payload
+    class_attributes["_upload_payload"] = _upload_payload
+    class_attributes["_put_payload"] = _put_payload
+    class_attributes["_timed_put_payload"] = _timed_put_payload
+    class_attributes["_get_upload_latencies"] = _get_upload_latencies
+    class_attributes["_put_payload_hedged"] = _put_payload_hedged
+    class_attributes["_abandon_upload"] = _abandon_upload
+    class_attributes["_make_payload"] = _make_payload
+    class_attributes["_make_batch_payloads"] = _make_batch_payloads
+    class_attributes["_store_payloads"] = _store_payloads
+    class_attributes["_publish_prepared"] = _publish_prepared_decorator(class_attributes["publish"])
+    class_attributes["publish"] = _publish_decorator(class_attributes["publish"])
+    if "publish_batch" in class_attributes:
+        class_attributes["_publish_prepared_batch"] = _publish_prepared_batch_decorator(
+            class_attributes["publish_batch"]
+        )
+        class_attributes["publish_batch"] = _publish_batch_decorator(
+            class_attributes["publish_batch"]
+        )
+
 
 class SNSExtendedClientSession(boto3.session.Session):
 
@@ -247,6 +1372,8 @@ class SNSExtendedClientSession(boto3.session.Session):
         else:
             self._session = botocore_session
 
+        self._lazy_s3_client = _LazyS3Client(self)
+
         self.add_custom_user_agent()
 
         
@@ -281,40 +1408,51 @@ class SNSExtendedClientSession(boto3.session.Session):
         else:
             self._session.user_agent_extra = user_agent_header
 
-    def add_custom_attributes(self,class_attributes,**kwargs):
+    def add_custom_attributes(self, class_attributes, **kwargs):
+        _add_extended_client_attributes(class_attributes, self._lazy_s3_client)
 
-        
-        class_attributes["large_payload_support"] = property(
-        _get_large_payload_support,
-        _set_large_payload_support,
-        _delete_large_payload_support,
-    )
-        class_attributes["message_size_threshold"] = property(
-            _get_message_size_threshold,
-            _set_message_size_threshold,
-            _delete_messsage_size_threshold,
-        )
-        class_attributes["always_through_s3"] = property(
-            _get_always_through_s3,
-            _set_always_through_s3,
-            _delete_always_through_s3,
-        )
-        class_attributes["use_legacy_attribute"] = property(
-            _get_use_legacy_attribute,
-            _set_use_legacy_attribute,
-            _delete_use_legacy_attribute,
-        )
-        class_attributes["s3_client"] = super().client("s3")
 
-        class_attributes[
-            "_create_reserved_message_attribute_value"
-        ] = _create_reserved_message_attribute_value
-        class_attributes["_is_large_message"] = _is_large_message
-        class_attributes["_make_payload"] = _make_payload
-        class_attributes["_get_s3_key"] = _get_s3_key
+def create_extended_sns_client(session=None, sns_client=None, **options):
+    """
+    Returns an SNS client publishing large payloads through S3, without patching boto3.
+
+    Only the returned client is extended: other clients and sessions, including the
+    boto3 default session, are left untouched.
+
+    :type session: boto3.session.Session
+    :param session: Session used to create the SNS client, when sns_client is not given,
+                    and the S3 client. Defaults to a new ``boto3.session.Session()`` when
+                    sns_client is not given
+    :type sns_client: boto3 SNS client
+    :param sns_client: SNS client to extend, in place. The S3 client of an existing client
+                       cannot be derived from it: session or the s3_client option is required
+    :param options: Initial values of the extended client attributes, such as
+                    ``large_payload_support`` or ``s3_client``, set with
+                    ``large_payload_support`` first whatever their order
 
-        # Adding the S3 client to the object
-        
-        class_attributes["_check_size_of_message_attributes"] = _check_size_of_message_attributes
-        class_attributes["_check_message_attributes"] = _check_message_attributes
-        class_attributes["publish"] = _publish_decorator(class_attributes["publish"])
\ No newline at end of file
+    """
+    unknown_options = set(options) - set(_EXTENDED_CLIENT_PROPERTIES) - {"s3_client"}
+    if unknown_options:
+        raise TypeError(f"Unknown extended client options: {sorted(unknown_options)}")
+
+    if sns_client is None:
+        if session is None:
+            session = boto3.session.Session()
+        sns_client = session.client("sns")
+    elif session is None and options.get("s3_client") is None:
+        # the endpoint_url and Config of a client, such as those of a LocalStack or VPC
+        # endpoint client, are not carried over to a client of another service
+        raise TypeError("Extending an existing sns_client requires a session or an s3_client.")
+
+    client_class = type(sns_client)
+    if not hasattr(client_class, "_make_payload"):
+        class_attributes = {"publish": client_class.publish}
+        if hasattr(client_class, "publish_batch"):
+            class_attributes["publish_batch"] = client_class.publish_batch
+        _add_extended_client_attributes(class_attributes, _LazyS3Client(session))
+        sns_client.__class__ = type(client_class.__name__, (client_class,), class_attributes)
+
+    # options such as always_through_s3 require large_payload_support to be set already
+    for name in sorted(options, key=lambda name: name != "large_payload_support"):
+        setattr(sns_client, name, options[name])
+    return sns_client
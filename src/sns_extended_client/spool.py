@@ -0,0 +1,428 @@
+import logging
+import os
+import shutil
+import threading
+from base64 import b64decode, b64encode
+from collections import deque
+from json import dumps, loads
+from uuid import uuid4
+
+from botocore.exceptions import ClientError, ParamValidationError
+
+from .exceptions import SNSExtendedClientException, SpoolFull
+from .metrics import SPOOL_DRAIN_STAGE, SPOOL_WRITE_STAGE, measure_stage
+from .session import _is_file_like, _publishing_to
+
+logger = logging.getLogger("sns_extended_client.spool")
+
+DEFAULT_MAX_SPOOL_BYTES = 1024 * 1024 * 1024
+DEFAULT_RETRY_INTERVAL = 1.0
+DEFAULT_MAX_RETRY_INTERVAL = 60.0
+DEAD_LETTER_DIRECTORY = "dead-letter"  # subdirectory of the spool holding the given up messages
+
+# error codes of the S3 and SNS requests which may succeed when retried, the other client
+# errors, such as InvalidParameter, AuthorizationError or NotFound, fail again on retry
+RETRYABLE_ERROR_CODES = frozenset(
+    {
+        "ExpiredToken",
+        "ExpiredTokenException",
+        "InternalError",
+        "InternalErrorException",
+        "KMSThrottlingException",
+        "RequestExpired",
+        "RequestLimitExceeded",
+        "RequestTimeout",
+        "RequestTimeoutException",
+        "ServiceUnavailable",
+        "SlowDown",
+        "Throttled",
+        "ThrottledException",
+        "Throttling",
+        "ThrottlingException",
+        "TooManyRequestsException",
+    }
+)
+
+# a spooled message is a <sequence>.json file holding its publish arguments and offloaded
+# payload location, next to a <sequence>.payload file holding the payload when offloaded
+HEADER_SUFFIX = ".json"
+PAYLOAD_SUFFIX = ".payload"
+TEMPORARY_SUFFIX = ".tmp"
+SEQUENCE_DIGITS = 20
+BYTES_KEY = "__bytes__"  # marks the base64 encoded bytes values of the publish arguments
+
+
+def _encode_bytes(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {BYTES_KEY: b64encode(value).decode()}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode_bytes(value: dict):
+    if len(value) == 1 and BYTES_KEY in value:
+        return b64decode(value[BYTES_KEY])
+    return value
+
+
+def _write_durably(path: str, write):
+    """Writes a file with write(file) and flushes it to the disk"""
+    with open(path, "wb") as file:
+        write(file)
+        file.flush()
+        os.fsync(file.fileno())
+    return os.path.getsize(path)
+
+
+def _sync_directory(directory: str):
+    """Persists the renames of a directory, where the platform supports it"""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    descriptor = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Returns whether a failed attempt at draining a spooled message may succeed when retried"""
+    if isinstance(error, ClientError):
+        status_code = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        code = error.response.get("Error", {}).get("Code")
+        return code in RETRYABLE_ERROR_CODES or status_code >= 500
+    # spooled files which are missing or cannot be parsed, and publish arguments SNS does
+    # not accept, stay so
+    return not isinstance(error, (FileNotFoundError, ValueError, KeyError, ParamValidationError))
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class SpoolingPublisher:
+    """
+    Publishes messages through a write-ahead spool on the local disk.
+
+    ``publish`` prepares the message payload on the calling thread, as the extended
+    client's publish would, writes the message and its offloaded payload to the spool
+    directory and returns once they are flushed to the disk, without waiting for S3 or
+    SNS. A background thread then uploads the payloads and publishes the messages one at a
+    time, in the order they were spooled. A message which cannot be uploaded or published
+    is retried, after retry_interval seconds doubling up to max_retry_interval, and holds
+    back the following ones until S3 and SNS recover.
+
+    A message failing with an error which cannot go away on retry, such as a request
+    rejected as invalid or unauthorized or a spooled file which cannot be read, or which
+    failed max_attempts times when given, is moved to the ``dead-letter`` subdirectory of
+    the spool, under its spool id, and reported to the client's metrics_hook with
+    ``record_spool_dead_letter``. The following messages are then published.
+
+    Messages still spooled when the publisher is closed, or when the process stops, stay
+    in the directory and are published by the next publisher opened on it. A message
+    published right before a crash may be published again. The spool holds at most
+    max_bytes bytes, beyond which ``publish`` raises SpoolFull.
+
+    Writing a message and each attempt at draining one are reported to the client's
+    metrics_hook as the ``spool_write`` and ``spool_drain`` stages.
+
+    :type sns_client: boto3 SNS client
+    :param sns_client: Extended SNS client, Topic or PlatformEndpoint used to publish
+    :type directory: str
+    :param directory: Directory of the spool, created when missing
+    :type max_bytes: int
+    :param max_bytes: Maximum size of the spooled messages and payloads
+    :type retry_interval: float
+    :param retry_interval: Seconds before the first retry of a message which failed
+    :type max_retry_interval: float
+    :param max_retry_interval: Maximum number of seconds between two retries
+    :type max_attempts: int
+    :param max_attempts: Number of attempts at publishing a message before it is moved to
+                         the dead-letter directory. Defaults to None, which retries the
+                         errors which may go away on retry until they do
+
+    """
+
+    def __init__(
+        self,
+        sns_client,
+        directory: str,
+        max_bytes: int = DEFAULT_MAX_SPOOL_BYTES,
+        retry_interval: float = DEFAULT_RETRY_INTERVAL,
+        max_retry_interval: float = DEFAULT_MAX_RETRY_INTERVAL,
+        max_attempts: int = None,
+    ):
+        if not hasattr(sns_client, "_publish_prepared"):
+            raise TypeError("SpoolingPublisher requires an extended SNS client.")
+        if not isinstance(max_bytes, int) or max_bytes <= 0:
+            raise ValueError(f"max_bytes must be a positive int: {max_bytes}")
+        if retry_interval <= 0 or max_retry_interval < retry_interval:
+            raise ValueError(
+                "retry_interval must be positive and at most max_retry_interval: "
+                f"{retry_interval}, {max_retry_interval}"
+            )
+        if max_attempts is not None and (not isinstance(max_attempts, int) or max_attempts <= 0):
+            raise ValueError(f"max_attempts must be a positive int: {max_attempts}")
+
+        self.sns_client = sns_client
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.max_attempts = max_attempts
+        self.dead_letter_directory = os.path.join(directory, DEAD_LETTER_DIRECTORY)
+        # (sequence, size) of the spooled messages, oldest first
+        self._pending = deque()
+        self._pending_bytes = 0
+        self._next_sequence = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+        os.makedirs(directory, exist_ok=True)
+        self._replay()
+        self._drainer = threading.Thread(target=self._drain, name="SpoolingPublisher", daemon=True)
+        self._drainer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def pending(self) -> int:
+        """Number of spooled messages not published yet"""
+        return len(self._pending)
+
+    @property
+    def pending_bytes(self) -> int:
+        """Size on disk of the spooled messages not published yet"""
+        return self._pending_bytes
+
+    def publish(self, **kwargs) -> str:
+        """
+        Spools a message, given with the keyword arguments of the client's publish, and
+        returns its spool id. Payload preparation errors, such as invalid message
+        attributes, are raised here, as is SpoolFull when the spool has no room left.
+        """
+        if self._closed:
+            raise SNSExtendedClientException("Cannot publish through a closed publisher.")
+        sns_client = self.sns_client
+        target_arn = (
+            kwargs.get("TopicArn") or kwargs.get("TargetArn") or getattr(sns_client, "arn", None)
+        )
+        if not target_arn:
+            raise SNSExtendedClientException("Missing TopicArn: TopicArn is a required feild.")
+
+        with _publishing_to(target_arn):
+            (
+                kwargs["MessageAttributes"],
+                kwargs["Message"],
+                offloaded_payload,
+            ) = sns_client._prepare_payload(
+                kwargs.get("MessageAttributes", {}),
+                kwargs["Message"],
+                kwargs.get("MessageStructure", None),
+            )
+
+        metrics_hook = sns_client.metrics_hook
+        if metrics_hook is None:
+            return self._write(kwargs, offloaded_payload)
+        with measure_stage(metrics_hook, SPOOL_WRITE_STAGE):
+            return self._write(kwargs, offloaded_payload)
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits until every message spooled so far is published, for at most timeout seconds
+        when given, and returns whether the spool is empty.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending, timeout)
+
+    def close(self):
+        """
+        Stops the background thread once its current attempt is over. Messages not
+        published yet stay spooled. Further publish calls fail.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._drainer.join()
+
+    def _path(self, sequence: int, suffix: str) -> str:
+        return os.path.join(self.directory, f"{sequence:0{SEQUENCE_DIGITS}d}{suffix}")
+
+    def _replay(self):
+        """Queues the messages left in the directory and removes the incomplete ones"""
+        sequences = set()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(TEMPORARY_SUFFIX):
+                _remove(path)
+                continue
+            stem, suffix = os.path.splitext(name)
+            if not stem.isdigit():
+                continue
+            sequence = int(stem)
+            self._next_sequence = max(self._next_sequence, sequence + 1)
+            if suffix == HEADER_SUFFIX:
+                sequences.add(sequence)
+            elif suffix == PAYLOAD_SUFFIX and not os.path.exists(
+                self._path(sequence, HEADER_SUFFIX)
+            ):
+                # payloads are renamed before their header and removed after it
+                _remove(path)
+
+        for sequence in sorted(sequences):
+            size = os.path.getsize(self._path(sequence, HEADER_SUFFIX))
+            if os.path.exists(self._path(sequence, PAYLOAD_SUFFIX)):
+                size += os.path.getsize(self._path(sequence, PAYLOAD_SUFFIX))
+            self._pending.append((sequence, size))
+            self._pending_bytes += size
+        # dead-lettered messages keep their spool id, which is not given out again
+        if os.path.isdir(self.dead_letter_directory):
+            for name in os.listdir(self.dead_letter_directory):
+                stem = os.path.splitext(name)[0]
+                if stem.isdigit():
+                    self._next_sequence = max(self._next_sequence, int(stem) + 1)
+
+        if self._pending:
+            logger.info("Replaying %d spooled messages from %s", len(self._pending), self.directory)
+
+    def _write(self, publish_kwargs: dict, offloaded_payload) -> str:
+        header = {"publish": publish_kwargs, "payload": None}
+        # files are written under temporary names, then renamed in spool order
+        temporary_name = os.path.join(self.directory, f"{uuid4()}")
+        # (temporary path, suffix of the spooled file) of the files written so far
+        temporary_files = []
+        try:
+            size = 0
+            if offloaded_payload is not None:
+                s3_key, encoded_body, content_addressed, s3_bucket_name = offloaded_payload
+                header["payload"] = {
+                    "s3_key": s3_key,
+                    "content_addressed": content_addressed,
+                    "s3_bucket_name": s3_bucket_name,
+                }
+                temporary_files.append((temporary_name + TEMPORARY_SUFFIX, PAYLOAD_SUFFIX))
+                size += _write_durably(
+                    temporary_files[-1][0],
+                    lambda file: shutil.copyfileobj(encoded_body, file)
+                    if _is_file_like(encoded_body)
+                    else file.write(encoded_body),
+                )
+            encoded_header = dumps(header, default=_encode_bytes).encode()
+            temporary_files.append(
+                (temporary_name + HEADER_SUFFIX + TEMPORARY_SUFFIX, HEADER_SUFFIX)
+            )
+            size += _write_durably(temporary_files[-1][0], lambda file: file.write(encoded_header))
+
+            with self._condition:
+                if self._closed:
+                    raise SNSExtendedClientException("Cannot publish through a closed publisher.")
+                if self._pending_bytes + size > self.max_bytes:
+                    raise SpoolFull()
+                sequence = self._next_sequence
+                for temporary_path, suffix in temporary_files:
+                    os.replace(temporary_path, self._path(sequence, suffix))
+                temporary_files = []
+                _sync_directory(self.directory)
+                self._next_sequence += 1
+                self._pending.append((sequence, size))
+                self._pending_bytes += size
+                self._condition.notify_all()
+        finally:
+            for temporary_path, _ in temporary_files:
+                _remove(temporary_path)
+
+        return f"{sequence:0{SEQUENCE_DIGITS}d}"
+
+    def _drain(self):
+        retry_interval = self.retry_interval
+        attempts = 0
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._closed or self._pending)
+                if self._closed:
+                    return
+                sequence, size = self._pending[0]
+
+            try:
+                self._publish_spooled(sequence)
+            except Exception as error:
+                attempts += 1
+                if _is_retryable(error) and (
+                    self.max_attempts is None or attempts < self.max_attempts
+                ):
+                    logger.warning(
+                        "Failed to publish spooled message %d, retrying in %s seconds",
+                        sequence,
+                        retry_interval,
+                        exc_info=True,
+                    )
+                    with self._condition:
+                        self._condition.wait_for(lambda: self._closed, retry_interval)
+                    retry_interval = min(retry_interval * 2, self.max_retry_interval)
+                    continue
+
+                logger.error(
+                    "Failed to publish spooled message %d after %d attempts, moving it to %s",
+                    sequence,
+                    attempts,
+                    self.dead_letter_directory,
+                    exc_info=True,
+                )
+                self._dead_letter(sequence, error)
+            else:
+                # the header goes first so that a crash in between leaves no message behind
+                _remove(self._path(sequence, HEADER_SUFFIX))
+                _remove(self._path(sequence, PAYLOAD_SUFFIX))
+
+            retry_interval = self.retry_interval
+            attempts = 0
+            with self._condition:
+                self._pending.popleft()
+                self._pending_bytes -= size
+                self._condition.notify_all()
+
+    def _dead_letter(self, sequence: int, error: Exception):
+        os.makedirs(self.dead_letter_directory, exist_ok=True)
+        # the payload goes first: a header left behind by a crash in between is dead-lettered
+        # again on restart, its payload being missing
+        for suffix in (PAYLOAD_SUFFIX, HEADER_SUFFIX):
+            path = self._path(sequence, suffix)
+            try:
+                os.replace(path, os.path.join(self.dead_letter_directory, os.path.basename(path)))
+            except FileNotFoundError:
+                pass
+        _sync_directory(self.dead_letter_directory)
+        _sync_directory(self.directory)
+
+        metrics_hook = self.sns_client.metrics_hook
+        if metrics_hook is not None:
+            metrics_hook.record_spool_dead_letter(f"{sequence:0{SEQUENCE_DIGITS}d}", error)
+
+    def _publish_spooled(self, sequence: int):
+        metrics_hook = self.sns_client.metrics_hook
+        if metrics_hook is None:
+            self._upload_and_publish(sequence)
+            return
+        with measure_stage(metrics_hook, SPOOL_DRAIN_STAGE):
+            self._upload_and_publish(sequence)
+
+    def _upload_and_publish(self, sequence: int):
+        with open(self._path(sequence, HEADER_SUFFIX), "rb") as file:
+            header = loads(file.read(), object_hook=_decode_bytes)
+
+        payload = header["payload"]
+        if payload is not None:
+            with open(self._path(sequence, PAYLOAD_SUFFIX), "rb") as file:
+                self.sns_client._store_payload(
+                    payload["s3_key"],
+                    file,
+                    payload["content_addressed"],
+                    payload["s3_bucket_name"],
+                )
+        self.sns_client._publish_prepared(**header["publish"])
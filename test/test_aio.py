@@ -0,0 +1,250 @@
+import asyncio
+import sys
+import threading
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from json import loads
+from unittest.mock import create_autospec
+
+from botocore.exceptions import ClientError
+
+from sns_extended_client.aio import AsyncSNSExtendedClient
+from sns_extended_client.compression import GZIP_COMPRESSION, decompress_payload
+from sns_extended_client.deleter import PayloadDeleter
+from sns_extended_client.exceptions import SNSExtendedClientException
+from sns_extended_client.session import (
+    DEFAULT_MESSAGE_SIZE_THRESHOLD,
+    MESSAGE_POINTER_CLASS,
+    RESERVED_ATTRIBUTE_NAME,
+)
+
+
+class StubAsyncSNSClient:
+    """In-memory stand-in for an asynchronous SNS client"""
+
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, **kwargs):
+        self.published.append(kwargs)
+        return {"MessageId": str(len(self.published))}
+
+    async def publish_batch(self, **kwargs):
+        entries = kwargs["PublishBatchRequestEntries"]
+        self.published.extend(entries)
+        return {"Successful": [{"Id": entry["Id"]} for entry in entries], "Failed": []}
+
+    async def list_topics(self):
+        return {"Topics": []}
+
+
+class StubAsyncS3Client:
+    """In-memory stand-in for an asynchronous S3 client"""
+
+    def __init__(self):
+        self.objects = {}
+        self.head_bucket_calls = []
+        self.head_bucket_error = None
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def put_object(self, Bucket, Key, Body):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        if Body == b"failed":
+            raise ConnectionError("S3 is unavailable")
+        self.objects[(Bucket, Key)] = Body
+        return {}
+
+    async def head_bucket(self, Bucket):
+        self.head_bucket_calls.append(Bucket)
+        if self.head_bucket_error is not None:
+            raise self.head_bucket_error
+        return {}
+
+
+class TestAsyncSNSExtendedClient(unittest.TestCase):
+    """Tests to check and verify function of the asyncio SNS extended client"""
+
+    def setUp(self) -> None:
+        self.test_bucket_name = "test-bucket"
+        self.test_topic_arn = "arn:aws:sns:us-east-1:123456789012:test-topic"
+        self.sns_client = StubAsyncSNSClient()
+        self.s3_client = StubAsyncS3Client()
+        self.client = AsyncSNSExtendedClient(self.sns_client, self.s3_client)
+        self.client.large_payload_support = self.test_bucket_name
+        self.small_message_body = "small message body"
+        self.large_msg_body = "x" * (DEFAULT_MESSAGE_SIZE_THRESHOLD + 1)
+
+    def test_properties_match_extended_client(self):
+        """Test the async client validates its properties like the extended client session"""
+        client = self.client
+
+        self.assertEqual(client.message_size_threshold, DEFAULT_MESSAGE_SIZE_THRESHOLD)
+        self.assertFalse(client.always_through_s3)
+        self.assertFalse(client.use_legacy_attribute)
+        self.assertRaises(ValueError, setattr, client, "message_size_threshold", -1)
+        self.assertRaises(TypeError, setattr, client, "always_through_s3", "yes")
+
+    def test_unsupported_properties(self):
+        """Test the settings relying on threads of the extended client are rejected"""
+        client = self.client
+
+        for name in ("s3_transfer_config", "hedged_upload_percentile"):
+            setattr(client, name, None)
+            self.assertIsNone(getattr(client, name))
+            self.assertRaises(SNSExtendedClientException, setattr, client, name, 95)
+
+    def test_publish_small_message(self):
+        """Test small messages are published inline without touching S3"""
+        asyncio.run(
+            self.client.publish(TopicArn=self.test_topic_arn, Message=self.small_message_body)
+        )
+
+        self.assertEqual(self.sns_client.published[0]["Message"], self.small_message_body)
+        self.assertEqual(self.s3_client.objects, {})
+
+    def test_publish_large_message(self):
+        """Test large messages are stored in S3 and published as a pointer"""
+        asyncio.run(self.client.publish(TopicArn=self.test_topic_arn, Message=self.large_msg_body))
+
+        published = self.sns_client.published[0]
+        pointer = loads(published["Message"])
+        self.assertEqual(pointer[0], MESSAGE_POINTER_CLASS)
+        self.assertEqual(pointer[1]["s3BucketName"], self.test_bucket_name)
+        self.assertIn(RESERVED_ATTRIBUTE_NAME, published["MessageAttributes"])
+        self.assertEqual(
+            self.s3_client.objects[(self.test_bucket_name, pointer[1]["s3Key"])],
+            self.large_msg_body.encode(),
+        )
+
+    def test_publish_batch_uploads_concurrently(self):
+        """Test the S3 uploads of a batch run concurrently on the event loop"""
+        entries = [{"Id": str(i), "Message": self.large_msg_body} for i in range(3)]
+
+        asyncio.run(
+            self.client.publish_batch(
+                TopicArn=self.test_topic_arn, PublishBatchRequestEntries=entries
+            )
+        )
+
+        self.assertEqual(len(self.s3_client.objects), 3)
+        self.assertEqual(self.s3_client.max_in_flight, 3)
+        self.assertEqual([entry["Id"] for entry in self.sns_client.published], ["0", "1", "2"])
+
+    @unittest.skipIf(sys.version_info < (3, 8), "payload_process_pool requires Python 3.8+")
+    def test_publish_with_payload_process_pool(self):
+        """Test payloads prepared in payload_process_pool are waited on outside the event loop"""
+        process_pool = ProcessPoolExecutor(max_workers=1)
+        self.addCleanup(process_pool.shutdown)
+        self.client.payload_process_pool = process_pool
+        self.client.payload_compression = GZIP_COMPRESSION
+        self.client.s3_key_layout = "topic"
+        prepare_payload = self.client._prepare_payload
+        preparing_threads = []
+
+        def recording_prepare_payload(*args):
+            preparing_threads.append(threading.current_thread())
+            return prepare_payload(*args)
+
+        self.client._prepare_payload = recording_prepare_payload
+        large_msg_body = "x" * (2 * 1024 * 1024)
+        asyncio.run(self.client.publish(TopicArn=self.test_topic_arn, Message=large_msg_body))
+
+        self.assertNotIn(threading.main_thread(), preparing_threads)
+        pointer = loads(self.sns_client.published[0]["Message"])[1]
+        self.assertTrue(pointer["s3Key"].startswith("test-topic/"))
+        stored_body = self.s3_client.objects[(self.test_bucket_name, pointer["s3Key"])]
+        self.assertEqual(decompress_payload(GZIP_COMPRESSION, stored_body), large_msg_body.encode())
+
+    def test_publish_batch_failed_upload_deletes_stored_payloads(self):
+        """Test the payloads stored for a batch are scheduled for deletion when an upload fails"""
+        payload_deleter = create_autospec(PayloadDeleter, instance=True)
+        self.client.payload_deleter = payload_deleter
+        self.client.always_through_s3 = True
+        entries = [{"Id": "0", "Message": "ok"}, {"Id": "1", "Message": "failed"}]
+
+        self.assertRaises(
+            ConnectionError,
+            asyncio.run,
+            self.client.publish_batch(
+                TopicArn=self.test_topic_arn, PublishBatchRequestEntries=entries
+            ),
+        )
+
+        self.assertEqual(self.sns_client.published, [])
+        payload_deleter.add.assert_called_once_with(*list(self.s3_client.objects)[0])
+
+    def test_publish_prepares_cpu_bound_payloads_off_the_event_loop(self):
+        """Test payloads which are compressed or hashed are prepared outside the event loop"""
+        prepare_payload = self.client._prepare_payload
+        preparing_threads = []
+
+        def recording_prepare_payload(*args):
+            preparing_threads.append(threading.current_thread())
+            return prepare_payload(*args)
+
+        self.client._prepare_payload = recording_prepare_payload
+        asyncio.run(self.client.publish(TopicArn=self.test_topic_arn, Message=self.large_msg_body))
+        self.assertEqual(preparing_threads, [threading.main_thread()])
+
+        for name, value in (
+            ("payload_compression", GZIP_COMPRESSION),
+            ("inline_compression", GZIP_COMPRESSION),
+            ("content_addressed_keys", True),
+        ):
+            with self.subTest(name=name):
+                setattr(self.client, name, value)
+                asyncio.run(
+                    self.client.publish(TopicArn=self.test_topic_arn, Message=self.large_msg_body)
+                )
+                self.assertNotEqual(preparing_threads[-1], threading.main_thread())
+                delattr(self.client, name)
+
+    def test_publish_topic_key_layout_and_payload_buckets(self):
+        """Test the async client applies s3_key_layout and routes payloads to payload_buckets"""
+        self.client.s3_key_layout = "topic"
+        self.client.payload_buckets = ["test-bucket-a", "test-bucket-b"]
+
+        asyncio.run(self.client.publish(TopicArn=self.test_topic_arn, Message=self.large_msg_body))
+
+        pointer = loads(self.sns_client.published[0]["Message"])[1]
+        self.assertTrue(pointer["s3Key"].startswith("test-topic/"))
+        self.assertIn(pointer["s3BucketName"], self.client.payload_buckets)
+        self.assertEqual(
+            list(self.s3_client.objects), [(pointer["s3BucketName"], pointer["s3Key"])]
+        )
+
+    def test_warm_up(self):
+        """Test warm_up opens the requested number of connections to the bucket"""
+        asyncio.run(self.client.warm_up(connections=2))
+
+        self.assertEqual(self.s3_client.head_bucket_calls, [self.test_bucket_name] * 2)
+
+    def test_warm_up_access_denied(self):
+        """Test warm_up ignores the access denied errors of head_bucket"""
+        self.s3_client.head_bucket_error = ClientError(
+            {"Error": {"Code": "403"}, "ResponseMetadata": {"HTTPStatusCode": 403}}, "HeadBucket"
+        )
+
+        asyncio.run(self.client.warm_up(connections=2))
+
+        self.assertEqual(len(self.s3_client.head_bucket_calls), 2)
+
+    def test_missing_topic_arn(self):
+        """Test publish raises Exception when publishing without a topic ARN to publish"""
+        self.assertRaises(
+            SNSExtendedClientException,
+            asyncio.run,
+            self.client.publish(Message=self.small_message_body),
+        )
+
+    def test_other_operations_are_delegated(self):
+        """Test operations without offloading support are served by the wrapped SNS client"""
+        self.assertEqual(asyncio.run(self.client.list_topics()), {"Topics": []})
+
+
+if __name__ == "__main__":
+    unittest.main()
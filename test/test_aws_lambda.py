@@ -0,0 +1,166 @@
+import os
+import threading
+import unittest
+from base64 import b64decode
+from json import dumps, loads
+
+import boto3
+from moto import mock_s3
+
+from sns_extended_client.aws_lambda import (
+    resolve_event_payloads,
+    resolve_offloaded_payloads,
+)
+from sns_extended_client.exceptions import SNSExtendedClientException
+from sns_extended_client.resolver import PayloadResolver
+from sns_extended_client.session import (
+    DEFAULT_MESSAGE_SIZE_THRESHOLD,
+    LEGACY_RESERVED_ATTRIBUTE_NAME,
+    SNSExtendedClientSession,
+)
+
+
+@mock_s3
+class TestLambdaEventResolution(unittest.TestCase):
+    """Tests to check and verify the resolution of offloaded payloads in Lambda events"""
+
+    def setUp(self) -> None:
+        os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+        self.test_bucket_name = "test-bucket"
+        self.s3_client = boto3.client("s3")
+        self.s3_client.create_bucket(Bucket=self.test_bucket_name)
+        self.sns_extended_client = SNSExtendedClientSession().client("sns")
+        self.sns_extended_client.large_payload_support = self.test_bucket_name
+        self.sns_extended_client.s3_client = self.s3_client
+        self.resolver = PayloadResolver(self.s3_client)
+        self.large_msg_body = "x" * (DEFAULT_MESSAGE_SIZE_THRESHOLD + 1)
+
+    def make_sns_record(self, message_body):
+        message_attributes, message_body = self.sns_extended_client._make_payload(
+            {}, message_body, None
+        )
+        return {
+            "EventSource": "aws:sns",
+            "Sns": {
+                "Type": "Notification",
+                "Message": message_body,
+                "MessageAttributes": {
+                    name: {"Type": value["DataType"], "Value": value["StringValue"]}
+                    for name, value in message_attributes.items()
+                },
+            },
+        }
+
+    def make_sqs_record(self, message_body, raw_delivery=True):
+        if not raw_delivery:
+            return {
+                "eventSource": "aws:sqs",
+                "body": dumps(self.make_sns_record(message_body)["Sns"]),
+            }
+        message_attributes, message_body = self.sns_extended_client._make_payload(
+            {}, message_body, None
+        )
+        return {
+            "eventSource": "aws:sqs",
+            "body": message_body,
+            "messageAttributes": {
+                name: {"dataType": value["DataType"], "stringValue": value["StringValue"]}
+                for name, value in message_attributes.items()
+            },
+        }
+
+    def test_resolve_sns_and_sqs_records(self):
+        """Test offloaded SNS, raw SQS and enveloped SQS records are resolved"""
+        self.sns_extended_client.use_legacy_attribute = True
+        event = {
+            "Records": [
+                self.make_sns_record(self.large_msg_body + "sns"),
+                self.make_sqs_record(self.large_msg_body + "sqs"),
+                self.make_sqs_record(self.large_msg_body + "envelope", raw_delivery=False),
+                self.make_sqs_record("small message body"),
+            ]
+        }
+
+        resolve_event_payloads(event, self.resolver)
+
+        records = event["Records"]
+        self.assertEqual(records[0]["Sns"]["Message"], self.large_msg_body + "sns")
+        self.assertEqual(records[1]["body"], self.large_msg_body + "sqs")
+        self.assertEqual(loads(records[2]["body"])["Message"], self.large_msg_body + "envelope")
+        self.assertEqual(records[3]["body"], "small message body")
+
+    def test_resolve_binary_payloads(self):
+        """Test binary payloads are resolved as bytes, and base64 encoded in SQS envelopes"""
+        binary_msg_body = bytes(range(256)) * 2000
+        event = {
+            "Records": [
+                self.make_sns_record(binary_msg_body),
+                self.make_sqs_record(binary_msg_body),
+                self.make_sqs_record(binary_msg_body, raw_delivery=False),
+            ]
+        }
+
+        resolve_event_payloads(event, self.resolver)
+
+        records = event["Records"]
+        self.assertEqual(records[0]["Sns"]["Message"], binary_msg_body)
+        self.assertEqual(records[1]["body"], binary_msg_body)
+        envelope = loads(records[2]["body"])
+        self.assertEqual(envelope["MessageEncoding"], "base64")
+        self.assertEqual(b64decode(envelope["Message"]), binary_msg_body)
+
+    def test_payloads_fetched_concurrently(self):
+        """Test the payloads of all the records are fetched concurrently"""
+        event = {"Records": [self.make_sns_record(self.large_msg_body + str(i)) for i in range(3)]}
+        # every download blocks until all three downloads are in flight
+        barrier = threading.Barrier(3, timeout=5)
+        get_object = self.s3_client.get_object
+
+        def get_object_in_parallel(**kwargs):
+            barrier.wait()
+            return get_object(**kwargs)
+
+        self.s3_client.get_object = get_object_in_parallel
+
+        resolve_event_payloads(event, self.resolver)
+
+        self.assertEqual(
+            [record["Sns"]["Message"] for record in event["Records"]],
+            [self.large_msg_body + str(i) for i in range(3)],
+        )
+
+    def test_reserved_attribute_without_pointer(self):
+        """Test records carrying a reserved attribute without a valid pointer are rejected"""
+        event = {
+            "Records": [
+                {
+                    "EventSource": "aws:sns",
+                    "Sns": {
+                        "Message": "not a pointer",
+                        "MessageAttributes": {
+                            LEGACY_RESERVED_ATTRIBUTE_NAME: {"Type": "Number", "Value": "10"}
+                        },
+                    },
+                }
+            ]
+        }
+
+        self.assertRaises(SNSExtendedClientException, resolve_event_payloads, event, self.resolver)
+
+    def test_handler_decorator(self):
+        """Test the decorated handler receives the resolved event"""
+        received = []
+
+        @resolve_offloaded_payloads(resolver=self.resolver)
+        def handler(event, context):
+            received.append(event["Records"][0]["Sns"]["Message"])
+            return "done"
+
+        result = handler({"Records": [self.make_sns_record(self.large_msg_body)]}, None)
+
+        self.assertEqual(result, "done")
+        self.assertEqual(received, [self.large_msg_body])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from sns_extended_client.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    """Tests to check and verify the least recently used cache"""
+
+    def test_evicts_least_recently_used(self):
+        """Test the least recently used item is evicted once max_entries is exceeded"""
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_evicts_by_bytes(self):
+        """Test least recently used items are evicted once the total size exceeds max_bytes"""
+        cache = LRUCache(max_bytes=10)
+        cache.put("a", b"x" * 4)
+        cache.put("b", b"x" * 4)
+        cache.put("c", b"x" * 4)
+
+        self.assertNotIn("a", cache)
+        self.assertEqual(cache.current_bytes, 8)
+
+    def test_item_larger_than_max_bytes_not_cached(self):
+        """Test items larger than max_bytes are never cached"""
+        cache = LRUCache(max_bytes=10)
+        cache.put("a", b"x" * 11)
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.current_bytes, 0)
+
+    def test_invalid_limits(self):
+        """Test limits must be positive ints and at least one of them is required"""
+        self.assertRaises(ValueError, LRUCache, 0)
+        self.assertRaises(ValueError, LRUCache, max_bytes=-1)
+        self.assertRaises(ValueError, LRUCache)
+
+
+if __name__ == "__main__":
+    unittest.main()
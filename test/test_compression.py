@@ -0,0 +1,83 @@
+import importlib.util
+import io
+import os
+import unittest
+
+from sns_extended_client.compression import (
+    COMPRESSION_CHUNK_SIZE,
+    GZIP_COMPRESSION,
+    ZSTD_COMPRESSION,
+    check_compression_codec,
+    compress_payload,
+    compress_payload_up_to,
+    decompress_payload,
+)
+
+HAS_ZSTANDARD = importlib.util.find_spec("zstandard") is not None
+
+
+class TestPayloadCompression(unittest.TestCase):
+    """Tests to check and verify the payload compression codecs"""
+
+    def setUp(self) -> None:
+        self.payload = b'{"key": "value"}' * 1024
+
+    def test_gzip_round_trip(self):
+        """Test gzip compressed payloads decompress to the original payload"""
+        compressed = compress_payload(GZIP_COMPRESSION, self.payload)
+
+        self.assertLess(len(compressed), len(self.payload))
+        self.assertEqual(decompress_payload(GZIP_COMPRESSION, compressed), self.payload)
+
+    def test_gzip_is_deterministic(self):
+        """Test equal payloads always compress to equal bytes"""
+        self.assertEqual(
+            compress_payload(GZIP_COMPRESSION, self.payload),
+            compress_payload(GZIP_COMPRESSION, memoryview(self.payload)),
+        )
+
+    def test_compress_file_payload(self):
+        """Test file payloads are compressed from their current position"""
+        compressed = compress_payload(GZIP_COMPRESSION, io.BytesIO(self.payload))
+
+        self.assertEqual(decompress_payload(GZIP_COMPRESSION, compressed), self.payload)
+
+    @unittest.skipUnless(HAS_ZSTANDARD, "zstandard is not installed")
+    def test_zstd_round_trip(self):
+        """Test zstd compressed payloads decompress to the original payload"""
+        compressed = compress_payload(ZSTD_COMPRESSION, self.payload)
+
+        self.assertLess(len(compressed), len(self.payload))
+        self.assertEqual(decompress_payload(ZSTD_COMPRESSION, compressed), self.payload)
+
+    def test_compress_payload_up_to(self):
+        """Test payloads compressing under max_size decompress to the original payload"""
+        compressed = compress_payload_up_to(GZIP_COMPRESSION, self.payload, len(self.payload))
+
+        self.assertEqual(decompress_payload(GZIP_COMPRESSION, compressed), self.payload)
+        self.assertIsNone(compress_payload_up_to(GZIP_COMPRESSION, self.payload, 10))
+
+    def test_compress_payload_up_to_gives_up_early(self):
+        """Test the compression stops reading a payload once its output exceeds max_size"""
+        payload = io.BytesIO(os.urandom(4 * COMPRESSION_CHUNK_SIZE))
+
+        self.assertIsNone(compress_payload_up_to(GZIP_COMPRESSION, payload, 1000))
+        self.assertEqual(payload.tell(), COMPRESSION_CHUNK_SIZE)
+
+    @unittest.skipUnless(HAS_ZSTANDARD, "zstandard is not installed")
+    def test_zstd_compress_payload_up_to(self):
+        """Test zstd payloads compressed in chunks decompress to the original payload"""
+        payload = io.BytesIO(b"prefix" + self.payload)
+        payload.seek(len(b"prefix"))
+        compressed = compress_payload_up_to(ZSTD_COMPRESSION, payload, len(self.payload))
+
+        self.assertEqual(decompress_payload(ZSTD_COMPRESSION, compressed), self.payload)
+
+    def test_unsupported_codec(self):
+        """Test unknown codecs are rejected"""
+        self.assertRaises(ValueError, check_compression_codec, "lz4")
+        self.assertRaises(ValueError, compress_payload, "lz4", self.payload)
+
+
+if __name__ == "__main__":
+    unittest.main()
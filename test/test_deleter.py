@@ -0,0 +1,137 @@
+import os
+import time
+import unittest
+from json import dumps
+from unittest.mock import create_autospec
+
+import boto3
+from moto import mock_s3
+
+from sns_extended_client.deleter import PayloadDeleter
+from sns_extended_client.session import MESSAGE_POINTER_CLASS
+
+
+@mock_s3
+class TestPayloadDeleter(unittest.TestCase):
+    """Tests to check and verify the batched deletion of offloaded payloads"""
+
+    def setUp(self) -> None:
+        os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+        self.test_bucket_name = "test-bucket"
+        self.s3_client = boto3.client("s3")
+        self.s3_client.create_bucket(Bucket=self.test_bucket_name)
+        for i in range(5):
+            self.s3_client.put_object(Bucket=self.test_bucket_name, Key=f"key-{i}", Body=b"x")
+
+    def stored_keys(self):
+        response = self.s3_client.list_objects_v2(Bucket=self.test_bucket_name)
+        return sorted(item["Key"] for item in response.get("Contents", []))
+
+    def test_flush_by_count(self):
+        """Test keys are deleted with a single delete_objects call once max_batch_size is reached"""
+        delete_objects_mock = create_autospec(
+            self.s3_client.delete_objects, side_effect=self.s3_client.delete_objects
+        )
+        self.s3_client.delete_objects = delete_objects_mock
+        deleter = PayloadDeleter(self.s3_client, max_batch_size=3)
+
+        for i in range(4):
+            deleter.add(self.test_bucket_name, f"key-{i}")
+
+        delete_objects_mock.assert_called_once()
+        self.assertEqual(self.stored_keys(), ["key-3", "key-4"])
+        self.assertEqual(deleter.deleted_count, 3)
+
+        deleter.close()
+        self.assertEqual(self.stored_keys(), ["key-4"])
+        self.assertEqual(delete_objects_mock.call_count, 2)
+
+    def test_flush_on_timer(self):
+        """Test pending keys are deleted by the background flush"""
+        with PayloadDeleter(self.s3_client, flush_interval=0.05) as deleter:
+            deleter.add(self.test_bucket_name, "key-0")
+            deadline = time.monotonic() + 5
+            while deleter.deleted_count < 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+            self.assertNotIn("key-0", self.stored_keys())
+
+    def test_add_message(self):
+        """Test the payloads of offloaded messages are collected and other messages are ignored"""
+        pointer_body = dumps(
+            [MESSAGE_POINTER_CLASS, {"s3BucketName": self.test_bucket_name, "s3Key": "key-1"}]
+        )
+
+        with PayloadDeleter(self.s3_client) as deleter:
+            deleter.add_message({"Body": pointer_body})
+            deleter.add_message({"Body": "small message body"})
+            deleter.add_message(
+                dumps(
+                    [
+                        MESSAGE_POINTER_CLASS,
+                        {"s3BucketName": self.test_bucket_name, "s3Key": "key-2"},
+                    ]
+                )
+            )
+
+        self.assertEqual(self.stored_keys(), ["key-0", "key-3", "key-4"])
+
+    def test_failed_requests_are_retried(self):
+        """Test the keys of a failed delete_objects request are kept for the next flush"""
+        other_bucket_name = "other-bucket"
+        self.s3_client.create_bucket(Bucket=other_bucket_name)
+        self.s3_client.put_object(Bucket=other_bucket_name, Key="key-0", Body=b"x")
+        delete_objects = self.s3_client.delete_objects
+        failures = []
+
+        def failing_delete_objects(**kwargs):
+            if kwargs["Bucket"] == self.test_bucket_name and not failures:
+                failures.append(kwargs["Delete"]["Objects"])
+                raise ConnectionError("S3 is unavailable")
+            return delete_objects(**kwargs)
+
+        self.s3_client.delete_objects = failing_delete_objects
+        deleter = PayloadDeleter(self.s3_client, max_batch_size=2)
+        deleter.add(self.test_bucket_name, "key-0")
+        deleter.add(other_bucket_name, "key-0")
+        self.assertRaises(ConnectionError, deleter.add, self.test_bucket_name, "key-1")
+        # the keys of the failed request are deleted with the next batch of their bucket
+        deleter.add(self.test_bucket_name, "key-2")
+        deleter.flush()
+
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(self.stored_keys(), ["key-3", "key-4"])
+        self.assertNotIn("Contents", self.s3_client.list_objects_v2(Bucket=other_bucket_name))
+        self.assertEqual(deleter.deleted_count, 4)
+
+    def test_flush_keeps_going_after_a_failed_bucket(self):
+        """Test a failed bucket does not prevent the other buckets from being flushed"""
+        other_bucket_name = "other-bucket"
+        self.s3_client.create_bucket(Bucket=other_bucket_name)
+        self.s3_client.put_object(Bucket=other_bucket_name, Key="key-0", Body=b"x")
+        delete_objects = self.s3_client.delete_objects
+
+        def failing_delete_objects(**kwargs):
+            if kwargs["Bucket"] == self.test_bucket_name:
+                raise ConnectionError("S3 is unavailable")
+            return delete_objects(**kwargs)
+
+        self.s3_client.delete_objects = failing_delete_objects
+        deleter = PayloadDeleter(self.s3_client)
+        deleter.add(self.test_bucket_name, "key-0")
+        deleter.add(other_bucket_name, "key-0")
+
+        self.assertRaises(ConnectionError, deleter.flush)
+        self.assertNotIn("Contents", self.s3_client.list_objects_v2(Bucket=other_bucket_name))
+
+        self.s3_client.delete_objects = delete_objects
+        deleter.flush()
+        self.assertNotIn("key-0", self.stored_keys())
+
+    def test_invalid_max_batch_size(self):
+        """Test max_batch_size must be between 1 and 1000"""
+        self.assertRaises(ValueError, PayloadDeleter, self.s3_client, max_batch_size=1001)
+
+
+if __name__ == "__main__":
+    unittest.main()
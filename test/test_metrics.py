@@ -0,0 +1,85 @@
+import unittest
+
+from sns_extended_client.metrics import Histogram, InMemoryMetrics, measure_stage
+
+
+class TestHistogram(unittest.TestCase):
+    """Tests to check and verify the histograms of the in-memory metrics"""
+
+    def test_observe(self):
+        """Test count, total, min, max and mean cover every observed value"""
+        histogram = Histogram()
+        for value in (3, 1, 2):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.count, 3)
+        self.assertEqual(histogram.total, 6)
+        self.assertEqual(histogram.min, 1)
+        self.assertEqual(histogram.max, 3)
+        self.assertEqual(histogram.mean, 2)
+
+    def test_percentile_over_recent_values(self):
+        """Test percentiles only consider the max_samples most recent values"""
+        histogram = Histogram(max_samples=100)
+        for value in range(1000, 1100):
+            histogram.observe(value)
+        for value in range(1, 101):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.percentile(50), 50)
+        self.assertEqual(histogram.percentile(99), 99)
+        self.assertEqual(histogram.percentile(100), 100)
+        self.assertEqual(histogram.max, 1099)
+
+    def test_empty_histogram(self):
+        """Test an empty histogram has no mean nor percentile"""
+        histogram = Histogram()
+
+        self.assertIsNone(histogram.mean)
+        self.assertIsNone(histogram.percentile(99))
+        self.assertRaises(ValueError, histogram.percentile, 101)
+
+
+class TestInMemoryMetrics(unittest.TestCase):
+    """Tests to check and verify the in-memory metrics aggregator"""
+
+    def test_record_message(self):
+        """Test messages and payload bytes are counted, split by offloading"""
+        metrics = InMemoryMetrics()
+        metrics.record_message(100, False)
+        metrics.record_message(300000, True, "s3-key")
+
+        self.assertEqual(metrics.counter("messages"), 2)
+        self.assertEqual(metrics.counter("offloaded_messages"), 1)
+        self.assertEqual(metrics.counter("payload_bytes"), 300100)
+        self.assertEqual(metrics.counter("offloaded_payload_bytes"), 300000)
+        self.assertEqual(metrics.histogram("payload_size").max, 300000)
+
+    def test_measure_stage(self):
+        """Test measure_stage records the duration of a stage and counts its errors"""
+        metrics = InMemoryMetrics()
+        with measure_stage(metrics, "stage"):
+            pass
+        with self.assertRaises(RuntimeError):
+            with measure_stage(metrics, "stage"):
+                raise RuntimeError()
+
+        self.assertEqual(metrics.histogram("stage.duration").count, 2)
+        self.assertEqual(metrics.counter("stage.errors"), 1)
+
+    def test_snapshot_and_reset(self):
+        """Test snapshot returns plain dicts and reset clears every metric"""
+        metrics = InMemoryMetrics()
+        metrics.record_stage("stage", 0.5)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["counters"], {})
+        self.assertEqual(snapshot["histograms"]["stage.duration"]["count"], 1)
+        self.assertEqual(snapshot["histograms"]["stage.duration"]["p99"], 0.5)
+
+        metrics.reset()
+        self.assertIsNone(metrics.histogram("stage.duration"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import hashlib
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+from sns_extended_client.compression import (
+    GZIP_COMPRESSION,
+    compress_payload,
+    decompress_payload,
+)
+from sns_extended_client.processing import prepare_body_in_process
+
+
+class TestPrepareBodyInProcess(unittest.TestCase):
+    """Tests to check and verify the preparation of payloads in a process pool"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.process_pool = ProcessPoolExecutor(max_workers=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.process_pool.shutdown()
+
+    def setUp(self) -> None:
+        self.payload = b"payload " * 200000
+
+    def test_compress_and_digest(self):
+        """Test the payload is compressed and its compressed bytes hashed in a worker process"""
+        encoded_body, digest = prepare_body_in_process(
+            self.process_pool, self.payload, GZIP_COMPRESSION, True
+        )
+
+        self.assertEqual(encoded_body, compress_payload(GZIP_COMPRESSION, self.payload))
+        self.assertEqual(decompress_payload(GZIP_COMPRESSION, encoded_body), self.payload)
+        self.assertEqual(digest, hashlib.sha256(encoded_body).hexdigest())
+
+    def test_digest_only(self):
+        """Test an uncompressed payload is returned as it is along with its digest"""
+        encoded_body, digest = prepare_body_in_process(
+            self.process_pool, memoryview(self.payload), None, True
+        )
+
+        self.assertEqual(bytes(encoded_body), self.payload)
+        self.assertEqual(digest, hashlib.sha256(self.payload).hexdigest())
+
+    def test_compress_only(self):
+        """Test no digest is computed unless requested"""
+        encoded_body, digest = prepare_body_in_process(
+            self.process_pool, bytearray(self.payload), GZIP_COMPRESSION, False
+        )
+
+        self.assertEqual(decompress_payload(GZIP_COMPRESSION, encoded_body), self.payload)
+        self.assertIsNone(digest)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,229 @@
+import os
+import queue
+import threading
+import time
+import unittest
+from unittest.mock import create_autospec
+
+import boto3
+from moto import mock_s3, mock_sns
+
+from sns_extended_client.exceptions import SNSExtendedClientException
+from sns_extended_client.publisher import BackgroundPublisher, BatchingPublisher
+from sns_extended_client.session import (
+    DEFAULT_MESSAGE_SIZE_THRESHOLD,
+    RESERVED_ATTRIBUTE_NAME,
+    SNSExtendedClientSession,
+)
+
+
+class StubSNSClient:
+    """In-memory stand-in for an SNS client, optionally blocking until released"""
+
+    def __init__(self, blocked=False):
+        self.published = []
+        self.released = threading.Event()
+        if not blocked:
+            self.released.set()
+        self._lock = threading.Lock()
+
+    def publish(self, **kwargs):
+        self.released.wait()
+        if kwargs["Message"] == "fail":
+            raise ValueError("publish failed")
+        with self._lock:
+            self.published.append(kwargs)
+            return {"MessageId": f"id-{kwargs['Message']}"}
+
+
+class TestBackgroundPublisher(unittest.TestCase):
+    """Tests to check and verify the background publishing of messages"""
+
+    def test_publish_returns_futures(self):
+        """Test each future resolves to the MessageId of its message"""
+        sns_client = StubSNSClient()
+        with BackgroundPublisher(sns_client, max_workers=3) as publisher:
+            futures = [publisher.publish(TopicArn="topic-arn", Message=str(i)) for i in range(20)]
+
+            self.assertEqual(
+                [future.result(5) for future in futures], [f"id-{i}" for i in range(20)]
+            )
+        self.assertEqual(len(sns_client.published), 20)
+
+    def test_publish_failure_sets_exception(self):
+        """Test a failed publish sets the exception of its future only"""
+        with BackgroundPublisher(StubSNSClient()) as publisher:
+            failed = publisher.publish(TopicArn="topic-arn", Message="fail")
+            published = publisher.publish(TopicArn="topic-arn", Message="ok")
+
+            self.assertRaises(ValueError, failed.result, 5)
+            self.assertEqual(published.result(5), "id-ok")
+
+    def test_bounded_queue(self):
+        """Test publish blocks, then times out, while the queue is full"""
+        sns_client = StubSNSClient(blocked=True)
+        publisher = BackgroundPublisher(sns_client, max_queue_size=2, max_workers=1)
+        futures = [publisher.publish(TopicArn="topic-arn", Message=str(i)) for i in range(3)]
+
+        self.assertRaises(
+            queue.Full, publisher.publish, timeout=0.05, TopicArn="topic-arn", Message="x"
+        )
+
+        sns_client.released.set()
+        publisher.flush()
+        self.assertTrue(all(future.done() for future in futures))
+        self.assertEqual(publisher.pending, 0)
+        publisher.close()
+
+    def test_close_publishes_queued_messages(self):
+        """Test close publishes the queued messages and rejects new ones"""
+        sns_client = StubSNSClient()
+        publisher = BackgroundPublisher(sns_client, max_workers=2)
+        futures = [publisher.publish(TopicArn="topic-arn", Message=str(i)) for i in range(10)]
+
+        publisher.close()
+
+        self.assertTrue(all(future.done() for future in futures))
+        self.assertRaises(
+            SNSExtendedClientException, publisher.publish, TopicArn="topic-arn", Message="x"
+        )
+
+    def test_invalid_arguments(self):
+        """Test the queue size and the number of workers must be positive"""
+        self.assertRaises(ValueError, BackgroundPublisher, StubSNSClient(), max_queue_size=0)
+        self.assertRaises(ValueError, BackgroundPublisher, StubSNSClient(), max_workers=0)
+
+
+@mock_s3
+@mock_sns
+class TestBatchingPublisher(unittest.TestCase):
+    """Tests to check and verify the coalescing of publish calls into publish_batch requests"""
+
+    def setUp(self) -> None:
+        os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+        self.test_bucket_name = "test-bucket"
+        self.s3_client = boto3.client("s3")
+        self.s3_client.create_bucket(Bucket=self.test_bucket_name)
+        self.sns_extended_client = SNSExtendedClientSession().client("sns")
+        self.sns_extended_client.large_payload_support = self.test_bucket_name
+        self.sns_extended_client.s3_client = self.s3_client
+        self.test_topic_arn = self.sns_extended_client.create_topic(Name="test-topic")["TopicArn"]
+        self.publish_batch_mock = create_autospec(
+            self.sns_extended_client._publish_prepared_batch,
+            side_effect=self.sns_extended_client._publish_prepared_batch,
+        )
+        self.sns_extended_client._publish_prepared_batch = self.publish_batch_mock
+
+    def test_batches_of_ten_entries(self):
+        """Test publish calls to a topic are sent as batches of at most 10 entries"""
+        with BatchingPublisher(self.sns_extended_client, linger=60) as publisher:
+            futures = [
+                publisher.publish(TopicArn=self.test_topic_arn, Message=str(i)) for i in range(25)
+            ]
+            publisher.flush()
+
+            message_ids = [future.result(0) for future in futures]
+        self.assertEqual(len(set(message_ids)), 25)
+        self.assertEqual(
+            [
+                len(call[1]["PublishBatchRequestEntries"])
+                for call in self.publish_batch_mock.call_args_list
+            ],
+            [10, 10, 5],
+        )
+
+    def test_linger(self):
+        """Test a batch is sent linger seconds after its first message"""
+        with BatchingPublisher(self.sns_extended_client, linger=0.05) as publisher:
+            future = publisher.publish(TopicArn=self.test_topic_arn, Message="message")
+
+            self.assertIsNotNone(future.result(5))
+            self.publish_batch_mock.assert_called_once()
+
+    def test_max_batch_bytes(self):
+        """Test a batch is sent before its entries exceed max_batch_bytes"""
+        with BatchingPublisher(
+            self.sns_extended_client, linger=60, max_batch_bytes=1000
+        ) as publisher:
+            for _ in range(5):
+                publisher.publish(TopicArn=self.test_topic_arn, Message="x" * 400)
+
+        self.assertEqual(self.publish_batch_mock.call_count, 3)
+
+    def test_large_message_is_offloaded(self):
+        """Test the payload of a large message is stored in S3 and its entry holds a pointer"""
+        with BatchingPublisher(self.sns_extended_client, linger=60) as publisher:
+            future = publisher.publish(
+                TopicArn=self.test_topic_arn, Message="x" * (DEFAULT_MESSAGE_SIZE_THRESHOLD + 1)
+            )
+
+        self.assertIsNotNone(future.result(0))
+        entry = self.publish_batch_mock.call_args[1]["PublishBatchRequestEntries"][0]
+        self.assertIn(RESERVED_ATTRIBUTE_NAME, entry["MessageAttributes"])
+        response = self.s3_client.list_objects_v2(Bucket=self.test_bucket_name)
+        self.assertEqual(response["KeyCount"], 1)
+
+    def test_failed_entry(self):
+        """Test only the future of a failed entry gets an exception"""
+        self.publish_batch_mock.side_effect = lambda **kwargs: {
+            "Successful": [{"Id": "0", "MessageId": "message-id"}],
+            "Failed": [{"Id": "1", "Code": "InternalError", "SenderFault": False}],
+        }
+        with BatchingPublisher(self.sns_extended_client, linger=60) as publisher:
+            published = publisher.publish(TopicArn=self.test_topic_arn, Message="0")
+            failed = publisher.publish(TopicArn=self.test_topic_arn, Message="1")
+
+        self.assertEqual(published.result(0), "message-id")
+        self.assertRaises(SNSExtendedClientException, failed.result, 0)
+
+    def test_fifo_batches_are_sent_in_order(self):
+        """Test batches of a FIFO topic are sent one at a time, in order"""
+        fifo_topic_arn = self.sns_extended_client.create_topic(
+            Name="test-topic.fifo", Attributes={"FifoTopic": "true"}
+        )["TopicArn"]
+        publish_prepared_batch = self.publish_batch_mock.side_effect
+        lock = threading.Lock()
+        concurrent_calls = []
+        sent = []
+
+        def publish_batch(**kwargs):
+            with lock:
+                concurrent_calls.append(len(concurrent_calls) - len(sent) + 1)
+            time.sleep(0.01)
+            with lock:
+                sent.append(kwargs["PublishBatchRequestEntries"][0]["Message"])
+            return publish_prepared_batch(**kwargs)
+
+        self.publish_batch_mock.side_effect = publish_batch
+        with BatchingPublisher(self.sns_extended_client, linger=60, max_workers=4) as publisher:
+            for i in range(50):
+                publisher.publish(
+                    TopicArn=fifo_topic_arn,
+                    Message=str(i),
+                    MessageGroupId="group",
+                    MessageDeduplicationId=str(i),
+                )
+
+        self.assertEqual(sent, [str(i) for i in range(0, 50, 10)])
+        self.assertEqual(max(concurrent_calls), 1)
+
+    def test_unsupported_arguments(self):
+        """Test publish arguments which publish_batch entries do not support are rejected"""
+        with BatchingPublisher(self.sns_extended_client) as publisher:
+            self.assertRaises(
+                SNSExtendedClientException,
+                publisher.publish,
+                PhoneNumber="+15555550100",
+                Message="message",
+            )
+            self.assertRaises(
+                SNSExtendedClientException,
+                publisher.publish,
+                TopicArn=self.test_topic_arn,
+                PhoneNumber="+15555550100",
+                Message="message",
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
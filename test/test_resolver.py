@@ -0,0 +1,284 @@
+import mmap
+import os
+import threading
+import time
+import unittest
+from base64 import b64decode
+from json import dumps, loads
+from unittest.mock import create_autospec
+
+import boto3
+from moto import mock_s3
+
+from sns_extended_client.compression import GZIP_COMPRESSION
+from sns_extended_client.resolver import PayloadResolver, parse_message_pointer
+from sns_extended_client.session import (
+    DEFAULT_MESSAGE_SIZE_THRESHOLD,
+    LEGACY_MESSAGE_POINTER_CLASS,
+    SNSExtendedClientSession,
+)
+
+
+@mock_s3
+class TestPayloadResolver(unittest.TestCase):
+    """Tests to check and verify the consumer side payload resolver"""
+
+    def setUp(self) -> None:
+        os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+        self.test_bucket_name = "test-bucket"
+        self.s3_client = boto3.client("s3")
+        self.s3_client.create_bucket(Bucket=self.test_bucket_name)
+        self.sns_extended_client = SNSExtendedClientSession().client("sns")
+        self.sns_extended_client.large_payload_support = self.test_bucket_name
+        self.sns_extended_client.s3_client = self.s3_client
+        self.resolver = PayloadResolver(self.s3_client)
+        self.large_msg_body = "x" * (DEFAULT_MESSAGE_SIZE_THRESHOLD + 1)
+
+    def make_sqs_message(self, message_body, raw_delivery=True):
+        """Builds the SQS message a subscribed queue receives for an extended client publish"""
+        message_attributes, message_body = self.sns_extended_client._make_payload(
+            {}, message_body, None
+        )
+        if raw_delivery:
+            return {
+                "MessageId": "1",
+                "Body": message_body,
+                "MessageAttributes": message_attributes,
+            }
+        envelope = {
+            "Type": "Notification",
+            "Message": message_body,
+            "MessageAttributes": {
+                name: {"Type": value["DataType"], "Value": value["StringValue"]}
+                for name, value in message_attributes.items()
+            },
+        }
+        return {"MessageId": "1", "Body": dumps(envelope)}
+
+    def test_parse_message_pointer(self):
+        """Test both pointer classes are recognized and other bodies are not"""
+        pointer = {"s3BucketName": "bucket", "s3Key": "key"}
+
+        self.assertEqual(
+            parse_message_pointer(dumps([LEGACY_MESSAGE_POINTER_CLASS, pointer])), pointer
+        )
+        self.assertIsNone(parse_message_pointer('["some", "list"]'))
+        self.assertIsNone(parse_message_pointer('["not json'))
+        self.assertIsNone(parse_message_pointer("plain message"))
+
+    def test_resolve_raw_delivery_message(self):
+        """Test the Body of a raw delivery SQS message is replaced by its payload"""
+        message = self.make_sqs_message(self.large_msg_body)
+
+        resolved = self.resolver.resolve_message(message)
+
+        self.assertEqual(resolved["Body"], self.large_msg_body)
+        self.assertNotEqual(message["Body"], self.large_msg_body)
+
+    def test_resolve_sns_envelope_message(self):
+        """Test the Message of an SNS envelope is replaced by its payload"""
+        message = self.make_sqs_message(self.large_msg_body, raw_delivery=False)
+
+        resolved = self.resolver.resolve_message(message)
+
+        envelope = loads(resolved["Body"])
+        self.assertEqual(envelope["Type"], "Notification")
+        self.assertEqual(envelope["Message"], self.large_msg_body)
+
+    def test_resolve_binary_payloads(self):
+        """Test payloads which are not UTF-8 text are resolved as bytes"""
+        binary_msg_body = bytes(range(256)) * 2000
+        messages = [
+            self.make_sqs_message(binary_msg_body),
+            self.make_sqs_message(binary_msg_body, raw_delivery=False),
+            self.make_sqs_message(self.large_msg_body),
+        ]
+
+        resolved = self.resolver.resolve_messages(messages)
+
+        self.assertEqual(resolved[0]["Body"], binary_msg_body)
+        envelope = loads(resolved[1]["Body"])
+        self.assertEqual(envelope["MessageEncoding"], "base64")
+        self.assertEqual(b64decode(envelope["Message"]), binary_msg_body)
+        self.assertEqual(resolved[2]["Body"], self.large_msg_body)
+        self.assertEqual(self.resolver.open_payload(messages[0]["Body"]).read(), binary_msg_body)
+
+    def test_resolve_compressed_payloads(self):
+        """Test payloads compressed in S3 or inline are decompressed"""
+        self.sns_extended_client.payload_compression = GZIP_COMPRESSION
+        s3_message = self.make_sqs_message(self.large_msg_body)
+        self.sns_extended_client.inline_compression = GZIP_COMPRESSION
+        inline_message = self.make_sqs_message(self.large_msg_body)
+
+        self.assertEqual(self.resolver.resolve_message(s3_message)["Body"], self.large_msg_body)
+        self.assertEqual(self.resolver.resolve_message(inline_message)["Body"], self.large_msg_body)
+
+    def test_small_message_unchanged(self):
+        """Test messages without a pointer are returned unchanged"""
+        message = self.make_sqs_message("small message body")
+
+        self.assertEqual(self.resolver.resolve_message(message)["Body"], "small message body")
+
+    def test_payload_cached(self):
+        """Test a payload resolved several times is downloaded once"""
+        message = self.make_sqs_message(self.large_msg_body)
+        get_object_mock = create_autospec(
+            self.s3_client.get_object, side_effect=self.s3_client.get_object
+        )
+        self.s3_client.get_object = get_object_mock
+
+        for _ in range(3):
+            self.assertEqual(self.resolver.resolve_message(message)["Body"], self.large_msg_body)
+
+        self.assertEqual(get_object_mock.call_count, 1)
+
+    def test_payload_cache_disabled(self):
+        """Test payloads are downloaded on every resolution when the cache is disabled"""
+        resolver = PayloadResolver(self.s3_client, cache_max_bytes=0)
+        message = self.make_sqs_message(self.large_msg_body)
+        get_object_mock = create_autospec(
+            self.s3_client.get_object, side_effect=self.s3_client.get_object
+        )
+        self.s3_client.get_object = get_object_mock
+
+        resolver.resolve_message(message)
+        resolver.resolve_message(message)
+
+        self.assertEqual(get_object_mock.call_count, 2)
+
+    def test_resolve_messages_fetches_concurrently(self):
+        """Test the payloads of a batch are fetched concurrently and messages keep their order"""
+        messages = [
+            self.make_sqs_message(self.large_msg_body + str(i), raw_delivery=bool(i % 2))
+            for i in range(3)
+        ]
+        messages.insert(1, self.make_sqs_message("small message body"))
+        # every download blocks until all three downloads are in flight
+        barrier = threading.Barrier(3, timeout=5)
+        get_object = self.s3_client.get_object
+
+        def get_object_in_parallel(**kwargs):
+            barrier.wait()
+            return get_object(**kwargs)
+
+        self.s3_client.get_object = get_object_in_parallel
+
+        resolved = self.resolver.resolve_messages(messages)
+
+        self.assertEqual(loads(resolved[0]["Body"])["Message"], self.large_msg_body + "0")
+        self.assertEqual(resolved[1]["Body"], "small message body")
+        self.assertEqual(resolved[2]["Body"], self.large_msg_body + "1")
+        self.assertEqual(loads(resolved[3]["Body"])["Message"], self.large_msg_body + "2")
+
+    def test_resolve_messages_without_cache_downloads_each_payload_once(self):
+        """Test a payload referenced by several messages of a batch is downloaded once"""
+        resolver = PayloadResolver(self.s3_client, cache_max_bytes=0)
+        message = self.make_sqs_message(self.large_msg_body)
+        get_object_mock = create_autospec(
+            self.s3_client.get_object, side_effect=self.s3_client.get_object
+        )
+        self.s3_client.get_object = get_object_mock
+
+        resolved = resolver.resolve_messages([message, message])
+
+        self.assertEqual([m["Body"] for m in resolved], [self.large_msg_body] * 2)
+        self.assertEqual(get_object_mock.call_count, 1)
+
+    def test_open_payload_streams_offloaded_payload(self):
+        """Test offloaded payloads are streamed, decompressed and never cached"""
+        self.sns_extended_client.payload_compression = GZIP_COMPRESSION
+        message = self.make_sqs_message(self.large_msg_body)
+
+        with self.resolver.open_payload(message["Body"], message["MessageAttributes"]) as stream:
+            self.assertEqual(stream.read(10), b"x" * 10)
+            self.assertEqual(len(stream.read()), len(self.large_msg_body) - 10)
+        self.assertEqual(self.resolver._cache.current_bytes, 0)
+
+    def test_open_payload_spooled_to_memory_map(self):
+        """Test spooled payloads are returned memory-mapped for random access"""
+        message = self.make_sqs_message(self.large_msg_body + "end")
+
+        payload = self.resolver.open_payload(message["Body"], spool=True)
+
+        self.assertIsInstance(payload, mmap.mmap)
+        self.assertEqual(payload[-3:], b"end")
+        self.assertEqual(len(payload), len(self.large_msg_body) + 3)
+        payload.close()
+
+    def test_iter_payload_chunks(self):
+        """Test payloads are yielded in chunks of at most chunk_size bytes"""
+        message = self.make_sqs_message(self.large_msg_body)
+        chunk_size = 64 * 1024
+
+        chunks = list(self.resolver.iter_payload(message["Body"], chunk_size=chunk_size))
+
+        self.assertTrue(all(len(chunk) <= chunk_size for chunk in chunks))
+        self.assertEqual(b"".join(chunks).decode(), self.large_msg_body)
+
+    def test_iter_payload_small_message(self):
+        """Test messages without a pointer are streamed from their body"""
+        chunks = list(self.resolver.iter_payload("small message body"))
+
+        self.assertEqual(chunks, [b"small message body"])
+
+    def test_prefetch_messages_downloads_ahead(self):
+        """Test the payloads of the next messages are downloaded while the current one is processed"""
+        messages = [self.make_sqs_message(self.large_msg_body + str(i)) for i in range(4)]
+        requested_keys = []
+        get_object = self.s3_client.get_object
+
+        def record_get_object(**kwargs):
+            requested_keys.append(kwargs["Key"])
+            return get_object(**kwargs)
+
+        self.s3_client.get_object = record_get_object
+        resolver = PayloadResolver(self.s3_client, cache_max_bytes=0)
+
+        prefetching = resolver.prefetch_messages(messages, depth=2)
+        first = next(prefetching)
+
+        self.assertEqual(first["Body"], self.large_msg_body + "0")
+        # the first message and the two following ones are requested
+        deadline = time.monotonic() + 5
+        while len(requested_keys) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(requested_keys), 3)
+        self.assertEqual(
+            [message["Body"] for message in prefetching],
+            [self.large_msg_body + str(i) for i in range(1, 4)],
+        )
+        self.assertEqual(len(requested_keys), 4)
+
+    def test_prefetch_messages_byte_budget(self):
+        """Test no more payloads than the byte budget allows are prefetched"""
+        messages = [self.make_sqs_message(self.large_msg_body + str(i)) for i in range(3)]
+        messages.insert(1, self.make_sqs_message("small message body"))
+        requested_keys = []
+        get_object = self.s3_client.get_object
+
+        def record_get_object(**kwargs):
+            requested_keys.append(kwargs["Key"])
+            return get_object(**kwargs)
+
+        self.s3_client.get_object = record_get_object
+        resolver = PayloadResolver(self.s3_client, cache_max_bytes=0)
+
+        prefetching = resolver.prefetch_messages(
+            messages, depth=3, max_prefetch_bytes=len(self.large_msg_body) + 1
+        )
+        next(prefetching)
+
+        # only the payload being consumed fits in the budget
+        self.assertEqual(len(requested_keys), 1)
+        self.assertEqual(
+            [message["Body"] for message in prefetching],
+            ["small message body"] + [self.large_msg_body + str(i) for i in range(1, 3)],
+        )
+
+    def test_prefetch_messages_invalid_depth(self):
+        """Test depth must be a positive int"""
+        self.assertRaises(ValueError, next, self.resolver.prefetch_messages([], depth=0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,14 +1,45 @@
+import hashlib
 import os
+import tempfile
+import threading
+import time
 import unittest
 import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from json import JSONDecodeError, dumps, loads
-from unittest.mock import create_autospec
+from unittest.mock import create_autospec, patch
 
 import boto3
+import botocore.exceptions
+from boto3.s3.transfer import TransferConfig
 from moto import mock_s3, mock_sns, mock_sqs
 
-from sns_extended_client.exceptions import SNSExtendedClientException
-from sns_extended_client.session import DEFAULT_MESSAGE_SIZE_THRESHOLD, LEGACY_MESSAGE_POINTER_CLASS, LEGACY_RESERVED_ATTRIBUTE_NAME, MAX_ALLOWED_ATTRIBUTES, MESSAGE_POINTER_CLASS, RESERVED_ATTRIBUTE_NAME, SNSExtendedClientSession
+import sns_extended_client
+from sns_extended_client.compression import (
+    GZIP_COMPRESSION,
+    decode_inline_payload,
+    decompress_payload,
+)
+from sns_extended_client.deleter import PayloadDeleter
+from sns_extended_client.exceptions import (
+    MissingPayloadOffloadingResource,
+    SNSExtendedClientException,
+)
+from sns_extended_client.metrics import InMemoryMetrics, MetricsHook
+from sns_extended_client.processing import PROCESS_POOL_MIN_PAYLOAD_SIZE
+from sns_extended_client.session import (
+    DEFAULT_MESSAGE_SIZE_THRESHOLD,
+    INLINE_COMPRESSION_ATTRIBUTE_NAME,
+    LEGACY_MESSAGE_POINTER_CLASS,
+    LEGACY_RESERVED_ATTRIBUTE_NAME,
+    MAX_ALLOWED_ATTRIBUTES,
+    MESSAGE_POINTER_CLASS,
+    RESERVED_ATTRIBUTE_NAME,
+    UPLOADED_PAYLOADS_TTL,
+    SNSExtendedClientSession,
+    create_extended_sns_client,
+)
+
 
 class TestSNSExtendedClient(unittest.TestCase):
     """Tests to check and verify function of the python SNS extended client"""
@@ -108,9 +139,69 @@ class TestSNSExtendedClient(unittest.TestCase):
 
         return super().tearDownClass()
 
+    def test_import_does_not_patch_boto3(self):
+        """Test importing SNSExtendedClient leaves the boto3 session class untouched"""
+        assert boto3.session.Session != SNSExtendedClientSession
+
     def test_default_session_is_extended_client_session(self):
-        """Test to verify if default boto3 session is changed on import of SNSExtendedClient"""
-        assert boto3.session.Session == SNSExtendedClientSession
+        """Test to verify if default boto3 session is changed by patch_boto3"""
+        with patch.object(boto3, "Session", boto3.Session), patch.object(
+            boto3.session, "Session", boto3.session.Session
+        ), patch.object(boto3, "DEFAULT_SESSION", boto3.session.Session()):
+            sns_extended_client.patch_boto3()
+
+            assert boto3.session.Session == SNSExtendedClientSession
+            assert boto3.Session == SNSExtendedClientSession
+            assert isinstance(boto3.DEFAULT_SESSION, SNSExtendedClientSession)
+
+    def test_create_extended_sns_client(self):
+        """Test the factory extends a single client of a plain boto3 session"""
+        session = boto3.session.Session()
+        sns_client = create_extended_sns_client(
+            session, large_payload_support=self.test_bucket_name, always_through_s3=True
+        )
+        plain_sns_client = session.client("sns")
+
+        for attr in self.ATTRIBUTES_ADDED:
+            self.assertTrue(hasattr(sns_client, attr))
+        self.assertFalse(hasattr(plain_sns_client, "large_payload_support"))
+        self.assertEqual(sns_client.large_payload_support, self.test_bucket_name)
+        self.assertTrue(sns_client.always_through_s3)
+
+        put_object_mock = create_autospec(sns_client.s3_client.put_object)
+        sns_client.s3_client.put_object = put_object_mock
+        sns_client._make_payload({}, self.small_message_body, None)
+        put_object_mock.assert_called_once()
+
+    def test_create_extended_sns_client_option_order(self):
+        """Test the factory sets large_payload_support before the options requiring it"""
+        sns_client = create_extended_sns_client(
+            always_through_s3=True, large_payload_support=self.test_bucket_name
+        )
+
+        self.assertEqual(sns_client.large_payload_support, self.test_bucket_name)
+        self.assertTrue(sns_client.always_through_s3)
+
+    def test_create_extended_sns_client_from_client(self):
+        """Test an existing client is extended with the S3 client of a session or the given one"""
+        sns_client = boto3.client("sns")
+        self.assertRaises(TypeError, create_extended_sns_client, sns_client=sns_client)
+        self.assertFalse(hasattr(sns_client, "large_payload_support"))
+
+        session = boto3.session.Session(region_name="eu-west-1")
+        create_extended_sns_client(session, sns_client=sns_client)
+        self.assertEqual(sns_client.s3_client.meta.region_name, "eu-west-1")
+
+        s3_client = boto3.client("s3", endpoint_url="http://localhost:4566")
+        sns_client = boto3.client("sns", endpoint_url="http://localhost:4566")
+        create_extended_sns_client(sns_client=sns_client, s3_client=s3_client)
+        self.assertIs(sns_client.s3_client, s3_client)
+
+    def test_create_extended_sns_client_unknown_option(self):
+        """Test the factory rejects options which are not extended client attributes"""
+        self.assertRaises(
+            TypeError, create_extended_sns_client, large_payload=self.test_bucket_name
+        )
 
     def test_sns_client_attributes_added(self):
         """Check the attributes of SNSExtendedSession Client are available in the client"""
@@ -231,6 +322,31 @@ class TestSNSExtendedClient(unittest.TestCase):
         self.assertEqual(actual_msg_body, expected_msg_body)
         self.assertEqual(actual_msg_attr, expected_msg_attributes)
 
+    def test_make_payload_small_msg_attributes_not_copied(self):
+        """Test attributes of small messages are passed through without being copied"""
+        sns_extended_client = self.sns_extended_client
+
+        actual_msg_attr, _ = sns_extended_client._make_payload(
+            self.small_message_attribute, self.small_message_body, None
+        )
+
+        self.assertIs(actual_msg_attr, self.small_message_attribute)
+
+    def test_make_payload_large_msg_does_not_modify_attributes(self):
+        """Test the reserved attribute is added to a copy of the caller's attributes, keeping binary values intact"""
+        sns_extended_client = self.sns_extended_client
+        message_attributes = {
+            "BINARY_ATTRIBUTE": {"DataType": "Binary", "BinaryValue": b"\x00\xff"},
+        }
+
+        actual_msg_attr, _ = sns_extended_client._make_payload(
+            message_attributes, self.large_msg_body, None
+        )
+
+        self.assertEqual(list(message_attributes), ["BINARY_ATTRIBUTE"])
+        self.assertIn(RESERVED_ATTRIBUTE_NAME, actual_msg_attr)
+        self.assertEqual(actual_msg_attr["BINARY_ATTRIBUTE"]["BinaryValue"], b"\x00\xff")
+
     def test_make_payload_large_msg(self):
         """Test publish method uses the output from the make_payload method call large msg"""
         sns_extended_client = self.sns_extended_client
@@ -365,6 +481,330 @@ class TestSNSExtendedClient(unittest.TestCase):
 
         self.assertEqual(self.large_msg_body, self.get_msg_from_s3(json_body))
 
+    def test_make_payload_multipart_upload(self):
+        """Test payloads above the multipart threshold are uploaded in parts and keep the pointer format"""
+        sns_extended_client = self.sns_extended_client
+        part_size = 5 * 1024 * 1024
+        sns_extended_client.s3_transfer_config = TransferConfig(
+            multipart_threshold=part_size, multipart_chunksize=part_size, max_concurrency=4
+        )
+        very_large_msg_body = "x" * (2 * part_size + 1)
+        put_object_mock = create_autospec(sns_extended_client.s3_client.put_object)
+        sns_extended_client.s3_client.put_object = put_object_mock
+
+        actual_msg_attr, actual_msg_body = sns_extended_client._make_payload(
+            {}, very_large_msg_body, None
+        )
+
+        put_object_mock.assert_not_called()
+        json_body = loads(actual_msg_body)
+        self.assertEqual(json_body[0], MESSAGE_POINTER_CLASS)
+        self.assertTrue(self.is_valid_uuid4(json_body[1].get("s3Key")))
+        self.assertEqual(
+            self.make_expected_message_attribute({}, very_large_msg_body, RESERVED_ATTRIBUTE_NAME),
+            actual_msg_attr,
+        )
+        self.assertEqual(very_large_msg_body, self.get_msg_from_s3(json_body))
+
+    def test_make_payload_below_multipart_threshold_uses_put_object(self):
+        """Test payloads below the multipart threshold are stored with a single put_object call"""
+        sns_extended_client = self.sns_extended_client
+        sns_extended_client.s3_transfer_config = TransferConfig()
+        upload_fileobj_mock = create_autospec(sns_extended_client.s3_client.upload_fileobj)
+        sns_extended_client.s3_client.upload_fileobj = upload_fileobj_mock
+
+        _, actual_msg_body = sns_extended_client._make_payload({}, self.large_msg_body, None)
+
+        upload_fileobj_mock.assert_not_called()
+        self.assertEqual(self.large_msg_body, self.get_msg_from_s3(loads(actual_msg_body)))
+
+    def test_s3_transfer_config_type(self):
+        """Test s3_transfer_config only accepts TransferConfig objects"""
+        sns_extended_client = self.sns_extended_client
+
+        self.assertRaises(
+            TypeError, setattr, sns_extended_client, "s3_transfer_config", {"max_concurrency": 4}
+        )
+
+    def test_make_payload_bytes_like_bodies(self):
+        """Test bytes, bytearray and memoryview bodies are offloaded with their buffer size"""
+        sns_extended_client = self.sns_extended_client
+        large_msg_bytes = self.large_msg_body.encode()
+
+        for message_body in (
+            large_msg_bytes,
+            bytearray(large_msg_bytes),
+            memoryview(large_msg_bytes),
+        ):
+            actual_msg_attr, actual_msg_body = sns_extended_client._make_payload(
+                {}, message_body, None
+            )
+
+            self.assertEqual(
+                self.make_expected_message_attribute(
+                    {}, self.large_msg_body, RESERVED_ATTRIBUTE_NAME
+                ),
+                actual_msg_attr,
+            )
+            self.assertEqual(self.large_msg_body, self.get_msg_from_s3(loads(actual_msg_body)))
+
+    def test_make_payload_file_body(self):
+        """Test seekable file bodies are measured by their file size and streamed to S3"""
+        sns_extended_client = self.sns_extended_client
+
+        with tempfile.TemporaryFile() as message_file:
+            message_file.write(self.large_msg_body.encode())
+            message_file.seek(0)
+
+            self.assertTrue(sns_extended_client._is_large_message({}, message_file))
+            self.assertEqual(message_file.tell(), 0)
+
+            actual_msg_attr, actual_msg_body = sns_extended_client._make_payload(
+                {}, message_file, None
+            )
+
+        self.assertEqual(
+            self.make_expected_message_attribute({}, self.large_msg_body, RESERVED_ATTRIBUTE_NAME),
+            actual_msg_attr,
+        )
+        self.assertEqual(self.large_msg_body, self.get_msg_from_s3(loads(actual_msg_body)))
+
+    def test_make_payload_small_bytes_body_published_as_str(self):
+        """Test small bytes-like and file bodies are published inline as str"""
+        sns_extended_client = self.sns_extended_client
+        small_msg_bytes = self.small_message_body.encode()
+
+        with tempfile.TemporaryFile() as message_file:
+            message_file.write(small_msg_bytes)
+            message_file.seek(0)
+
+            for message_body in (small_msg_bytes, memoryview(small_msg_bytes), message_file):
+                _, actual_msg_body = sns_extended_client._make_payload({}, message_body, None)
+                self.assertEqual(actual_msg_body, self.small_message_body)
+
+    def test_make_payload_unsupported_body_type(self):
+        """Test _make_payload raises TypeError for Message types it cannot publish"""
+        sns_extended_client = self.sns_extended_client
+
+        self.assertRaises(TypeError, sns_extended_client._make_payload, {}, 12345, None)
+
+    def test_make_payload_compressed(self):
+        """Test compressed payloads record their codec in the pointer and keep the uncompressed size attribute"""
+        sns_extended_client = self.sns_extended_client
+        sns_extended_client.payload_compression = GZIP_COMPRESSION
+
+        actual_msg_attr, actual_msg_body = sns_extended_client._make_payload(
+            self.small_message_attribute, self.large_msg_body, None
+        )
+
+        expected_msg_attr = self.make_expected_message_attribute(
+            self.small_message_attribute, self.large_msg_body, RESERVED_ATTRIBUTE_NAME
+        )
+        self.assertEqual(expected_msg_attr, actual_msg_attr)
+
+        json_body = loads(actual_msg_body)
+        self.assertEqual(json_body[0], MESSAGE_POINTER_CLASS)
+        self.assertEqual(json_body[1].get("compression"), GZIP_COMPRESSION)
+
+        stored_body = (
+            self.s3_resource.Object(json_body[1]["s3BucketName"], json_body[1]["s3Key"])
+            .get()["Body"]
+            .read()
+        )
+        self.assertLess(len(stored_body), len(self.large_msg_body))
+        self.assertEqual(
+            decompress_payload(GZIP_COMPRESSION, stored_body).decode(), self.large_msg_body
+        )
+
+    def test_make_payload_uncompressed_pointer_format(self):
+        """Test the pointer of uncompressed payloads has no compression field"""
+        sns_extended_client = self.sns_extended_client
+
+        _, actual_msg_body = sns_extended_client._make_payload({}, self.large_msg_body, None)
+
+        self.assertEqual(set(loads(actual_msg_body)[1]), {"s3BucketName", "s3Key"})
+
+    def test_payload_compression_unsupported_codec(self):
+        """Test payload_compression rejects unknown codecs"""
+        sns_extended_client = self.sns_extended_client
+
+        self.assertRaises(ValueError, setattr, sns_extended_client, "payload_compression", "lz4")
+
+    def test_make_payload_inline_compression(self):
+        """Test large messages which compress under the threshold are published inline without S3"""
+        sns_extended_client = self.sns_extended_client
+        sns_extended_client.inline_compression = GZIP_COMPRESSION
+        put_object_mock = create_autospec(sns_extended_client.s3_client.put_object)
+        sns_extended_client.s3_client.put_object = put_object_mock
+
+        actual_msg_attr, actual_msg_body = sns_extended_client._make_payload(
+            self.small_message_attribute, self.large_msg_body, None
+        )
+
+        put_object_mock.assert_not_called()
+        self.assertEqual(
+            actual_msg_attr[INLINE_COMPRESSION_ATTRIBUTE_NAME],
+            {"DataType": "String", "StringValue": GZIP_COMPRESSION},
+        )
+        self.assertNotIn(RESERVED_ATTRIBUTE_NAME, actual_msg_attr)
+        self.assertLess(len(actual_msg_body), sns_extended_client.message_size_threshold)
+        self.assertEqual(
+            decode_inline_payload(GZIP_COMPRESSION, actual_msg_body).decode(), self.large_msg_body
+        )
+
+    def test_make_payload_inline_compression_falls_back_to_s3(self):
+        """Test messages which still exceed the threshold once compressed are stored in S3"""
+        sns_extended_client = self.sns_extended_client
+        sns_extended_client.inline_compression = GZIP_COMPRESSION
+        incompressible_msg_body = os.urandom(DEFAULT_MESSAGE_SIZE_THRESHOLD + 1)
+
+        actual_msg_attr, actual_msg_body = sns_extended_client._make_payload(
+            {}, incompressible_msg_body, None
+        )
+
+        self.assertNotIn(INLINE_COMPRESSION_ATTRIBUTE_NAME, actual_msg_attr)
+        json_body = loads(actual_msg_body)
+        self.assertEqual(json_body[0], MESSAGE_POINTER_CLASS)
+        stored_body = (
+            self.s3_resource.Object(json_body[1]["s3BucketName"], json_body[1]["s3Key"])
+            .get()["Body"]
+            .read()
+        )
+        self.assertEqual(stored_body, incompressible_msg_body)
+
+    def test_make_payload_inline_compression_file_falls_back_to_s3(self):
+        """Test a file body which still exceeds the threshold once compressed is stored whole"""
+        sns_extended_client = self.sns_extended_client
+        sns_extended_client.inline_compression = GZIP_COMPRESSION
+        incompressible_msg_body = os.urandom(300000)
+
+        with tempfile.TemporaryFile() as message_file:
+            message_file.write(incompressible_msg_body)
+            message_file.seek(0)
+            actual_msg_attr, actual_msg_body = sns_extended_client._make_payload(
+                {}, message_file, None
+            )
+
+        self.assertNotIn(INLINE_COMPRESSION_ATTRIBUTE_NAME, actual_msg_attr)
+        self.assertEqual(actual_msg_attr[RESERVED_ATTRIBUTE_NAME]["StringValue"], "300000")
+        json_body = loads(actual_msg_body)
+        stored_body = (
+            self.s3_resource.Object(json_body[1]["s3BucketName"], json_body[1]["s3Key"])
+            .get()["Body"]
+            .read()
+        )
+        self.assertEqual(stored_body, incompressible_msg_body)
+
+    def test_make_payload_inline_compression_small_msg_untouched(self):
+        """Test messages under the threshold are not compressed"""
+        sns_extended_client = self.sns_extended_client
+        sns_extended_client.inline_compression = GZIP_COMPRESSION
+
+        actual_msg_attr, actual_msg_body = sns_extended_client._make_payload(
+            self.small_message_attribute, self.small_message_body, None
+        )
+
+        self.assertEqual(actual_msg_attr, self.small_message_attribute)
+        self.assertEqual(actual_msg_body, self.small_message_body)
+
+    def test_make_payload_content_addressed_keys(self):
+        """Test content addressed keys are the payload digest and repeated payloads are uploaded once"""
+        sns_extended_client = self.sns_extended_client
+        sns_extended_client.content_addressed_keys = True
+        put_object_mock = create_autospec(
+            sns_extended_client.s3_client.put_object,
+            side_effect=sns_extended_client.s3_client.put_object,
+        )
+        sns_extended_client.s3_client.put_object = put_object_mock
+
+        _, first_msg_body = sns_extended_client._make_payload({}, self.large_msg_body, None)
+        _, second_msg_body = sns_extended_client._make_payload({}, self.large_msg_body, None)
+
+        self.assertEqual(first_msg_body, second_msg_body)
+        json_body = loads(first_msg_body)
+        self.assertEqual(
+            json_body[1]["s3Key"], hashlib.sha256(self.large_msg_body.encode()).hexdigest()
+        )
+        self.assertEqual(put_object_mock.call_count, 1)
+        self.assertEqual(self.large_msg_body, self.get_msg_from_s3(json_body))
+
+    def test_make_payload_content_addressed_keys_ttl(self):
+        """Test a repeated payload is uploaded again once UPLOADED_PAYLOADS_TTL is over"""
+        sns_extended_client = self.sns_extended_client
+        sns_extended_client.content_addressed_keys = True
+        put_object_mock = create_autospec(sns_extended_client.s3_client.put_object)
+        sns_extended_client.s3_client.put_object = put_object_mock
+
+        with patch("sns_extended_client.session.monotonic", return_value=1000.0) as monotonic:
+            sns_extended_client._make_payload({}, self.large_msg_body, None)
+            monotonic.return_value += UPLOADED_PAYLOADS_TTL - 1
+            sns_extended_client._make_payload({}, self.large_msg_body, None)
+            self.assertEqual(put_object_mock.call_count, 1)
+
+            monotonic.return_value += 2
+            sns_extended_client._make_payload({}, self.large_msg_body, None)
+            self.assertEqual(put_object_mock.call_count, 2)
+
+    def test_make_payload_content_addressed_keys_check_existing_payload(self):
+        """Test a payload already stored in S3 is not uploaded again when check_existing_payload is set"""
+        sns_extended_client = self.sns_extended_client
+        sns_extended_client.content_addressed_keys = True
+        sns_extended_client.check_existing_payload = True
+        s3_key = hashlib.sha256(self.large_msg_body.encode()).hexdigest()
+        self.s3_resource.Object(self.test_bucket_name, s3_key).put(Body=self.large_msg_body)
+        put_object_mock = create_autospec(sns_extended_client.s3_client.put_object)
+        sns_extended_client.s3_client.put_object = put_object_mock
+
+        _, actual_msg_body = sns_extended_client._make_payload({}, self.large_msg_body, None)
+
+        put_object_mock.assert_not_called()
+        self.assertEqual(loads(actual_msg_body)[1]["s3Key"], s3_key)
+
+    def test_make_payload_content_addressed_keys_custom_key(self):
+        """Test a custom S3 key still takes precedence over the content addressed key"""
+        sns_extended_client = self.sns_extended_client
+        sns_extended_client.content_addressed_keys = True
+
+        _, actual_msg_body = sns_extended_client._make_payload(
+            self.message_attributes_with_s3_key, self.large_msg_body, None
+        )
+
+        self.assertEqual(loads(actual_msg_body)[1]["s3Key"], self.s3_key)
+
+    def test_make_payload_payload_process_pool(self):
+        """Test large payloads are compressed and hashed in the payload_process_pool"""
+        sns_extended_client = self.sns_extended_client
+        sns_extended_client.content_addressed_keys = True
+        sns_extended_client.payload_compression = GZIP_COMPRESSION
+        large_msg_body = "x" * (PROCESS_POOL_MIN_PAYLOAD_SIZE + 1)
+
+        with ProcessPoolExecutor(max_workers=1) as process_pool:
+            sns_extended_client.payload_process_pool = process_pool
+            submit_mock = create_autospec(process_pool.submit, side_effect=process_pool.submit)
+            process_pool.submit = submit_mock
+
+            _, actual_msg_body = sns_extended_client._make_payload({}, large_msg_body, None)
+            # small payloads are prepared in place
+            sns_extended_client._make_payload({}, self.large_msg_body, None)
+
+        self.assertEqual(submit_mock.call_count, 1)
+        json_body = loads(actual_msg_body)
+        stored_body = (
+            self.s3_resource.Object(json_body[1]["s3BucketName"], json_body[1]["s3Key"])
+            .get()["Body"]
+            .read()
+        )
+        self.assertEqual(json_body[1]["s3Key"], hashlib.sha256(stored_body).hexdigest())
+        self.assertEqual(decompress_payload(GZIP_COMPRESSION, stored_body).decode(), large_msg_body)
+
+    def test_payload_process_pool_type(self):
+        """Test payload_process_pool only accepts ProcessPoolExecutor objects"""
+        sns_extended_client = self.sns_extended_client
+
+        self.assertRaises(
+            TypeError, setattr, sns_extended_client, "payload_process_pool", ThreadPoolExecutor()
+        )
+
     def test_check_message_attributes_too_many_attributes(self):
         """Test _check_message_attributes method raises Exception when invoked with many message attributes"""
         sns_extended_client = self.sns_extended_client
@@ -418,6 +858,66 @@ class TestSNSExtendedClient(unittest.TestCase):
             )
         )  # large attribute --> True
 
+    def test_get_message_size(self):
+        """Test _get_message_size returns the byte sizes of attributes and body, including non ASCII strings"""
+        sns_extended_client = self.sns_extended_client
+        message_attributes = {
+            "ascii": {"DataType": "String", "StringValue": "value"},
+            "非ascii": {"DataType": "String", "StringValue": "välue"},
+            "binary": {"DataType": "Binary", "BinaryValue": b"\x00\x01"},
+        }
+        expected_attributes_size = sum(
+            len(name.encode())
+            + len(value["DataType"].encode())
+            + len(value.get("StringValue", "").encode())
+            + len(value.get("BinaryValue", b""))
+            for name, value in message_attributes.items()
+        )
+
+        self.assertEqual(
+            sns_extended_client._get_message_size(message_attributes, "bödy"),
+            (expected_attributes_size, len("bödy".encode())),
+        )
+
+    def test_make_payload_measures_message_once(self):
+        """Test _make_payload measures the message a single time for the threshold and attribute size checks"""
+        sns_extended_client = self.sns_extended_client
+
+        with patch.object(
+            sns_extended_client,
+            "_get_message_size",
+            wraps=sns_extended_client._get_message_size,
+        ) as get_message_size_mock:
+            sns_extended_client._make_payload(
+                self.small_message_attribute, self.large_msg_body, None
+            )
+
+        get_message_size_mock.assert_called_once()
+
+    def test_make_payload_non_ascii_body_encoded_once(self):
+        """Test non-ASCII str bodies are measured and stored from a single encoded copy"""
+        sns_extended_client = self.sns_extended_client
+        large_msg_body = "é" * DEFAULT_MESSAGE_SIZE_THRESHOLD
+        small_msg_body = "é" * 10
+
+        with patch.object(
+            sns_extended_client,
+            "_build_payload",
+            wraps=sns_extended_client._build_payload,
+        ) as build_payload_mock:
+            actual_msg_attr, actual_msg_body = sns_extended_client._make_payload(
+                {}, large_msg_body, None
+            )
+            _, actual_small_msg_body = sns_extended_client._make_payload({}, small_msg_body, None)
+
+        self.assertIsInstance(build_payload_mock.call_args_list[0][0][1], bytes)
+        self.assertEqual(
+            actual_msg_attr[RESERVED_ATTRIBUTE_NAME]["StringValue"],
+            str(len(large_msg_body.encode())),
+        )
+        self.assertEqual(large_msg_body, self.get_msg_from_s3(loads(actual_msg_body)))
+        self.assertEqual(actual_small_msg_body, small_msg_body)
+
     def test_publish_json_msg_structure(self):
         """Test publish raises exception before publishing json structured message"""
         sns_extended_client = self.sns_extended_client
@@ -442,6 +942,483 @@ class TestSNSExtendedClient(unittest.TestCase):
             MessageAttributes=self.small_message_attribute,
         )
 
+    def test_publish_batch_offloads_large_entries(self):
+        """Test publish_batch stores oversized entries in S3 and publishes small entries inline"""
+        sns_extended_client = self.sns_extended_client
+
+        response = sns_extended_client.publish_batch(
+            TopicArn=self.test_topic_arn,
+            PublishBatchRequestEntries=[
+                {"Id": "small", "Message": self.small_message_body},
+                {"Id": "large", "Message": self.large_msg_body},
+            ],
+        )
+        self.assertEqual(len(response.get("Successful")), 2)
+
+        messages = self.test_sqs_client.receive_message(
+            QueueUrl=self.test_queue_url, MaxNumberOfMessages=10
+        ).get("Messages")
+        self.assertTrue(self.has_msg_body(messages, self.small_message_body))
+        self.assertTrue(self.has_msg_body(messages, self.large_msg_body, extended_payload=True))
+
+    def test_make_batch_payloads_uploads_concurrently(self):
+        """Test the S3 uploads of a batch with several large entries overlap in time"""
+        sns_extended_client = self.sns_extended_client
+        entries = [{"Id": str(i), "Message": self.large_msg_body} for i in range(3)]
+        # every upload blocks until all three uploads are in flight
+        barrier = threading.Barrier(len(entries), timeout=5)
+        stored_keys = []
+
+        def store_payload(s3_key, encoded_body, content_addressed=False, s3_bucket_name=None):
+            barrier.wait()
+            stored_keys.append(s3_key)
+
+        sns_extended_client._store_payload = store_payload
+        prepared_entries = sns_extended_client._make_batch_payloads(entries)
+
+        self.assertEqual(len(stored_keys), len(entries))
+        self.assertEqual([entry["Id"] for entry in prepared_entries], ["0", "1", "2"])
+        for entry in prepared_entries:
+            self.assertEqual(loads(entry["Message"])[0], MESSAGE_POINTER_CLASS)
+            self.assertIn(RESERVED_ATTRIBUTE_NAME, entry["MessageAttributes"])
+
+    def test_publish_batch_missing_topic_arn(self):
+        """Test publish_batch raises Exception when publishing without a topic ARN to publish"""
+        sns_extended_client = self.sns_extended_client
+
+        self.assertRaises(
+            SNSExtendedClientException,
+            sns_extended_client.publish_batch,
+            PublishBatchRequestEntries=[{"Id": "1", "Message": self.small_message_body}],
+        )
+
+    def test_s3_client_is_lazy_and_shared(self):
+        """Test the S3 client is created on first use and shared by the clients of a session"""
+        session = SNSExtendedClientSession()
+        sns_client = session.client("sns")
+        topic = session.resource("sns").Topic(self.test_topic_arn)
+
+        self.assertIsNone(session._lazy_s3_client._s3_client)
+        self.assertIs(sns_client.s3_client, topic.s3_client)
+        self.assertIs(sns_client.s3_client, session._lazy_s3_client.get())
+
+        custom_s3_client = boto3.client("s3")
+        sns_client.s3_client = custom_s3_client
+        self.assertIs(sns_client.s3_client, custom_s3_client)
+        self.assertIs(topic.s3_client, session._lazy_s3_client.get())
+
+        del sns_client.s3_client
+        self.assertIs(sns_client.s3_client, session._lazy_s3_client.get())
+
+    @mock_s3
+    def test_warm_up(self):
+        """Test warm_up opens the requested number of connections to the bucket"""
+        sns_extended_client = self.sns_extended_client
+        sns_extended_client.s3_client.create_bucket(Bucket=self.test_bucket_name)
+        head_bucket_mock = create_autospec(
+            sns_extended_client.s3_client.head_bucket,
+            side_effect=sns_extended_client.s3_client.head_bucket,
+        )
+        sns_extended_client.s3_client.head_bucket = head_bucket_mock
+
+        sns_extended_client.warm_up(connections=3)
+
+        self.assertEqual(head_bucket_mock.call_count, 3)
+        head_bucket_mock.assert_called_with(Bucket=self.test_bucket_name)
+
+    def test_warm_up_access_denied(self):
+        """Test warm_up ignores the access denied errors of head_bucket, but not the others"""
+        sns_extended_client = self.sns_extended_client
+
+        def head_bucket_error(code):
+            return botocore.exceptions.ClientError(
+                {"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": int(code)}},
+                "HeadBucket",
+            )
+
+        sns_extended_client.s3_client.head_bucket = create_autospec(
+            sns_extended_client.s3_client.head_bucket, side_effect=head_bucket_error("403")
+        )
+        sns_extended_client.warm_up(connections=2)
+
+        sns_extended_client.s3_client.head_bucket.side_effect = head_bucket_error("404")
+        self.assertRaises(botocore.exceptions.ClientError, sns_extended_client.warm_up)
+
+    def test_warm_up_without_bucket(self):
+        """Test warm_up requires large_payload_support"""
+        sns_extended_client = self.sns_extended_client
+        del sns_extended_client.large_payload_support
+
+        self.assertRaises(MissingPayloadOffloadingResource, sns_extended_client.warm_up)
+
+    @mock_s3
+    def test_metrics_hook(self):
+        """Test the stages and messages of publish calls are reported to the metrics hook"""
+        sns_extended_client = self.sns_extended_client
+        sns_extended_client.s3_client.create_bucket(Bucket=self.test_bucket_name)
+        s3_keys = []
+
+        class RecordingMetrics(InMemoryMetrics):
+            def record_message(self, payload_size, offloaded, s3_key=None):
+                s3_keys.append(s3_key)
+                super().record_message(payload_size, offloaded, s3_key)
+
+        metrics = RecordingMetrics()
+        sns_extended_client.metrics_hook = metrics
+
+        sns_extended_client.publish(TopicArn=self.test_topic_arn, Message=self.small_message_body)
+        sns_extended_client.publish(TopicArn=self.test_topic_arn, Message=self.large_msg_body)
+
+        self.assertEqual(metrics.counter("messages"), 2)
+        self.assertEqual(metrics.counter("offloaded_messages"), 1)
+        self.assertEqual(
+            metrics.counter("payload_bytes"),
+            len(self.small_message_body) + len(self.large_msg_body),
+        )
+        for stage, count in (
+            ("size_check", 2),
+            ("prepare", 2),
+            ("s3_upload", 1),
+            ("sns_publish", 2),
+        ):
+            self.assertEqual(metrics.histogram(f"{stage}.duration").count, count)
+        self.assertIsNone(s3_keys[0])
+        self.assertIsNotNone(s3_keys[1])
+
+        self.sqs.purge_queue(QueueUrl=self.test_queue_url)
+
+    def test_metrics_hook_records_errors(self):
+        """Test a failed SNS request is counted as an error of its stage"""
+        sns_extended_client = self.sns_extended_client
+        metrics = InMemoryMetrics()
+        sns_extended_client.metrics_hook = metrics
+
+        self.assertRaises(
+            botocore.exceptions.ClientError,
+            sns_extended_client.publish,
+            TopicArn=self.test_topic_arn + "-missing",
+            Message=self.small_message_body,
+        )
+
+        self.assertEqual(metrics.counter("sns_publish.errors"), 1)
+
+    def test_metrics_hook_type(self):
+        """Test metrics_hook only accepts MetricsHook objects"""
+        sns_extended_client = self.sns_extended_client
+        sns_extended_client.metrics_hook = MetricsHook()
+
+        self.assertRaises(TypeError, setattr, sns_extended_client, "metrics_hook", object())
+
+    def initialize_hedged_uploads(self, put_payload):
+        """Enables hedged uploads with a delay of 10ms and replaces the put_object calls"""
+        sns_extended_client = self.sns_extended_client
+        sns_extended_client.hedged_upload_percentile = 95
+        upload_latencies = sns_extended_client._get_upload_latencies(len(b"payload"))
+        for _ in range(20):
+            upload_latencies.observe(0.01)
+        sns_extended_client._put_payload = put_payload
+        return sns_extended_client
+
+    def test_hedged_upload(self):
+        """Test a second put_object is started when the first one is slow, and the first to complete wins"""
+        release = threading.Event()
+        calls = []
+
+        def put_payload(s3_key, encoded_body, s3_bucket_name=None):
+            calls.append(s3_key)
+            if len(calls) == 1:
+                release.wait(5)
+
+        sns_extended_client = self.initialize_hedged_uploads(put_payload)
+        metrics = InMemoryMetrics()
+        sns_extended_client.metrics_hook = metrics
+
+        start = time.monotonic()
+        sns_extended_client._upload_payload("s3-key", b"payload")
+        elapsed = time.monotonic() - start
+        release.set()
+
+        self.assertEqual(calls, ["s3-key", "s3-key"])
+        self.assertLess(elapsed, 4)
+        self.assertEqual(metrics.counter("hedged_uploads"), 1)
+
+    def test_hedged_upload_abandoned_put(self):
+        """Test the abandoned put reads a copy of the payload, and its deletion waits for it"""
+        release = threading.Event()
+        bodies = []
+
+        def put_payload(s3_key, encoded_body, s3_bucket_name=None):
+            bodies.append(encoded_body)
+            if len(bodies) == 1:
+                release.wait(5)
+
+        sns_extended_client = self.initialize_hedged_uploads(put_payload)
+        sns_extended_client.payload_deleter = create_autospec(PayloadDeleter, instance=True)
+        payload = bytearray(b"payload")
+
+        sns_extended_client._upload_payload("s3-key", payload)
+        payload[:] = b"changed"
+        self.assertEqual(bodies, [b"payload", b"payload"])
+
+        sns_extended_client._delete_stored_payloads([("s3-key", payload, False, None)])
+        sns_extended_client.payload_deleter.add.assert_not_called()
+
+        release.set()
+        for _ in range(500):
+            if sns_extended_client.payload_deleter.add.called:
+                break
+            time.sleep(0.01)
+        sns_extended_client.payload_deleter.add.assert_called_once_with(
+            sns_extended_client.large_payload_support, "s3-key"
+        )
+
+    def test_hedged_upload_not_needed(self):
+        """Test fast uploads and uploads without enough observed latencies are not hedged"""
+        calls = []
+        sns_extended_client = self.initialize_hedged_uploads(
+            lambda s3_key, encoded_body, s3_bucket_name=None: calls.append(s3_key)
+        )
+
+        sns_extended_client._upload_payload("s3-key", b"payload")
+        self.assertEqual(calls, ["s3-key"])
+
+        # slow uploads are not hedged before HEDGING_MIN_SAMPLES latencies are observed
+        sns_extended_client = self.sns_extended_client
+        setattr(sns_extended_client, "__upload_latencies", None)
+        sns_extended_client.hedged_upload_percentile = 95
+        sns_extended_client._put_payload = lambda s3_key, encoded_body, s3_bucket_name=None: (
+            calls.append(s3_key),
+            time.sleep(0.1),
+        )
+        sns_extended_client._upload_payload("s3-key", b"payload")
+        self.assertEqual(calls, ["s3-key", "s3-key"])
+
+    def test_hedged_upload_size_classes(self):
+        """Test uploads are only hedged against the latencies of uploads of similar size"""
+        threads = []
+
+        def put_payload(s3_key, encoded_body, s3_bucket_name=None):
+            threads.append(threading.current_thread())
+            time.sleep(0.1)
+
+        sns_extended_client = self.initialize_hedged_uploads(put_payload)
+
+        # no latency of uploads of about 1 MB is observed yet, the upload runs inline
+        sns_extended_client._upload_payload("s3-key", b"x" * 1024 * 1024)
+        self.assertEqual(threads, [threading.current_thread()])
+        self.assertEqual(sns_extended_client._get_upload_latencies(1024 * 1024 + 1).count, 1)
+        self.assertEqual(sns_extended_client._get_upload_latencies(len(b"payload")).count, 20)
+
+    def test_hedged_upload_failures(self):
+        """Test the error of the last failed put_object is raised when both puts fail"""
+        calls = []
+
+        def put_payload(s3_key, encoded_body, s3_bucket_name=None):
+            calls.append(s3_key)
+            time.sleep(0.1)
+            raise ValueError(f"put {len(calls)} failed")
+
+        sns_extended_client = self.initialize_hedged_uploads(put_payload)
+
+        self.assertRaises(ValueError, sns_extended_client._upload_payload, "s3-key", b"payload")
+        self.assertEqual(len(calls), 2)
+
+    def test_hedged_upload_percentile_validation(self):
+        """Test hedged_upload_percentile must be a number between 0 and 100"""
+        sns_extended_client = self.sns_extended_client
+
+        self.assertRaises(TypeError, setattr, sns_extended_client, "hedged_upload_percentile", "95")
+        self.assertRaises(ValueError, setattr, sns_extended_client, "hedged_upload_percentile", 100)
+
+    def test_s3_key_layouts(self):
+        """Test generated S3 keys are prefixed according to s3_key_layout"""
+        sns_extended_client = self.sns_extended_client
+        key_pattern = "[0-9a-f-]{36}"
+
+        self.assertRegex(sns_extended_client._get_s3_key({}), f"^{key_pattern}$")
+
+        sns_extended_client.s3_key_layout = "hashed"
+        s3_key = sns_extended_client._get_s3_key({})
+        prefix, bare_key = s3_key.split("/")
+        self.assertEqual(prefix, hashlib.sha256(bare_key.encode()).hexdigest()[:4])
+
+        sns_extended_client.s3_key_layout = "date"
+        self.assertRegex(
+            sns_extended_client._get_s3_key({}), f"^\\d{{4}}/\\d{{2}}/\\d{{2}}/{key_pattern}$"
+        )
+
+        sns_extended_client.s3_key_layout = lambda s3_key, target_arn: f"custom/{s3_key}"
+        self.assertRegex(sns_extended_client._get_s3_key({}), f"^custom/{key_pattern}$")
+
+        # custom keys are used as they are
+        self.assertEqual(
+            sns_extended_client._get_s3_key(self.message_attributes_with_s3_key), self.s3_key
+        )
+
+        self.assertRaises(ValueError, setattr, sns_extended_client, "s3_key_layout", "random")
+
+    def test_s3_key_layout_topic(self):
+        """Test the topic layout prefixes the keys with the name of the topic published to"""
+        sns_extended_client = self.sns_extended_client
+        sns_extended_client.s3_key_layout = "topic"
+        sns_extended_client.publish(TopicArn=self.test_topic_arn, Message=self.large_msg_body)
+
+        messages = self.test_sqs_client.receive_message(
+            QueueUrl=self.test_queue_url, MaxNumberOfMessages=10
+        ).get("Messages")
+        pointer = loads(loads(messages[0]["Body"])["Message"])[1]
+        self.test_sqs_client.delete_message(
+            QueueUrl=self.test_queue_url, ReceiptHandle=messages[0]["ReceiptHandle"]
+        )
+        self.assertTrue(pointer["s3Key"].startswith(f"{self.test_topic_name}/"))
+        self.assertEqual(self.large_msg_body, self.get_msg_from_s3([None, pointer]))
+
+        # outside of a publish call there is no topic to prefix keys with
+        self.assertNotIn("/", sns_extended_client._get_s3_key({}))
+
+    def test_payload_buckets(self):
+        """Test payloads are spread by weight across payload_buckets, each key to a fixed bucket"""
+        sns_extended_client = self.sns_extended_client
+        bucket_names = ["test-bucket-a", "test-bucket-b"]
+        for bucket_name in bucket_names:
+            self.s3_resource.create_bucket(Bucket=bucket_name)
+        sns_extended_client.payload_buckets = {bucket_names[0]: 1, bucket_names[1]: 3}
+
+        routed = [sns_extended_client._get_s3_bucket_name(str(uuid.uuid4())) for _ in range(400)]
+        self.assertEqual(set(routed), set(bucket_names))
+        self.assertGreater(routed.count(bucket_names[1]), routed.count(bucket_names[0]))
+        self.assertEqual(
+            sns_extended_client._get_s3_bucket_name(self.s3_key),
+            sns_extended_client._get_s3_bucket_name(self.s3_key),
+        )
+
+        _, actual_msg_body = sns_extended_client._make_payload({}, self.large_msg_body, None)
+        pointer = loads(actual_msg_body)[1]
+        self.assertEqual(
+            pointer["s3BucketName"], sns_extended_client._get_s3_bucket_name(pointer["s3Key"])
+        )
+        self.assertEqual(self.large_msg_body, self.get_msg_from_s3([None, pointer]))
+
+        del sns_extended_client.payload_buckets
+        self.assertEqual(
+            sns_extended_client._get_s3_bucket_name(self.s3_key), self.test_bucket_name
+        )
+
+    def test_payload_buckets_validation(self):
+        """Test payload_buckets requires bucket names with positive weights"""
+        sns_extended_client = self.sns_extended_client
+
+        self.assertRaises(ValueError, setattr, sns_extended_client, "payload_buckets", [])
+        self.assertRaises(TypeError, setattr, sns_extended_client, "payload_buckets", [1])
+        self.assertRaises(
+            ValueError, setattr, sns_extended_client, "payload_buckets", {"test-bucket": 0}
+        )
+
+        sns_extended_client.payload_buckets = ["test-bucket-a", "test-bucket-b"]
+        self.assertEqual(
+            sns_extended_client.payload_buckets, {"test-bucket-a": 1, "test-bucket-b": 1}
+        )
+
+    def test_publish_failure_deletes_stored_payload(self):
+        """Test the payload stored for a message which could not be published is deleted"""
+        sns_extended_client = self.sns_extended_client
+        payload_deleter = PayloadDeleter(sns_extended_client.s3_client)
+        sns_extended_client.payload_deleter = payload_deleter
+        stored_keys = []
+        store_payload = sns_extended_client._store_payload
+
+        def record_store_payload(
+            s3_key, encoded_body, content_addressed=False, s3_bucket_name=None
+        ):
+            stored_keys.append(s3_key)
+            store_payload(s3_key, encoded_body, content_addressed, s3_bucket_name)
+
+        sns_extended_client._store_payload = record_store_payload
+
+        self.assertRaises(
+            botocore.exceptions.ClientError,
+            sns_extended_client.publish,
+            TopicArn=self.test_topic_arn + "-missing",
+            Message=self.large_msg_body,
+        )
+        payload_deleter.flush()
+
+        self.assertEqual(len(stored_keys), 1)
+        response = sns_extended_client.s3_client.list_objects_v2(
+            Bucket=self.test_bucket_name, Prefix=stored_keys[0]
+        )
+        self.assertEqual(response["KeyCount"], 0)
+
+    def test_publish_failure_with_failing_deletion(self):
+        """Test a failed payload deletion does not replace the error of the failed publish"""
+        sns_extended_client = self.sns_extended_client
+        payload_deleter = create_autospec(PayloadDeleter, instance=True)
+        payload_deleter.add.side_effect = ConnectionError("S3 is unavailable")
+        sns_extended_client.payload_deleter = payload_deleter
+
+        self.assertRaises(
+            botocore.exceptions.ClientError,
+            sns_extended_client.publish,
+            TopicArn=self.test_topic_arn + "-missing",
+            Message=self.large_msg_body,
+        )
+        payload_deleter.add.assert_called_once()
+
+    def test_publish_batch_failed_entries_delete_stored_payloads(self):
+        """Test the payloads of the failed entries of a batch are scheduled for deletion"""
+        sns_extended_client = self.sns_extended_client
+        payload_deleter = create_autospec(PayloadDeleter, instance=True)
+        sns_extended_client.payload_deleter = payload_deleter
+        sns_extended_client.always_through_s3 = True
+        prepared_entries = sns_extended_client._make_batch_payloads(
+            [{"Id": "ok", "Message": "ok"}, {"Id": "failed", "Message": "failed"}]
+        )
+
+        sns_extended_client._delete_unpublished_batch_payloads(prepared_entries, {"failed"})
+
+        failed_pointer = loads(prepared_entries[1]["Message"])[1]
+        payload_deleter.add.assert_called_once_with(
+            failed_pointer["s3BucketName"], failed_pointer["s3Key"]
+        )
+
+    def test_make_batch_payloads_failed_upload_deletes_stored_payloads(self):
+        """Test the payloads stored for a batch are scheduled for deletion when an upload fails"""
+        sns_extended_client = self.sns_extended_client
+        payload_deleter = create_autospec(PayloadDeleter, instance=True)
+        sns_extended_client.payload_deleter = payload_deleter
+        sns_extended_client.always_through_s3 = True
+        stored_keys = []
+        store_payload = sns_extended_client._store_payload
+
+        def failing_store_payload(
+            s3_key, encoded_body, content_addressed=False, s3_bucket_name=None
+        ):
+            if encoded_body == b"failed":
+                raise ConnectionError("S3 is unavailable")
+            store_payload(s3_key, encoded_body, content_addressed, s3_bucket_name)
+            stored_keys.append(s3_key)
+
+        sns_extended_client._store_payload = failing_store_payload
+
+        self.assertRaises(
+            ConnectionError,
+            sns_extended_client._make_batch_payloads,
+            [{"Id": str(i), "Message": "ok"} for i in range(2)]
+            + [{"Id": "2", "Message": "failed"}],
+        )
+
+        self.assertEqual(len(stored_keys), 2)
+        self.assertEqual(
+            sorted(call[0] for call in payload_deleter.add.call_args_list),
+            sorted((self.test_bucket_name, s3_key) for s3_key in stored_keys),
+        )
+
+    def test_payload_deleter_type(self):
+        """Test payload_deleter only accepts PayloadDeleter objects"""
+        sns_extended_client = self.sns_extended_client
+
+        self.assertRaises(TypeError, setattr, sns_extended_client, "payload_deleter", object())
+
     def has_msg_body(self, messages, expected_msg_body, extended_payload=False):
         """Checks for target message_body in the list of messages from SQS queue"""
         for message in messages:
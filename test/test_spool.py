@@ -0,0 +1,234 @@
+import os
+import shutil
+import tempfile
+import unittest
+from json import loads
+from unittest.mock import create_autospec
+
+import boto3
+from botocore.exceptions import ClientError
+from moto import mock_s3, mock_sns
+
+from sns_extended_client.exceptions import SNSExtendedClientException, SpoolFull
+from sns_extended_client.metrics import InMemoryMetrics
+from sns_extended_client.session import (
+    DEFAULT_MESSAGE_SIZE_THRESHOLD,
+    SNSExtendedClientSession,
+)
+from sns_extended_client.spool import DEAD_LETTER_DIRECTORY, SpoolingPublisher
+
+
+@mock_s3
+@mock_sns
+class TestSpoolingPublisher(unittest.TestCase):
+    """Tests to check and verify the publishing of messages through a local disk spool"""
+
+    def setUp(self) -> None:
+        os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+        self.test_bucket_name = "test-bucket"
+        self.s3_client = boto3.client("s3")
+        self.s3_client.create_bucket(Bucket=self.test_bucket_name)
+        self.sns_extended_client = SNSExtendedClientSession().client("sns")
+        self.sns_extended_client.large_payload_support = self.test_bucket_name
+        self.sns_extended_client.s3_client = self.s3_client
+        self.test_topic_arn = self.sns_extended_client.create_topic(Name="test-topic")["TopicArn"]
+        self.publish_mock = create_autospec(
+            self.sns_extended_client._publish_prepared,
+            side_effect=self.sns_extended_client._publish_prepared,
+        )
+        self.sns_extended_client._publish_prepared = self.publish_mock
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.large_msg_body = "x" * (DEFAULT_MESSAGE_SIZE_THRESHOLD + 1)
+
+    def published_messages(self):
+        return [call[1]["Message"] for call in self.publish_mock.call_args_list]
+
+    def test_publish_through_spool(self):
+        """Test spooled messages are published in order and removed from the spool"""
+        with SpoolingPublisher(self.sns_extended_client, self.directory) as publisher:
+            spool_ids = [
+                publisher.publish(TopicArn=self.test_topic_arn, Message=str(i)) for i in range(5)
+            ]
+            publisher.publish(TopicArn=self.test_topic_arn, Message=self.large_msg_body)
+
+            self.assertTrue(publisher.flush(5))
+            self.assertEqual(publisher.pending, 0)
+            self.assertEqual(publisher.pending_bytes, 0)
+
+        self.assertEqual(spool_ids, sorted(spool_ids))
+        self.assertEqual(self.published_messages()[:5], [str(i) for i in range(5)])
+        pointer = loads(self.published_messages()[5])[1]
+        stored_body = self.s3_client.get_object(
+            Bucket=pointer["s3BucketName"], Key=pointer["s3Key"]
+        )["Body"].read()
+        self.assertEqual(stored_body.decode(), self.large_msg_body)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_failed_uploads_are_retried_in_order(self):
+        """Test a message failing to be uploaded holds back the following ones until S3 recovers"""
+        store_payload = self.sns_extended_client._store_payload
+        failures = []
+
+        def failing_store_payload(*args):
+            if len(failures) < 3:
+                failures.append(args[0])
+                raise ConnectionError("S3 is unavailable")
+            store_payload(*args)
+
+        self.sns_extended_client._store_payload = failing_store_payload
+        metrics = InMemoryMetrics()
+        self.sns_extended_client.metrics_hook = metrics
+        with SpoolingPublisher(
+            self.sns_extended_client, self.directory, retry_interval=0.01
+        ) as publisher:
+            publisher.publish(TopicArn=self.test_topic_arn, Message=self.large_msg_body)
+            publisher.publish(TopicArn=self.test_topic_arn, Message="small")
+
+            self.assertTrue(publisher.flush(5))
+
+        self.assertEqual(len(failures), 3)
+        self.assertEqual(self.published_messages()[1], "small")
+        self.assertEqual(metrics.counter("spool_drain.errors"), 3)
+        self.assertEqual(metrics.histogram("spool_write.duration").count, 2)
+
+    def test_replay_after_restart(self):
+        """Test the messages left in the spool are published by the next publisher"""
+        self.publish_mock.side_effect = ConnectionError("SNS is unavailable")
+        publisher = SpoolingPublisher(self.sns_extended_client, self.directory, retry_interval=60)
+        publisher.publish(
+            TopicArn=self.test_topic_arn,
+            Message=self.large_msg_body,
+            MessageAttributes={"binary": {"DataType": "Binary", "BinaryValue": b"\x00\xff"}},
+        )
+        publisher.publish(TopicArn=self.test_topic_arn, Message="second")
+        publisher.close()
+        self.assertRaises(
+            SNSExtendedClientException,
+            publisher.publish,
+            TopicArn=self.test_topic_arn,
+            Message="closed",
+        )
+        # leftovers of writes interrupted by a crash
+        for name in ("interrupted.json.tmp", f"{99:020d}.payload"):
+            open(os.path.join(self.directory, name), "w").close()
+
+        self.publish_mock.reset_mock()
+        self.publish_mock.side_effect = None
+        with SpoolingPublisher(self.sns_extended_client, self.directory) as publisher:
+            self.assertEqual(publisher.pending, 2)
+            self.assertTrue(publisher.flush(5))
+            spool_id = publisher.publish(TopicArn=self.test_topic_arn, Message="third")
+            self.assertTrue(publisher.flush(5))
+
+        self.assertEqual(spool_id, f"{100:020d}")
+        self.assertEqual(self.published_messages()[1:], ["second", "third"])
+        self.assertEqual(
+            self.publish_mock.call_args_list[0][1]["MessageAttributes"]["binary"]["BinaryValue"],
+            b"\x00\xff",
+        )
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_failing_messages_are_dead_lettered(self):
+        """Test messages failing for good move to the dead-letter directory and unblock the spool"""
+        publish_prepared = self.publish_mock.side_effect
+        invalid_parameter = ClientError(
+            {
+                "Error": {"Code": "InvalidParameter", "Message": "Invalid parameter"},
+                "ResponseMetadata": {"HTTPStatusCode": 400},
+            },
+            "Publish",
+        )
+
+        def failing_publish_prepared(**kwargs):
+            if self.publish_mock.call_count == 1:
+                raise invalid_parameter
+            return publish_prepared(**kwargs)
+
+        self.publish_mock.side_effect = failing_publish_prepared
+        # a header left unparsable by a disk failure
+        with open(os.path.join(self.directory, f"{7:020d}.json"), "w") as file:
+            file.write("{")
+        metrics = InMemoryMetrics()
+        self.sns_extended_client.metrics_hook = metrics
+        dead_letter_directory = os.path.join(self.directory, DEAD_LETTER_DIRECTORY)
+
+        with SpoolingPublisher(self.sns_extended_client, self.directory) as publisher:
+            spool_id = publisher.publish(TopicArn=self.test_topic_arn, Message=self.large_msg_body)
+            publisher.publish(TopicArn=self.test_topic_arn, Message="second")
+            self.assertTrue(publisher.flush(5))
+            self.assertEqual(publisher.pending_bytes, 0)
+
+        self.assertEqual(self.published_messages()[-1], "second")
+        self.assertEqual(metrics.counter("spool_dead_letters"), 2)
+        self.assertEqual(
+            sorted(os.listdir(dead_letter_directory)),
+            [f"{7:020d}.json", spool_id + ".json", spool_id + ".payload"],
+        )
+        self.assertEqual(os.listdir(self.directory), [DEAD_LETTER_DIRECTORY])
+
+        # dead-lettered spool ids are not given out again
+        with SpoolingPublisher(self.sns_extended_client, self.directory) as publisher:
+            self.assertGreater(
+                publisher.publish(TopicArn=self.test_topic_arn, Message="third"), spool_id
+            )
+            self.assertTrue(publisher.flush(5))
+
+    def test_max_attempts(self):
+        """Test a message failing max_attempts times is dead-lettered"""
+        self.publish_mock.side_effect = ConnectionError("SNS is unavailable")
+        metrics = InMemoryMetrics()
+        self.sns_extended_client.metrics_hook = metrics
+
+        with SpoolingPublisher(
+            self.sns_extended_client, self.directory, retry_interval=0.01, max_attempts=3
+        ) as publisher:
+            spool_id = publisher.publish(TopicArn=self.test_topic_arn, Message="small")
+            self.assertTrue(publisher.flush(5))
+
+        self.assertEqual(self.publish_mock.call_count, 3)
+        self.assertEqual(metrics.counter("spool_drain.errors"), 3)
+        self.assertEqual(metrics.counter("spool_dead_letters"), 1)
+        self.assertEqual(
+            os.listdir(os.path.join(self.directory, DEAD_LETTER_DIRECTORY)), [spool_id + ".json"]
+        )
+
+    def test_max_bytes(self):
+        """Test publish raises SpoolFull once the spool reaches max_bytes"""
+        self.publish_mock.side_effect = ConnectionError("SNS is unavailable")
+        with SpoolingPublisher(
+            self.sns_extended_client, self.directory, max_bytes=1000, retry_interval=60
+        ) as publisher:
+            publisher.publish(TopicArn=self.test_topic_arn, Message="x" * 500)
+
+            self.assertRaises(
+                SpoolFull, publisher.publish, TopicArn=self.test_topic_arn, Message="x" * 500
+            )
+            self.assertEqual(publisher.pending, 1)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+    def test_invalid_arguments(self):
+        """Test the spool requires an extended client and valid limits"""
+        self.assertRaises(TypeError, SpoolingPublisher, object(), self.directory)
+        self.assertRaises(
+            ValueError, SpoolingPublisher, self.sns_extended_client, self.directory, max_bytes=0
+        )
+        self.assertRaises(
+            ValueError,
+            SpoolingPublisher,
+            self.sns_extended_client,
+            self.directory,
+            retry_interval=10,
+            max_retry_interval=1,
+        )
+        self.assertRaises(
+            ValueError,
+            SpoolingPublisher,
+            self.sns_extended_client,
+            self.directory,
+            max_attempts=0,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()